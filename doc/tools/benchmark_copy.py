@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""Measure how fast ranger copies a large file.
+
+Compares copying in fixed 16KiB chunks, as ranger used to, with each of
+the copy methods of ranger.ext.shutil_generatorized and their adaptive
+chunk size.  A file of SIZE megabytes (512 by default) is copied inside
+each of the given directories, by default a tmpfs and the home directory:
+
+    doc/tools/benchmark_copy.py [SIZE] [DIRECTORY...]
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+
+def make_file(path, size):
+    block = os.urandom(1024 * 1024)
+    with open(path, 'wb') as fobj:
+        for _ in range(size):
+            fobj.write(block)
+
+
+def copy_fixed_chunks(src, dst):
+    from ranger.ext import shutil_generatorized as shutil_g
+    with open(src, 'rb') as fsrc:
+        with open(dst, 'wb') as fdst:
+            if hasattr(shutil_g, 'copyfileobj_range'):
+                copy = shutil_g.copyfileobj_range
+            else:
+                copy = shutil_g.copyfileobj
+            for _ in copy(fsrc, fdst):
+                pass
+
+
+def copy_with(methods):
+    def copy(src, dst):
+        from ranger.ext import shutil_generatorized as shutil_g
+        with open(src, 'rb') as fsrc:
+            with open(dst, 'wb') as fdst:
+                for _ in shutil_g.copyfd(fsrc.fileno(), fdst.fileno(), methods=methods):
+                    pass
+    return copy
+
+
+def main():
+    from ranger.ext.shutil_generatorized import COPY_METHODS
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 512
+    directories = sys.argv[2:] or [path for path in ('/dev/shm', os.path.expanduser('~'))
+                                   if os.path.isdir(path)]
+    copies = [('16KiB chunks', copy_fixed_chunks)]
+    copies += [(method, copy_with((method,))) for method in COPY_METHODS]
+    copies += [('automatic', copy_with(COPY_METHODS))]
+
+    for directory in directories:
+        tmpdir = tempfile.mkdtemp(prefix='ranger-benchmark-', dir=directory)
+        src = os.path.join(tmpdir, 'src')
+        dst = os.path.join(tmpdir, 'dst')
+        try:
+            make_file(src, size)
+            print("%s, %dMB:" % (directory, size))
+            for name, copy in copies:
+                best = None
+                for _ in range(3):
+                    time1 = time.time()
+                    copy(src, dst)
+                    seconds = time.time() - time1
+                    os.remove(dst)
+                    best = seconds if best is None else min(best, seconds)
+                print("  %-16s %8.0f MB/s" % (name, size / max(best, 1e-9)))
+        finally:
+            for path in (src, dst):
+                if os.path.exists(path):
+                    os.remove(path)
+            os.rmdir(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""Measure how many directory entries per second ranger loads.
+
+Compares the os.scandir() based loader with the os.listdir() + stat()
+fallback, and with the stat() calls spread over a pool of threads.  Without
+arguments, a temporary directory with some files and subdirectories is
+created, otherwise the given directory is loaded.  The time until the listing
+is shown and until the stats of all files are taken is measured:
+
+    doc/tools/benchmark_directory_loading.py [PATH] [REPEAT]
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+
+def setup_fm():
+    import ranger
+    import ranger.core.shared
+    import ranger.container.settings
+    import ranger.core.fm
+    from ranger.ext.openstruct import OpenStruct
+    ranger.args = OpenStruct()
+    ranger.args.clean = True
+    ranger.args.debug = False
+
+    settings = ranger.container.settings.Settings()
+    ranger.core.shared.SettingsAware.settings_set(settings)
+    fm = ranger.core.fm.FM()
+    fm.thistab = OpenStruct(thisdir=None, thisfile=None)
+    ranger.core.shared.FileManagerAware.fm_set(fm)
+    return fm
+
+
+def make_tree(path, files=20000, dirs=2000):
+    for i in range(files):
+        with open(os.path.join(path, 'file%d.txt' % i), 'wb') as fobj:
+            fobj.write(b'x' * (i % 100))
+    for i in range(dirs):
+        os.mkdir(os.path.join(path, 'dir%d' % i))
+
+
+def load(fm, path, use_scandir, stat_workers=0):
+    from ranger.container.directory import Directory
+    Directory.use_scandir = use_scandir
+    fm.settings.stat_workers = stat_workers
+    fm.directories.clear()
+    directory = fm.get_directory(path)
+    time1 = time.time()
+    time2 = None
+    for _ in directory.load_bit_by_bit():
+        if time2 is None and not directory.loading and directory.content_loaded:
+            time2 = time.time()
+    time3 = time.time()
+    return len(directory.files_all), (time2 or time3) - time1, time3 - time1
+
+
+def main():
+    from ranger.container.directory import scandir
+
+    tmpdir = None
+    if len(sys.argv) > 1:
+        path = os.path.abspath(sys.argv[1])
+    else:
+        tmpdir = path = tempfile.mkdtemp(prefix='ranger-benchmark-')
+        make_tree(path)
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    fm = setup_fm()
+    modes = [('listdir', False, 0), ('listdir+8', False, 8)]
+    if scandir is not None:
+        modes += [('scandir', True, 0), ('scandir+8', True, 8)]
+    try:
+        for name, use_scandir, stat_workers in modes:
+            best = best_total = None
+            for _ in range(repeat):
+                entries, seconds, total = load(fm, path, use_scandir, stat_workers)
+                best = seconds if best is None else min(best, seconds)
+                best_total = total if best_total is None else min(best_total, total)
+            print("%-10s %7d entries  listed in %8.1fms  %10.0f entries/s,"
+                  "  all stats in %8.1fms" % (
+                      name, entries, best * 1000, entries / max(best, 1e-9),
+                      best_total * 1000))
+    finally:
+        if tmpdir:
+            shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""Measure how much memory the entries of a loaded directory take up.
+
+Creates a temporary directory with ENTRIES files (100000 by default), loads
+and sorts it like ranger does and reports the memory allocated per entry and
+per 100k entries, as well as how long a full garbage collection takes.  It
+needs Python 3 for tracemalloc:
+
+    doc/tools/benchmark_file_memory.py [ENTRIES]
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import gc
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+
+def setup_fm():
+    import ranger
+    import ranger.core.shared
+    import ranger.container.settings
+    import ranger.core.fm
+    from ranger.ext.openstruct import OpenStruct
+    ranger.args = OpenStruct()
+    ranger.args.clean = True
+    ranger.args.debug = False
+
+    settings = ranger.container.settings.Settings()
+    ranger.core.shared.SettingsAware.settings_set(settings)
+    fm = ranger.core.fm.FM()
+    fm.thistab = OpenStruct(thisdir=None, thisfile=None)
+    ranger.core.shared.FileManagerAware.fm_set(fm)
+    # The defaults of rc.conf
+    settings.sort = 'natural'
+    settings.sort_case_insensitive = True
+    settings.sort_directories_first = True
+    return fm
+
+
+def make_tree(path, files):
+    for i in range(files):
+        with open(os.path.join(path, 'file%d.txt' % i), 'wb'):
+            pass
+
+
+def main():
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    path = tempfile.mkdtemp(prefix='ranger-benchmark-')
+    try:
+        make_tree(path, entries)
+        fm = setup_fm()
+        directory = fm.get_directory(path)
+
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        directory.load_content(schedule=False)
+        # Touch what drawing the visible rows would compute
+        for fobj in directory.files[:100]:
+            fobj.display_data['benchmark'] = fobj.infostring
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        time1 = time.time()
+        gc.collect()
+        time2 = time.time()
+
+        size = after - before
+        print("%d entries: %.1f MB, %d bytes per entry, %.1f MB per 100k entries" % (
+            len(directory.files_all), size / 2**20, size // len(directory.files_all),
+            size / len(directory.files_all) * 100000 / 2**20))
+        print("full garbage collection: %.1fms" % ((time2 - time1) * 1000))
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    main()
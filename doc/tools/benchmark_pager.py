@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""Measure how fast the pager opens, seeks in and scrolls through a big log.
+
+Writes a log file of SIZE megabytes (1024 by default) and times the line
+lookups the pager does on it through MappedLines: showing the first screen,
+jumping to the end (G) and to the middle, and scrolling down line by line.
+With --stream, the file is also read line by line into a list, as the pager
+used to do for files, which takes a lot of memory for big files:
+
+    doc/tools/benchmark_pager.py [--stream] [SIZE]
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+from io import open
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+HEIGHT = 50
+SCROLL_LINES = 1000
+
+
+def write_log(path, size):
+    line = '2024-01-01 00:00:00,000 INFO step {0:>9} loss=0.{0:06d} lr=3e-4 ' \
+        'tokens/s=123456 grad_norm=1.0\n'
+    chunk = ''.join(line.format(i) for i in range(10000)).encode('utf-8')
+    with open(path, 'wb') as fobj:
+        while fobj.tell() < size:
+            fobj.write(chunk)
+
+
+def max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def screen(lines, start):
+    return [lines[i] for i in range(start, lines.extent(start + HEIGHT))]
+
+
+def main():
+    from ranger.ext.mapped_lines import MappedLines
+    args = sys.argv[1:]
+    stream = '--stream' in args
+    args = [arg for arg in args if arg != '--stream']
+    size = int(args[0]) if args else 1024
+
+    fd, path = tempfile.mkstemp(prefix='ranger-benchmark-', suffix='.log')
+    os.close(fd)
+    try:
+        time1 = time.time()
+        write_log(path, size * 1024 * 1024)
+        print("%d MB log written in %.1f s, RSS %.0f MB"
+              % (size, time.time() - time1, max_rss_mb()))
+
+        with open(path, 'r', encoding='utf-8', errors='ignore') as fobj:
+            time1 = time.time()
+            lines = MappedLines(fobj)
+            screen(lines, 0)
+            print("  %-16s %8.3f s" % ("open", time.time() - time1))
+
+            time1 = time.time()
+            total = len(lines)
+            screen(lines, total - HEIGHT)
+            print("  %-16s %8.3f s, %d lines" % ("jump to end", time.time() - time1, total))
+
+            time1 = time.time()
+            screen(lines, total // 2)
+            print("  %-16s %8.3f s" % ("jump to middle", time.time() - time1))
+
+            time1 = time.time()
+            for start in range(total // 2, total // 2 + SCROLL_LINES):
+                screen(lines, start)
+            seconds = time.time() - time1
+            print("  %-16s %8.3f s, %8.1f us per line"
+                  % ("scroll", seconds, seconds / SCROLL_LINES * 1e6))
+            lines.close()
+        print("  %-16s %8.0f MB" % ("max RSS", max_rss_mb()))
+
+        if stream:
+            with open(path, 'r', encoding='utf-8', errors='ignore') as fobj:
+                time1 = time.time()
+                lines = []
+                for line in fobj:
+                    lines.append(line)
+                print("  %-16s %8.3f s" % ("stream to end", time.time() - time1))
+            print("  %-16s %8.0f MB" % ("max RSS", max_rss_mb()))
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+"""Measure how fast rifle lists the commands for files.
+
+Runs list_commands with ranger's default rifle.conf (or the given one) over
+files with common extensions, as ranger does when opening a file or showing
+the possible programs.  The mime types are given, so "file" is not run:
+
+    doc/tools/benchmark_rifle.py [ROUNDS] [RIFLE.CONF]
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import mimetypes
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+NAMES = (
+    'README', 'notes.txt', 'index.html', 'script.py', 'main.c', 'photo.jpg',
+    'image.PNG', 'movie.mkv', 'song.mp3', 'paper.pdf', 'archive.tar.gz',
+    'data.json', 'book.epub', 'slides.odp', 'sheet.xlsx', 'disk.iso',
+)
+
+
+def main():
+    from ranger.ext.rifle import Rifle
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    config = sys.argv[2] if len(sys.argv) > 2 else os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), '..', '..', 'ranger', 'config', 'rifle.conf')
+    rifle = Rifle(config)
+    rifle.reload_config()
+    rifle.hook_logger = lambda string: None
+
+    tmpdir = tempfile.mkdtemp(prefix='ranger-benchmark-')
+    try:
+        files = []
+        for name in NAMES:
+            path = os.path.join(tmpdir, name)
+            with open(path, 'wb') as fobj:
+                fobj.write(b'\n')
+            mimetype = mimetypes.guess_type(path)[0] or 'text/plain'
+            files.append((path, mimetype))
+
+        time1 = time.time()
+        for _ in range(rounds):
+            for path, mimetype in files:
+                list(rifle.list_commands([path], mimetype, skip_ask=True))
+        seconds = time.time() - time1
+        calls = rounds * len(files)
+        print("%d rules, %d calls of list_commands: %.3f s, %.0f calls/s"
+              % (len(rifle.rules), calls, seconds, calls / seconds))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""Measure how fast ranger looks up the VCS status of directories.
+
+Builds a synthetic status map of COUNT paths (100000 by default), most of
+them ignored or untracked like in a big monorepo, and looks up the status of
+every directory in it, as ranger does when it loads them.  The lookup by
+scanning all paths, as ranger used to do, is timed on a sample of the
+directories only:
+
+    doc/tools/benchmark_vcs_status.py [COUNT]
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+
+def make_status_subpaths(count):
+    rand = random.Random(0)
+    statuses = ['ignored'] * 6 + ['untracked'] * 2 + ['changed', 'staged', 'deleted']
+    status_subpaths = {}
+    while len(status_subpaths) < count:
+        depth = rand.randint(1, 6)
+        parts = ['dir%d' % rand.randint(0, 9) for _ in range(depth)]
+        parts.append('file%d' % rand.randint(0, 999))
+        status_subpaths['/'.join(parts)] = rand.choice(statuses)
+    return status_subpaths
+
+
+def scan_status(root, relpath):
+    statuses = set(status for subpath, status in root.status_subpaths.items()
+                   if subpath.startswith(relpath + '/'))
+    for status in root.DIRSTATUSES:
+        if status in statuses:
+            return status
+    return 'sync'
+
+
+def main():
+    from ranger.ext.vcs.vcs import VcsRoot
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    root = VcsRoot.__new__(VcsRoot)
+    root.path = '/repo'
+    root.status_subpaths = make_status_subpaths(count)
+    directories = set()
+    for subpath in root.status_subpaths:
+        parent = os.path.dirname(subpath)
+        while parent:
+            directories.add(parent)
+            parent = os.path.dirname(parent)
+    directories = sorted(directories)
+    print("%d paths with status, %d directories" % (count, len(directories)))
+
+    time1 = time.time()
+    root._index_status_subpaths()  # pylint: disable=protected-access
+    print("  %-16s %8.3f s" % ("index", time.time() - time1))
+
+    time1 = time.time()
+    for relpath in directories:
+        root.status_subpath(os.path.join(root.path, relpath), is_directory=True)
+    seconds = time.time() - time1
+    print("  %-16s %8.3f s, %8.1f us per directory"
+          % ("lookup", seconds, seconds / len(directories) * 1e6))
+
+    sample = directories[::max(1, len(directories) // 100)]
+    time1 = time.time()
+    for relpath in sample:
+        scan_status(root, relpath)
+    seconds = (time.time() - time1) / len(sample) * len(directories)
+    print("  %-16s %8.3f s, %8.1f us per directory"
+          % ("scan (estimated)", seconds, seconds / len(directories) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -1906,10 +1906,11 @@ class flat(Command):
 class reset_previews(Command):
     """:reset_previews
 
-    Reset the file previews.
+    Reset the file previews, including those cached on disk.
     """
     def execute(self):
-        self.fm.previews = {}
+        self.fm.previews.clear()
+        self.fm.previews.clear_disk()
         self.fm.ui.need_redraw = True
 
 
@@ -1,6 +1,8 @@
 # This file is part of ranger, the console file manager.
 # License: GNU GPL version 3, see the file "AUTHORS" for details.
 
+# pylint: disable=too-many-lines
+
 from __future__ import (absolute_import, division, print_function)
 
 import locale
@@ -8,10 +10,11 @@ import os.path
 from os import stat as os_stat, lstat as os_lstat
 import random
 import re
+import sys
 from collections import deque
 from time import time
 
-from ranger.container.fsobject import BAD_INFO, FileSystemObject
+from ranger.container.fsobject import BAD_INFO, DEFERRED_STAT, FileSystemObject
 from ranger.core import filter_stack
 from ranger.core.filter_stack import InodeFilterConstants, accept_file
 from ranger.core.loader import Loadable
@@ -22,6 +25,21 @@ from ranger.ext.lazy_property import lazy_property
 from ranger.ext.human_readable import human_readable
 from ranger.container.settings import LocalSettings
 from ranger.ext.vcs import Vcs
+from ranger.ext.worker_pool import WorkerPool
+
+# None on Python < 3.5
+scandir = getattr(os, 'scandir', None)  # pylint: disable=invalid-name
+
+# Python 2 compatibility
+try:
+    import queue
+except ImportError:
+    import Queue as queue  # pylint: disable=import-error
+
+# Number of entries that a thread of the stat pool handles at once
+STAT_BATCH_SIZE = 64
+# Seconds to wait for the stat pool before yielding to the loader
+STAT_POLL_TIMEOUT = 0.005
 
 
 def sort_by_basename(path):
@@ -55,10 +73,100 @@ def sort_unicode_wrapper_string(old_sort_func):
 
 def sort_unicode_wrapper_list(old_sort_func):
     def sort_unicode(path):
-        return [locale.strxfrm(str(c)) for c in old_sort_func(path)]
+        return [locale.strxfrm(c) if isinstance(c, str) else c
+                for c in old_sort_func(path)]
     return sort_unicode
 
 
+def stat_path(path):
+    """Returns the (stat, lstat) tuple of path, or None if it's inaccessible
+
+    The tuple is in the format FileSystemObject expects as preload.
+    """
+    try:
+        file_lstat = os_lstat(path)
+        if file_lstat.st_mode & 0o170000 == 0o120000:
+            file_stat = os_stat(path)
+        else:
+            file_stat = file_lstat
+    except OSError:
+        return None
+    return (file_stat, file_lstat)
+
+
+def stat_dir_entry(entry):
+    """Like stat_path(), but for an os.DirEntry from scandir()
+
+    On POSIX, DirEntry.stat() makes a syscall of its own, but the d_type of
+    the directory listing tells whether the entry is a regular file without
+    one.  Regular files aren't stat()ed here, DEFERRED_STAT is returned for
+    them instead.  Directories, links and special files are stat()ed, and
+    only links a second time.
+    """
+    try:
+        if entry.is_file(follow_symlinks=False):
+            return DEFERRED_STAT
+        file_lstat = entry.stat(follow_symlinks=False)
+        if entry.is_symlink():
+            file_stat = entry.stat(follow_symlinks=True)
+        else:
+            file_stat = file_lstat
+    except OSError:
+        return None
+    return (file_stat, file_lstat)
+
+
+def stat_serially(filenames, entries=None):
+    """Yields the stats of filenames in batches of one (index, path, stats)
+
+    entries are the matching os.DirEntry objects, if there are any.
+    """
+    for i, name in enumerate(filenames):
+        if entries is None:
+            yield [(i, name, stat_path(name))]
+        else:
+            yield [(i, name, stat_dir_entry(entries[i]))]
+
+
+def stat_in_pool(pool, filenames, entries=None, batch_size=STAT_BATCH_SIZE):
+    """Like stat_serially(), but stat in the threads of a WorkerPool
+
+    Completed batches are yielded in the order they finish.  If none
+    finished within STAT_POLL_TIMEOUT, an empty batch is yielded so the
+    loader gets a chance to hand control back to the UI.
+    """
+    results = queue.Queue()
+    cancelled = []
+
+    def stat_batch(start):
+        if cancelled:
+            return []
+        stop = min(start + batch_size, len(filenames))
+        if entries is None:
+            return [(i, filenames[i], stat_path(filenames[i])) for i in range(start, stop)]
+        return [(i, filenames[i], stat_dir_entry(entries[i])) for i in range(start, stop)]
+
+    pending = 0
+    for start in range(0, len(filenames), batch_size):
+        pool.submit(results, stat_batch, start)
+        pending += 1
+
+    try:
+        while pending:
+            try:
+                batch, exception = results.get(timeout=STAT_POLL_TIMEOUT)
+            except queue.Empty:
+                yield []
+                continue
+            pending -= 1
+            if exception is not None:
+                raise exception  # pylint: disable=raising-bad-type
+            yield batch
+    finally:
+        # Skip the batches that haven't started if loading is aborted
+        cancelled.append(True)
+
+
 def walklevel(some_dir, level):
     some_dir = some_dir.rstrip(os.path.sep)
     followlinks = level > 0
@@ -89,6 +197,7 @@ class Directory(  # pylint: disable=too-many-instance-attributes,too-many-public
     loading = False
     progressbar_supported = True
     flat = 0
+    disk_usage = 0
 
     filenames = None
     files = None
@@ -100,7 +209,6 @@ class Directory(  # pylint: disable=too-many-instance-attributes,too-many-public
     scroll_begin = 0
 
     mount_path = '/'
-    disk_usage = 0
 
     last_update_time = -1
     load_content_mtime = -1
@@ -109,11 +217,25 @@ class Directory(  # pylint: disable=too-many-instance-attributes,too-many-public
     content_outdated = False
     content_loaded = False
 
+    # Set by ranger.core.watcher.DirectoryWatcher
+    watched = False
+    content_changed = False
+
     has_vcschild = False
     _vcs_signal_handler_installed = False
 
+    # List directories with os.scandir() when it is available.  Set this
+    # to False to fall back to os.listdir() followed by one stat per entry.
+    use_scandir = scandir is not None
+
+    # Shared by all directories, see the setting "stat_workers"
+    _stat_pool = None
+
     cumulative_size_calculated = False
 
+    # (sort function, {relative path: key}) of the cached sort keys
+    _sort_key_cache = None
+
     sort_dict = {
         'basename': sort_by_basename,
         'natural': sort_naturally,
@@ -332,11 +454,15 @@ class Directory(  # pylint: disable=too-many-instance-attributes,too-many-public
 
     # XXX: Check for possible race conditions
     # pylint: disable=too-many-locals,too-many-branches,too-many-statements
-    def load_bit_by_bit(self):
+    def load_bit_by_bit(self, incremental=False):
         """An iterator that loads a part on every next() call
 
         Returns a generator which load a part of the directory
         in each iteration.
+
+        If incremental is True and the contents were loaded before, only
+        new or replaced entries are stat()ed and get new objects.  The
+        others keep theirs, including caches like display_data.
         """
 
         self.loading = True
@@ -344,6 +470,7 @@ class Directory(  # pylint: disable=too-many-instance-attributes,too-many-public
         self.load_if_outdated()
 
         basename_is_rel_to = self.path if self.flat else None
+        deferred = []
 
         try:  # pylint: disable=too-many-nested-blocks
             if self.runnable:
@@ -366,7 +493,14 @@ class Directory(  # pylint: disable=too-many-instance-attributes,too-many-public
                         filelist += [os.path.join("/", dirpath, f) for f in filenames]
                     filenames = filelist
                     self.load_content_mtime = mtimelevel(mypath, self.flat)
+                    entries = None
+                elif self.use_scandir:
+                    entries = list(scandir(mypath))
+                    filelist = [entry.name for entry in entries]
+                    filenames = [entry.path for entry in entries]
+                    self.load_content_mtime = os.stat(mypath).st_mtime
                 else:
+                    entries = None
                     filelist = os.listdir(mypath)
                     filenames = [mypath + (mypath == '/' and fname or '/' + fname)
                                  for fname in filelist]
@@ -394,63 +528,49 @@ class Directory(  # pylint: disable=too-many-instance-attributes,too-many-public
 
                 marked_paths = [obj.path for obj in self.marked_items]
 
-                files = []
-                disk_usage = 0
+                # Without the inode numbers from scandir, replaced entries
+                # can't be told apart from unchanged ones.
+                incremental = incremental and entries is not None \
+                    and self.content_loaded and self.files_all is not None
+                if incremental:
+                    kept, added = self._diff_listing(entries)
+                    stat_names = [filenames[i] for i in added]
+                    stat_entries = [entries[i] for i in added]
+                else:
+                    kept = []
+                    stat_names, stat_entries = filenames, entries
 
-                has_vcschild = False
-                for name in filenames:
-                    try:
-                        file_lstat = os_lstat(name)
-                        if file_lstat.st_mode & 0o170000 == 0o120000:
-                            file_stat = os_stat(name)
-                        else:
-                            file_stat = file_lstat
-                    except OSError:
-                        file_lstat = None
-                        file_stat = None
-                    if file_lstat and file_stat:
-                        stats = (file_stat, file_lstat)
-                        is_a_dir = file_stat.st_mode & 0o170000 == 0o040000
-                    else:
-                        stats = None
-                        is_a_dir = False
-
-                    if is_a_dir:
-                        item = self.fm.get_directory(name, preload=stats, path_is_abs=True,
-                                                     basename_is_rel_to=basename_is_rel_to)
-                        item.load_if_outdated()
-                        if self.flat:
-                            item.relative_path = os.path.relpath(item.path, self.path)
-                        else:
-                            item.relative_path = item.basename
-                        item.relative_path_lower = item.relative_path.lower()
-                        if item.vcs and item.vcs.track:
-                            if item.vcs.is_root_pointer:
-                                has_vcschild = True
-                            else:
-                                item.vcsstatus = \
-                                    item.vcs.rootvcs.status_subpath(  # pylint: disable=no-member
-                                        os.path.join(self.realpath, item.basename),
-                                        is_directory=True,
-                                    )
-                    else:
-                        item = File(name, preload=stats, path_is_abs=True,
-                                    basename_is_rel_to=basename_is_rel_to)
-                        item.load()
-                        disk_usage += item.size
-                        if self.vcs and self.vcs.track:
-                            item.vcsstatus = \
-                                self.vcs.rootvcs.status_subpath(  # pylint: disable=no-member
-                                    os.path.join(self.realpath, item.basename))
-
-                    files.append(item)
-                    self.percent = 100 * len(files) // len(filenames)
+                stat_workers = self.settings.stat_workers
+                if stat_workers > 1 and len(stat_names) > STAT_BATCH_SIZE:
+                    stat_batches = stat_in_pool(self._get_stat_pool(stat_workers),
+                                                stat_names, stat_entries)
+                else:
+                    stat_batches = stat_serially(stat_names, stat_entries)
+                loaded = [None] * len(stat_names)
+                files_loaded = 0
+
+                for batch in stat_batches:
+                    for i, name, stats in batch:
+                        loaded[i] = self._load_item(name, stats, basename_is_rel_to)
+                    files_loaded += len(batch)
+                    self.percent = 100 * files_loaded // len(stat_names)
                     yield
-                self.has_vcschild = has_vcschild
-                self.disk_usage = disk_usage
+                files = kept + loaded
+
+                self.has_vcschild = any(
+                    item.is_directory and item.vcs and item.vcs.track
+                    and item.vcs.is_root_pointer for item in files)
+                # The sizes of the deferred files are added by
+                # _stat_deferred_files() once the listing is shown
+                deferred = [item for item in files if item.stat_deferred]
+                self.disk_usage = sum(item.size for item in files
+                                      if not item.is_directory and not item.stat_deferred)
 
                 self.filenames = filenames
-                self.files_all = files
+                if not incremental:
+                    self._sort_key_cache = None
+                merged = self._merge_sorted(kept, loaded) if incremental else None
+                self.files_all = files if merged is None else merged
 
                 self._clear_marked_items()
                 for item in self.files_all:
@@ -460,7 +580,10 @@ class Directory(  # pylint: disable=too-many-instance-attributes,too-many-public
                     else:
                         item.mark_set(False)
 
-                self.sort()
+                if merged is None:
+                    self.sort()
+                else:
+                    self.refilter()
 
                 if files:
                     if self.pointed_obj is not None:
@@ -482,16 +605,180 @@ class Directory(  # pylint: disable=too-many-instance-attributes,too-many-public
             self.fm.signal_emit("finished_loading_dir", directory=self)
             if self.vcs:
                 self.fm.ui.vcsthread.process(self)
+
+        if deferred:
+            # The listing is drawn before the deferred files are stat()ed
+            yield
+            for _ in self._stat_deferred_files(deferred):
+                yield
     # pylint: enable=too-many-locals,too-many-branches,too-many-statements
 
+    def _stat_deferred_files(self, deferred):
+        """Stat the files whose stat was deferred while loading, bit by bit
+
+        Their sizes are added to disk_usage as they come in.  Files that were
+        stat()ed in the meantime, e.g. because they were drawn, are only
+        added.
+        """
+        paths = [item.path for item in deferred]
+        stat_workers = self.settings.stat_workers
+        if stat_workers > 1 and len(paths) > STAT_BATCH_SIZE:
+            stat_batches = stat_in_pool(self._get_stat_pool(stat_workers), paths)
+        else:
+            stat_batches = stat_serially(paths)
+        for batch in stat_batches:
+            for i, _, stats in batch:
+                item = deferred[i]
+                item.apply_deferred_stat(stats)
+                self.disk_usage += item.size
+            yield
+
+    def _load_item(self, name, stats, basename_is_rel_to):
+        """Returns the loaded File or Directory object for a listed path"""
+        if stats is None or stats is DEFERRED_STAT \
+                or stats[0].st_mode & 0o170000 != 0o040000:
+            item = File(name, preload=stats, path_is_abs=True,
+                        basename_is_rel_to=basename_is_rel_to)
+            item.load()
+            if self.vcs and self.vcs.track:
+                item.vcsstatus = self.vcs.rootvcs.status_subpath(  # pylint: disable=no-member
+                    os.path.join(self.realpath, item.basename))
+            return item
+
+        item = self.fm.get_directory(name, preload=stats, path_is_abs=True,
+                                     basename_is_rel_to=basename_is_rel_to)
+        # Reuse the fresh stats instead of stat()ing known directories
+        # again.  Their file count stays lazy until something (e.g. drawing
+        # the row) asks for it.
+        item.load_if_outdated(preload=stats)
+        if self.flat:
+            item.relative_path = os.path.relpath(item.path, self.path)
+        else:
+            item.relative_path = item.basename
+        item.relative_path_lower = item.relative_path.lower()
+        if item.vcs and item.vcs.track and not item.vcs.is_root_pointer:
+            item.vcsstatus = item.vcs.rootvcs.status_subpath(  # pylint: disable=no-member
+                os.path.join(self.realpath, item.basename),
+                is_directory=True,
+            )
+        return item
+
+    def _diff_listing(self, entries):
+        """Compares the os.DirEntry objects of a fresh listing with files_all
+
+        Returns the objects that can be kept, in their current order, and
+        the indices of the entries which are new or changed.  An entry that
+        was stat()ed counts as changed if a new lstat differs in the inode,
+        mode, size or mtime, so that files rewritten in place get fresh
+        stats.  Entries that weren't stat()ed yet only need to be files
+        still.  Symlinks are always replaced since their target may have
+        changed.
+        """
+        old = dict((obj.path, obj) for obj in self.files_all)
+        kept_paths = set()
+        added = []
+        for i, entry in enumerate(entries):
+            obj = old.get(entry.path)
+            if obj is None or obj.is_link or entry.is_symlink():
+                added.append(i)
+            elif obj.stat_deferred:
+                if entry.is_file(follow_symlinks=False):
+                    kept_paths.add(entry.path)
+                else:
+                    added.append(i)
+            elif obj.stat and self._stat_unchanged(obj.stat, entry):
+                kept_paths.add(entry.path)
+            else:
+                added.append(i)
+        kept = [obj for obj in self.files_all if obj.path in kept_paths]
+        return kept, added
+
+    @staticmethod
+    def _stat_unchanged(old_stat, entry):
+        try:
+            new_stat = entry.stat(follow_symlinks=False)
+        except OSError:
+            return False
+        return (old_stat.st_ino, old_stat.st_mode, old_stat.st_size, old_stat.st_mtime) \
+            == (new_stat.st_ino, new_stat.st_mode, new_stat.st_size, new_stat.st_mtime)
+
+    def _merge_sorted(self, kept, new):
+        """Returns kept and new as one list in the current sort order
+
+        kept must already be sorted, so only the new items are sorted and
+        then merged in, which is linear in the size of kept.  Returns None
+        if that's not possible and everything needs to be sorted again.
+        """
+        if self.order_outdated or self.settings.sort == 'random':
+            return None
+        if not new:
+            return kept
+
+        sort_key, reverse = self._get_sort_key()
+        new.sort(key=sort_key, reverse=reverse)
+        new_keys = [sort_key(item) for item in new]
+        kept_keys = [sort_key(item) for item in kept]
+
+        merged = []
+        i = 0
+        for item, key in zip(new, new_keys):
+            if reverse:
+                while i < len(kept) and not key > kept_keys[i]:
+                    merged.append(kept[i])
+                    i += 1
+            else:
+                while i < len(kept) and not key < kept_keys[i]:
+                    merged.append(kept[i])
+                    i += 1
+            merged.append(item)
+        merged.extend(kept[i:])
+        return merged
+
+    @staticmethod
+    def _get_stat_pool(workers):
+        pool = Directory._stat_pool
+        if pool is None or pool.workers != workers:
+            if pool is not None:
+                pool.shutdown()
+            pool = Directory._stat_pool = WorkerPool(workers, name='stat')
+        return pool
+
     def unload(self):
         self.loading = False
         self.load_generator = None
 
-    def load_content(self, schedule=None):
+    def unload_content(self):
+        """Forget the loaded contents to free memory
+
+        They are loaded again the next time they are needed.
+        """
+        self._clear_marked_items()
+        self.filenames = None
+        self.files_all = None
+        self.files = None
+        self.cycle_list = None
+        self._sort_key_cache = None
+        self.content_loaded = False
+        self.content_changed = False
+        self.load_content_mtime = -1
+
+    def estimate_content_size(self):
+        """Returns roughly how many bytes the loaded contents take up"""
+        if self.files_all is None:
+            return 0
+        size = sys.getsizeof(self.files_all) + sys.getsizeof(self.filenames)
+        for fobj in self.files_all:
+            size += sys.getsizeof(fobj) + sys.getsizeof(fobj.__dict__) \
+                + sys.getsizeof(fobj.path)
+            if not fobj.stat_deferred and fobj.stat is not None:
+                size += sys.getsizeof(fobj.stat)
+        return size
+
+    def load_content(self, schedule=None, incremental=False):
         """Loads the contents of the directory.
 
         Use this sparingly since it takes rather long.
+        See load_bit_by_bit() for the meaning of incremental.
         """
         self.content_outdated = False
         if self.settings.freeze_files:
@@ -509,7 +796,7 @@ class Directory(  # pylint: disable=too-many-instance-attributes,too-many-public
                 schedule = True   # was: self.size > 30
 
             if self.load_generator is None:
-                self.load_generator = self.load_bit_by_bit()
+                self.load_generator = self.load_bit_by_bit(incremental=incremental)
 
                 if schedule and self.fm:
                     self.fm.loader.add(self)
@@ -523,12 +810,9 @@ class Directory(  # pylint: disable=too-many-instance-attributes,too-many-public
                     pass
                 self.load_generator = None
 
-    def sort(self):
-        """Sort the contained files"""
+    def _get_sort_func(self):
+        """Returns the key function for the current sort settings"""
         # pylint: disable=comparison-with-callable
-        if self.files_all is None:
-            return
-
         try:
             sort_func = self.sort_dict[self.settings.sort]
         except KeyError:
@@ -545,17 +829,55 @@ class Directory(  # pylint: disable=too-many-instance-attributes,too-many-public
         # XXX Does not work with usermade sorting functions :S
         if self.settings.sort_unicode:
             if sort_func in (sort_naturally, sort_naturally_icase):
-                sort_func = sort_unicode_wrapper_list(sort_func)
+                sort_func = self._cache_sort_keys(
+                    sort_func, sort_unicode_wrapper_list(sort_func))
             elif sort_func in (sort_by_basename, sort_by_basename_icase):
-                sort_func = sort_unicode_wrapper_string(sort_func)
+                sort_func = self._cache_sort_keys(
+                    sort_func, sort_unicode_wrapper_string(sort_func))
+        return sort_func
 
-        self.files_all.sort(key=sort_func)
+    def _cache_sort_keys(self, base_func, sort_func):
+        """Remembers the keys of sort_func, which depend only on the name
 
-        if self.settings.sort_reverse:
-            self.files_all.reverse()
+        Transforming names with locale.strxfrm() is slow, so the keys are
+        kept until a different sort function is used or the directory is
+        loaded again from scratch.
+        """
+        if self._sort_key_cache is None or self._sort_key_cache[0] is not base_func:
+            self._sort_key_cache = (base_func, {})
+        cache = self._sort_key_cache[1]
+
+        def cached_sort_func(path):
+            try:
+                return cache[path.relative_path]
+            except KeyError:
+                key = cache[path.relative_path] = sort_func(path)
+                return key
+        return cached_sort_func
+
+    def _get_sort_key(self):
+        """Returns the key function and whether to reverse the order
+
+        Putting directories first is part of the key, so the files can be
+        sorted in a single pass that also does the reversing.
+        """
+        sort_func = self._get_sort_func()
+        reverse = bool(self.settings.sort_reverse)
+        if not self.settings.sort_directories_first:
+            return sort_func, reverse
 
-        if self.settings.sort_directories_first:
-            self.files_all.sort(key=sort_by_directory)
+        def sort_key(path):
+            # In reverse the directories need the higher value to come first
+            return (path.is_directory == reverse, sort_func(path))
+        return sort_key, reverse
+
+    def sort(self):
+        """Sort the contained files"""
+        if self.files_all is None:
+            return
+
+        sort_key, reverse = self._get_sort_key()
+        self.files_all.sort(key=sort_key, reverse=reverse)
 
         self.refilter()
 
@@ -690,23 +1012,33 @@ class Directory(  # pylint: disable=too-many-instance-attributes,too-many-public
             self.load_content(*a, **k)
             return True
 
+        if self.watched:
+            # The DirectoryWatcher flags changes, no need to poll the mtime
+            if not self.content_changed or self.loading:
+                return False
+            self.content_changed = False
+        elif not self._content_mtime_changed():
+            return False
+
+        # Diff the new listing against the old one instead of rebuilding
+        # everything, see _diff_listing()
+        k.setdefault('incremental', True)
+        self.load_content(*a, **k)
+        return True
+
+    def _content_mtime_changed(self):
         try:
             if self.flat:
                 real_mtime = mtimelevel(self.path, self.flat)
             else:
                 real_mtime = os.stat(self.path).st_mtime
         except OSError:
-            real_mtime = None
             return False
         if self.stat:
             cached_mtime = self.load_content_mtime
         else:
             cached_mtime = 0
-
-        if real_mtime != cached_mtime:
-            self.load_content(*a, **k)
-            return True
-        return False
+        return real_mtime != cached_mtime
 
     def get_description(self):
         return "Loading " + str(self)
@@ -7,6 +7,7 @@ import re
 
 from ranger import PY3
 from ranger.container.fsobject import FileSystemObject
+from ranger.ext.lazy_property import lazy_property
 
 N_FIRST_BYTES = 256
 if PY3:
@@ -51,6 +52,20 @@ class File(FileSystemObject):
     preview_loading = False
     _firstbytes = None
 
+    @lazy_property
+    def size(self):  # pylint: disable=method-hidden
+        if not self.stat_deferred:
+            return 0
+        self.stat  # trigger the stat pylint: disable=pointless-statement
+        return self.size
+
+    @lazy_property
+    def infostring(self):  # pylint: disable=method-hidden
+        if not self.stat_deferred:
+            return None
+        self.stat  # trigger the stat pylint: disable=pointless-statement
+        return self.infostring
+
     @property
     def firstbytes(self):
         if self._firstbytes is not None:
@@ -4,6 +4,7 @@
 from __future__ import (absolute_import, division, print_function)
 
 import re
+from collections import namedtuple
 from grp import getgrgid
 from os import lstat, stat
 from os.path import abspath, basename, dirname, realpath, relpath, splitext, expanduser
@@ -17,7 +18,6 @@ from ranger.core.linemode import (
 )
 from ranger.core.shared import FileManagerAware, SettingsAware
 from ranger.ext.shell_escape import shell_escape
-from ranger.ext import spawn
 from ranger.ext.lazy_property import lazy_property
 from ranger.ext.human_readable import human_readable
 
@@ -41,9 +41,51 @@ DOCUMENT_BASENAMES = ('bugs', 'bugs', 'changelog', 'copying', 'credits',
 
 BAD_INFO = '?'
 
+# The preload of an entry that the directory listing says is a regular file.
+# Such an entry is only stat()ed once something needs its size, times or
+# mode, see FileSystemObject.stat.
+DEFERRED_STAT = 'deferred'
+
 _UNSAFE_CHARS = '\n' + ''.join(map(chr, range(32))) + ''.join(map(chr, range(128, 256)))
 _SAFE_STRING_TABLE = maketrans(_UNSAFE_CHARS, '?' * len(_UNSAFE_CHARS))
-_EXTRACT_NUMBER_RE = re.compile(r'(\d+|\D)')
+_SPLIT_NUMBERS_RE = re.compile(r'(\d+)')
+
+
+# The fields of os.stat_result that ranger uses.  A stat_result also holds
+# the timestamps as integers and in nanoseconds and some more fields, which
+# makes it take up several times the memory of this tuple.
+CompactStat = namedtuple('CompactStat', (
+    'st_mode', 'st_ino', 'st_dev', 'st_nlink', 'st_uid', 'st_gid', 'st_size',
+    'st_atime', 'st_mtime', 'st_ctime'))
+
+
+def compact_stat(stat_result):
+    """Returns the CompactStat of an os.stat_result, or None for None"""
+    if stat_result is None:
+        return None
+    return CompactStat._make(stat_result[:7] + (
+        stat_result.st_atime, stat_result.st_mtime, stat_result.st_ctime))
+
+
+def natural_sort_key(string):
+    """Returns a key for sorting strings with the numbers in them by value
+
+    The key is a flat tuple of the text before each number, the number as an
+    integer and the text after the last number.  Every text that is followed
+    by a number gets a '0' appended, so a number compares to other characters
+    like the digit 0 would.  This orders strings exactly like comparing them
+    character by character with each number taken as a single unit, without
+    building a tuple for every character.
+
+    >>> natural_sort_key('img12.png')
+    ('img0', 12, '.png')
+    >>> sorted(['a10', 'a9', 'a.', 'ab', 'a'], key=natural_sort_key)
+    ['a', 'a.', 'a9', 'a10', 'ab']
+    """
+    parts = _SPLIT_NUMBERS_RE.split(string)
+    parts[1::2] = [int(number) for number in parts[1::2]]
+    parts[0:-1:2] = [text + '0' for text in parts[0:-1:2]]
+    return tuple(parts)
 
 
 def safe_path(path):
@@ -52,13 +94,16 @@ def safe_path(path):
 
 class FileSystemObject(  # pylint: disable=too-many-instance-attributes,too-many-public-methods
         FileManagerAware, SettingsAware):
-    basename = None
-    relative_path = None
+    # The attributes every loaded entry has live in slots rather than in the
+    # instance dictionary, which holds only what is computed on demand
+    __slots__ = (
+        'original_path', 'path', 'basename', 'relative_path', 'preload',
+        '_stat', 'permissions', 'last_load_time', 'loaded', 'exists',
+        'accessible', 'is_link', 'marked',
+    )
+    # Directory computes these lazily
     infostring = None
-    original_path = None
-    path = None
-    permissions = None
-    stat = None
+    size = 0
 
     content_loaded = False
     force_load = False
@@ -67,13 +112,8 @@ class FileSystemObject(  # pylint: disable=too-many-instance-attributes,too-many
     is_directory = False
     is_file = False
     is_fifo = False
-    is_link = False
     is_socket = False
 
-    accessible = False
-    exists = False  # "exists" currently means "link_target_exists"
-    loaded = False
-    marked = False
     runnable = False
     stopped = False
     tagged = False
@@ -85,10 +125,6 @@ class FileSystemObject(  # pylint: disable=too-many-instance-attributes,too-many
     media = False
     video = False
 
-    size = 0
-
-    last_load_time = -1
-
     vcsstatus = None
     vcsremotestatus = None
 
@@ -111,11 +147,39 @@ class FileSystemObject(  # pylint: disable=too-many-instance-attributes,too-many
         else:
             self.relative_path = relpath(path, basename_is_rel_to)
         self.preload = preload
-        self.display_data = {}
+        self._stat = None
+        self.permissions = None
+        self.last_load_time = -1
+        self.loaded = False
+        self.exists = False  # "exists" currently means "link_target_exists"
+        self.accessible = False
+        self.is_link = False
+        self.marked = False
 
     def __repr__(self):
         return "<{0} {1}>".format(self.__class__.__name__, self.path)
 
+    @property
+    def stat(self):
+        if self._stat is DEFERRED_STAT:
+            self._stat = None
+            self._apply_stat(self._lstat())
+        return self._stat
+
+    @stat.setter
+    def stat(self, value):
+        self._stat = value
+
+    @property
+    def stat_deferred(self):
+        """Whether the entry wasn't stat()ed yet, see DEFERRED_STAT"""
+        return self._stat is DEFERRED_STAT
+
+    @lazy_property
+    def display_data(self):
+        # Only the drawn entries need a cache for their display data
+        return {}
+
     @lazy_property
     def extension(self):
         try:
@@ -152,30 +216,15 @@ class FileSystemObject(  # pylint: disable=too-many-instance-attributes,too-many
 
     @lazy_property
     def filetype(self):
-        try:
-            return spawn.check_output(["file", '-Lb', '--mime-type', self.path])
-        except OSError:
-            return ""
+        return self.fm.mimetype_service.detect(self.path) or ""
 
     @lazy_property
     def basename_natural(self):
-        basename_list = []
-        for string in _EXTRACT_NUMBER_RE.split(self.relative_path):
-            try:
-                basename_list += [('0', int(string))]
-            except ValueError:
-                basename_list += [(string, 0)]
-        return basename_list
+        return natural_sort_key(self.relative_path)
 
     @lazy_property
     def basename_natural_lower(self):
-        basename_list = []
-        for string in _EXTRACT_NUMBER_RE.split(self.relative_path_lower):
-            try:
-                basename_list += [('0', int(string))]
-            except ValueError:
-                basename_list += [(string, 0)]
-        return basename_list
+        return natural_sort_key(self.relative_path_lower)
 
     @lazy_property
     def basename_without_extension(self):
@@ -220,6 +269,9 @@ class FileSystemObject(  # pylint: disable=too-many-instance-attributes,too-many
             bname = bname[0:-5]
         # pylint: disable=attribute-defined-outside-init
         self._mimetype = self.fm.mimetypes.guess_type(bname, False)[0]
+        if self._mimetype is None and self.stat:
+            # Known if the content was examined before, e.g. by rifle
+            self._mimetype = self.fm.mimetype_service.cached(self.path, self.stat)
         if self._mimetype is None:
             self._mimetype = ''
         # pylint: enable=attribute-defined-outside-init
@@ -285,33 +337,73 @@ class FileSystemObject(  # pylint: disable=too-many-instance-attributes,too-many
         if self.settings.freeze_files:
             return
 
-        self.display_data = {}
+        try:
+            del self.display_data
+        except AttributeError:
+            pass
         self.fm.update_preview(self.path)
 
         # Get the stat object, either from preload or from [l]stat
         self.permissions = None
-        new_stat = None
-        path = self.path
         self.is_link = False
+        if self.preload is DEFERRED_STAT:
+            self.preload = None
+            self.exists = self.accessible = True
+            self._stat = DEFERRED_STAT
+            # Computed from the stat once they are needed
+            self.__dict__.pop('size', None)
+            self.__dict__.pop('infostring', None)
+            self.last_load_time = time()
+            return
         if self.preload:
-            new_stat = self.preload[1]
-            self.is_link = new_stat.st_mode & 0o170000 == 0o120000
-            if self.is_link:
-                new_stat = self.preload[0]
+            new_stat = self._preloaded_stat(self.preload)
             self.preload = None
-            self.exists = bool(new_stat)
         else:
-            try:
-                new_stat = lstat(path)
-                self.is_link = new_stat.st_mode & 0o170000 == 0o120000
-                if self.is_link:
-                    new_stat = stat(path)
-                self.exists = True
-            except OSError:
-                self.exists = False
+            new_stat = self._lstat()
+        self._apply_stat(new_stat)
 
-        # Set some attributes
+    def _preloaded_stat(self, preload):
+        """Returns the stat of a (stat, lstat) preload, like _lstat()"""
+        new_stat = preload[1]
+        self.is_link = new_stat.st_mode & 0o170000 == 0o120000
+        if self.is_link:
+            new_stat = preload[0]
+        self.exists = bool(new_stat)
+        return new_stat
 
+    def apply_deferred_stat(self, preload):
+        """Replace a deferred stat with preload, a (stat, lstat) tuple or None
+
+        preload is what stat_path() returns, possibly from another thread.
+        """
+        if self._stat is not DEFERRED_STAT:
+            return
+        self._stat = None
+        if preload:
+            self._apply_stat(self._preloaded_stat(preload))
+        else:
+            self.exists = False
+            self._apply_stat(None)
+
+    def _lstat(self):
+        """Returns the stat of the path, or of the target of a link
+
+        Sets is_link and exists accordingly.
+        """
+        path = self.path
+        new_stat = None
+        try:
+            new_stat = lstat(path)
+            self.is_link = new_stat.st_mode & 0o170000 == 0o120000
+            if self.is_link:
+                new_stat = stat(path)
+            self.exists = True
+        except OSError:
+            self.exists = False
+        return new_stat
+
+    def _apply_stat(self, new_stat):
+        """Sets the attributes that are derived from the stat"""
         self.accessible = bool(new_stat)
         mode = new_stat.st_mode if new_stat else 0
 
@@ -338,7 +430,7 @@ class FileSystemObject(  # pylint: disable=too-many-instance-attributes,too-many
         if self.is_link and not self.is_directory:
             self.infostring = '->' + self.infostring
 
-        self.stat = new_stat
+        self._stat = compact_stat(new_stat)
         self.last_load_time = time()
 
     def get_permission_string(self):
@@ -365,16 +457,26 @@ class FileSystemObject(  # pylint: disable=too-many-instance-attributes,too-many
         self.permissions = ''.join(perms)
         return self.permissions
 
-    def load_if_outdated(self):
-        """Calls load() if the currently cached information is outdated"""
+    def load_if_outdated(self, preload=None):
+        """Calls load() if the currently cached information is outdated
+
+        If preload is given, it is a fresh (stat, lstat) tuple like the one
+        accepted by __init__ and is used instead of stat()ing the path again.
+        """
         if not self.loaded:
+            if preload:
+                self.preload = preload
             self.load()
             return True
-        try:
-            real_ctime = stat(self.path).st_ctime
-        except OSError:
-            real_ctime = None
+        if preload:
+            real_ctime = preload[0].st_ctime
+        else:
+            try:
+                real_ctime = stat(self.path).st_ctime
+            except OSError:
+                real_ctime = None
         if not self.stat or self.stat.st_ctime != real_ctime:
+            self.preload = preload
             self.load()
             return True
         return False
@@ -36,6 +36,7 @@ ALLOWED_SETTINGS = {
     'column_ratios': (tuple, list),
     'confirm_on_delete': str,
     'confirm_on_trash': str,
+    'copy_workers': int,
     'dirname_in_tabs': bool,
     'display_size_in_main_column': bool,
     'display_size_in_status_bar': bool,
@@ -58,18 +59,25 @@ ALLOWED_SETTINGS = {
     'line_numbers': str,
     'max_console_history_size': (int, type(None)),
     'max_history_size': (int, type(None)),
+    'max_loaded_directories': int,
+    'max_loaded_entries': int,
     'metadata_deep_search': bool,
     'mouse_enabled': bool,
     'nested_ranger_warning': str,
     'one_indexed': bool,
     'open_all_images': bool,
     'padding_right': bool,
+    'preview_cache_disk': bool,
+    'preview_cache_size': int,
     'preview_directories': bool,
     'preview_files': bool,
     'preview_images': bool,
     'preview_images_method': str,
     'preview_max_size': int,
+    'preview_prefetch': int,
+    'preview_prefetch_workers': int,
     'preview_script': (str, type(None)),
+    'preview_workers': int,
     'relative_current_zero': bool,
     'save_backtick_bookmark': bool,
     'save_console_history': bool,
@@ -85,6 +93,7 @@ ALLOWED_SETTINGS = {
     'sort_reverse': bool,
     'sort': str,
     'sort_unicode': bool,
+    'stat_workers': int,
     'status_bar_on_top': bool,
     'tilde_in_titlebar': bool,
     'unicode_ellipsis': bool,
@@ -96,10 +105,15 @@ ALLOWED_SETTINGS = {
     'vcs_backend_git': str,
     'vcs_backend_hg': str,
     'vcs_backend_svn': str,
+    'vcs_git_ignored': bool,
+    'vcs_git_single_status': bool,
     'vcs_msg_length': int,
+    'vcs_status_cache': bool,
+    'vcs_workers': int,
     'viewmode': str,
     'w3m_delay': float,
     'w3m_offset': int,
+    'watch_directories': bool,
     'wrap_plaintext_previews': bool,
     'wrap_scroll': bool,
     'xterm_alt_key': bool,
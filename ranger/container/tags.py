@@ -6,6 +6,7 @@
 from __future__ import (absolute_import, division, print_function)
 
 import string
+from bisect import bisect_left
 from io import open
 from os.path import exists, abspath, realpath, expanduser, sep
 
@@ -50,6 +51,32 @@ class Tags(FileManagerAware):
                 pass
         self.dump()
 
+    def remove_trees(self, *paths):
+        """Remove the tags of the paths and of everything below them
+
+        The tagged paths are sorted once, so the tags below each path are
+        found with a binary search instead of comparing every tag with every
+        path.
+        """
+        if len(paths) == 0:
+            return
+        self.sync()
+        index = sorted(self.tags)
+        found = []
+        for path in paths:
+            i = bisect_left(index, path)
+            if i < len(index) and index[i] == path:
+                found.append(path)
+            prefix = path.rstrip(sep) + sep
+            i = bisect_left(index, prefix)
+            while i < len(index) and index[i].startswith(prefix):
+                found.append(index[i])
+                i += 1
+        if found:
+            for item in found:
+                self.tags.pop(item, None)
+            self.dump()
+
     def toggle(self, *items, **others):
         if len(items) == 0:
             return
@@ -9,7 +9,6 @@ import codecs
 import os
 import re
 import shlex
-import shutil
 import string
 import tempfile
 from hashlib import sha512
@@ -25,7 +24,7 @@ from ranger import PY3
 from ranger.container.directory import Directory
 from ranger.container.file import File
 from ranger.container.settings import ALLOWED_SETTINGS, ALLOWED_VALUES
-from ranger.core.loader import CommandLoader, CopyLoader
+from ranger.core.loader import CopyLoader, DeleteLoader
 from ranger.core.shared import FileManagerAware, SettingsAware
 from ranger.core.tab import Tab
 from ranger.ext.direction import Direction
@@ -67,7 +66,7 @@ class Actions(  # pylint: disable=too-many-instance-attributes,too-many-public-m
         Reset the filemanager, clearing the directory buffer, reload rifle config
         """
         old_path = self.thisdir.path
-        self.previews = {}
+        self.previews.clear()
         self.garbage_collect(-1)
         self.enter_dir(old_path)
         self.change_mode('normal')
@@ -152,7 +151,8 @@ class Actions(  # pylint: disable=too-many-instance-attributes,too-many-public-m
     def reload_cwd(self):
         """:reload_cwd
 
-        Reload the current working directory.
+        Reload the current working directory and, if it is version controlled,
+        look for changes in its whole repository.
         """
         try:
             cwd = self.thisdir
@@ -161,6 +161,9 @@ class Actions(  # pylint: disable=too-many-instance-attributes,too-many-public-m
         else:
             cwd.unload()
             cwd.load_content()
+            if cwd.vcs and cwd.vcs.track:
+                # Also look for changes in the directories that are not loaded
+                self.ui.vcsthread.process(cwd, walk=True)
 
     def notify(self, obj, duration=4, bad=False, exception=None):
         """:notify <text>
@@ -661,6 +664,18 @@ class Actions(  # pylint: disable=too-many-instance-attributes,too-many-public-m
     def pause_tasks(self):
         self.loader.pause(-1)
 
+    def pager_follow(self):
+        """:pager_follow
+
+        Toggle whether the pager shows what is appended to the current file.
+        """
+        pager = self.ui.get_pager()
+        if pager.follow_path is not None:
+            pager.follow(None)
+        elif self.thisfile and self.thisfile.is_file:
+            if not pager.follow(self.thisfile.path):
+                self.notify("Unable to follow %s" % self.thisfile.relative_path, bad=True)
+
     def pager_close(self):
         if self.ui.pager.visible:
             self.ui.close_pager()
@@ -1051,14 +1066,24 @@ class Actions(  # pylint: disable=too-many-instance-attributes,too-many-public-m
             inode_path = inode_path.encode('utf-8', 'backslashreplace')
         return '{0}.jpg'.format(sha512(inode_path).hexdigest())
 
-    def get_preview(self, fobj, width, height):
+    def get_preview(self, fobj, width, height, prefetch=False):
+        """Return the preview of fobj or None if it isn't loaded yet
+
+        With prefetch, the preview script is run after the previews of the
+        focused file and its PreviewJob is returned, so that it can be
+        cancelled.  Otherwise, the neighbours of fobj are prefetched.
+        """
         # pylint: disable=too-many-return-statements,too-many-statements
+        # pylint: disable=too-many-branches,too-many-locals
         pager = self.ui.get_pager()
         path = fobj.realpath
 
         if not path or not os.path.exists(path):
             return None
 
+        if not prefetch and self.prefetcher is not None:
+            self.prefetcher.prefetch(fobj, width, height)
+
         if not self.settings.preview_script or not self.settings.use_preview_script:
             if PY3:
                 try:
@@ -1120,7 +1145,8 @@ class Actions(  # pylint: disable=too-many-instance-attributes,too-many-public-m
         if 'directimagepreview' in data:
             data['foundpreview'] = True
             data['imagepreview'] = True
-            pager.set_image(path)
+            if not prefetch:
+                pager.set_image(path)
             data['loading'] = False
             return path
 
@@ -1135,23 +1161,46 @@ class Actions(  # pylint: disable=too-many-instance-attributes,too-many-public-m
                 and fobj.stat.st_mtime <= os.path.getmtime(cacheimg)):
             data['foundpreview'] = True
             data['imagepreview'] = True
-            pager.set_image(cacheimg)
+            if not prefetch:
+                pager.set_image(cacheimg)
             data['loading'] = False
             return cacheimg
 
-        def on_after(signal):
-            rcode = signal.process.poll()
-            content = signal.loader.stdout_buffer
+        # Previews of earlier sessions, keyed by everything that changes them
+        try:
+            key = self.previews.make_key(
+                path, stat(path),
+                self.previews.script_hash(self.settings.preview_script, stat_),
+                self.settings.preview_images)
+        except OSError:
+            key = None
+        found = self.previews.load(key, width, height) if key else None
+        if found is not None:
+            size_class, content = found
+            data[size_class] = content
+            data['foundpreview'] = True
+            data['loading'] = False
+            self.previews.update_entry(path)
+            return content
+
+        size_classes = {0: (width, height), 3: (-1, height), 4: (width, -1), 5: (-1, -1)}
+
+        def on_done(job):
+            if job.cancelled:
+                try:
+                    del self.previews[path]
+                except KeyError:
+                    pass
+                return None
+
+            rcode = job.returncode
+            content = job.stdout_buffer
             data['foundpreview'] = True
 
-            if rcode == 0:
-                data[(width, height)] = content
-            elif rcode == 3:
-                data[(-1, height)] = content
-            elif rcode == 4:
-                data[(width, -1)] = content
-            elif rcode == 5:
-                data[(-1, -1)] = content
+            if rcode in size_classes:
+                data[size_classes[rcode]] = content
+                if key:
+                    self.previews.save(key, size_classes[rcode], content)
             elif rcode == 6:
                 data['imagepreview'] = True
             elif rcode == 7:
@@ -1172,7 +1221,10 @@ class Actions(  # pylint: disable=too-many-instance-attributes,too-many-public-m
                 self.ui.browser.need_redraw = True
 
             data['loading'] = False
+            self.previews.update_entry(path)
 
+            if prefetch and not (self.thisfile and self.thisfile.realpath == path):
+                return None
             pager = self.ui.get_pager()
             if self.thisfile and self.thisfile.is_file:
                 if 'imagepreview' in data:
@@ -1186,24 +1238,14 @@ class Actions(  # pylint: disable=too-many-instance-attributes,too-many-public-m
                         pager.wid, pager.hei))
             return None
 
-        def on_destroy(signal):  # pylint: disable=unused-argument
-            try:
-                del self.previews[path]
-            except KeyError:
-                pass
-
-        loadable = CommandLoader(
-            args=[self.settings.preview_script, path, str(width), str(height),
-                  cacheimg, str(self.settings.preview_images)],
-            read=True,
-            silent=True,
-            descr="Getting preview of %s" % path,
+        job = self.preview_executor.submit(
+            path,
+            [self.settings.preview_script, path, str(width), str(height),
+             cacheimg, str(self.settings.preview_images)],
+            on_done,
+            focused=not prefetch,
         )
-        loadable.signal_bind('after', on_after)
-        loadable.signal_bind('destroy', on_destroy)
-        self.loader.add(loadable)
-
-        return None
+        return job if prefetch else None
 
     @staticmethod
     def read_text_file(path, count=None):
@@ -1650,27 +1692,12 @@ class Actions(  # pylint: disable=too-many-instance-attributes,too-many-public-m
         # XXX: warn when deleting mount points/unseen marked files?
         # COMPAT: old command.py use fm.delete() without arguments
         if files is None:
-            files = (fobj.path for fobj in self.thistab.get_selection())
+            files = [fobj.path for fobj in self.thistab.get_selection()]
         self.notify("Deleting {fls}!".format(fls=", ".join(files)))
         files = [os.path.abspath(path) for path in files]
-        for path in files:
-            # Untag the deleted files.
-            for tag in self.fm.tags.tags:
-                if str(tag).startswith(path):
-                    self.fm.tags.remove(tag)
+        self.fm.tags.remove_trees(*files)
         self.copy_buffer = set(fobj for fobj in self.copy_buffer if fobj.path not in files)
-        for path in files:
-            if isdir(path) and not os.path.islink(path):
-                try:
-                    shutil.rmtree(path)
-                except OSError as err:
-                    self.notify(err)
-            else:
-                try:
-                    os.remove(path)
-                except OSError as err:
-                    self.notify(err)
-        self.thistab.ensure_correct_pointer()
+        self.loader.add(DeleteLoader(files))
 
     def mkdir(self, name):
         try:
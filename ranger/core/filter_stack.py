@@ -14,6 +14,7 @@ except ImportError:
 # pylint: enable=invalid-name
 from os.path import abspath
 
+from ranger.core.loader import MimetypeLoader
 from ranger.core.shared import FileManagerAware
 from ranger.ext.hash import hash_chunks
 
@@ -80,9 +81,35 @@ class NameFilter(BaseFilter):
 class MimeFilter(BaseFilter, FileManagerAware):
     def __init__(self, pattern):
         self.regex = re.compile(pattern)
+        self._scheduled = set()
+
+    def _detect(self, fobj):
+        """Returns the cached mime type of the content of fobj or None
+
+        Examining files takes a while, so unknown files are left to the
+        loader, together with their siblings that can't be told by name.  The
+        directory is filtered again once they are examined.
+        """
+        service = self.fm.mimetype_service
+        mimetype = service.cached(fobj.path)
+        if mimetype is not None or fobj.path in self._scheduled:
+            return mimetype
+        paths = [fobj.path]
+        directory = self.fm.directories.get(fobj.dirname)
+        if directory is not None and directory.files_all:
+            paths.extend(
+                sibling.path for sibling in directory.files_all
+                if sibling.path != fobj.path and sibling.path not in self._scheduled
+                and service.guess_type(sibling.relative_path) is None
+            )
+        self._scheduled.update(paths)
+        self.fm.loader.add(MimetypeLoader(paths, directory))
+        return None
 
     def __call__(self, fobj):
         mimetype, _ = self.fm.mimetypes.guess_type(fobj.relative_path)
+        if mimetype is None:
+            mimetype = self._detect(fobj)
         if mimetype is None:
             return False
         return self.regex.search(mimetype)
@@ -15,6 +15,7 @@ import stat
 import sys
 from collections import deque
 from io import open
+from logging import getLogger
 from subprocess import Popen
 from time import time
 
@@ -26,15 +27,24 @@ from ranger.container.tags import Tags, TagsDummy
 from ranger.core.actions import Actions
 from ranger.core.loader import Loader
 from ranger.core.metadata import MetadataManager
+from ranger.core.prefetcher import PreviewPrefetcher
+from ranger.core.preview_executor import PreviewExecutor
 from ranger.core.runner import Runner
 from ranger.core.tab import Tab
+from ranger.core.watcher import DirectoryWatcher
 from ranger.ext import logutils
+from ranger.ext.get_executables import set_index_path
+from ranger.ext.human_readable import human_readable
 from ranger.ext.img_display import get_image_displayer
 from ranger.ext.posix_signals import call_signal_handler, delay_signal
+from ranger.ext.mimetype_service import MimetypeService
+from ranger.ext.preview_cache import PreviewCache
 from ranger.ext.rifle import Rifle
 from ranger.ext.signals import SignalDispatcher
 from ranger.gui.ui import UI
 
+LOG = getLogger(__name__)
+
 
 class ProcessSet(object):
 
@@ -97,7 +107,9 @@ class FM(Actions,  # pylint: disable=too-many-instance-attributes
         self.tabs = {}
         self.tags = tags
         self.restorable_tabs = deque([], ranger.MAX_RESTORABLE_TABS)
-        self.previews = {}
+        self.previews = PreviewCache()
+        self.prefetcher = None
+        self.preview_executor = None
         self.default_linemodes = deque()
         self.loader = Loader()
         self.copy_buffer = set()
@@ -108,6 +120,7 @@ class FM(Actions,  # pylint: disable=too-many-instance-attributes
         self.rifle = None
         self.thistab = None
         self.zombies = ProcessSet()
+        self.watcher = None
 
         try:
             self.username = pwd.getpwuid(os.geteuid()).pw_name
@@ -116,10 +129,11 @@ class FM(Actions,  # pylint: disable=too-many-instance-attributes
         self.hostname = socket.gethostname()
         self.home_path = os.path.expanduser('~')
 
+        extra_files = [self.relpath('data/mime.types'), os.path.expanduser("~/.mime.types")]
         if not mimetypes.inited:
-            extra_files = [self.relpath('data/mime.types'), os.path.expanduser("~/.mime.types")]
             mimetypes.init(mimetypes.knownfiles + extra_files)
         self.mimetypes = mimetypes
+        self.mimetype_service = MimetypeService(extra_files)
 
     def initialize(self):  # pylint: disable=too-many-statements
         """If ui/bookmarks are None, they will be initialized here."""
@@ -139,6 +153,9 @@ class FM(Actions,  # pylint: disable=too-many-instance-attributes
             rifleconf = self.relpath('config/rifle.conf')
         self.rifle = Rifle(rifleconf)
         self.rifle.reload_config()
+        self.mimetype_service.cache_path = os.path.join(ranger.args.cachedir, 'mimetypes.json')
+        self.rifle.mimetype_service = self.mimetype_service
+        set_index_path(os.path.join(ranger.args.cachedir, 'executables.json'))
 
         def set_image_displayer():
             if self.image_displayer:
@@ -153,6 +170,17 @@ class FM(Actions,  # pylint: disable=too-many-instance-attributes
             lambda signal: signal.fm.previews.clear(),
         )
 
+        self._set_preview_cache()
+        for option in ('preview_cache_size', 'preview_cache_disk'):
+            self.settings.signal_bind('setopt.' + option, self._set_preview_cache,
+                                      priority=settings.SIGNAL_PRIORITY_AFTER_SYNC)
+        self.preview_executor = PreviewExecutor(max(1, self.settings.preview_workers))
+        self.settings.signal_bind(
+            'setopt.preview_workers',
+            lambda signal: setattr(signal.fm.preview_executor, 'workers', max(1, signal.value)),
+        )
+        self.prefetcher = PreviewPrefetcher()
+
         if ranger.args.clean:
             self.tags = TagsDummy("")
         elif self.tags is None:
@@ -288,6 +316,25 @@ class FM(Actions,  # pylint: disable=too-many-instance-attributes
             self.notify(text, bad=True)
         self.run = Runner(ui=self.ui, logfunc=mylogfunc, fm=self, zombies=self.zombies)
 
+        def set_watcher():
+            if self.settings.watch_directories:
+                if self.watcher is None:
+                    self.watcher = DirectoryWatcher()
+                    for directory in self.directories.values():
+                        if directory.content_loaded:
+                            self.watcher.watch(directory)
+            elif self.watcher is not None:
+                self.watcher.close()
+                self.watcher = None
+        set_watcher()
+        self.settings.signal_bind('setopt.watch_directories', set_watcher,
+                                  priority=settings.SIGNAL_PRIORITY_AFTER_SYNC)
+
+        def watch_loaded_directory(sig):
+            if self.watcher is not None:
+                self.watcher.watch(sig.directory)
+        self.signal_bind('finished_loading_dir', watch_loaded_directory)
+
         self.settings.signal_bind(
             'setopt.metadata_deep_search',
             lambda signal: setattr(signal.fm.metadata, 'deep_search', signal.value)
@@ -297,6 +344,14 @@ class FM(Actions,  # pylint: disable=too-many-instance-attributes
             lambda signal: signal.fm.bookmarks.enable_saving_backtick_bookmark(signal.value)
         )
 
+    def _set_preview_cache(self):
+        """Apply the preview_cache_* settings to the preview cache"""
+        self.previews.max_bytes = self.settings.preview_cache_size * 1024 * 1024
+        if self.settings.preview_cache_disk:
+            self.previews.directory = os.path.join(ranger.args.cachedir, 'previews')
+        else:
+            self.previews.directory = None
+
     def destroy(self):
         debug = ranger.args.debug
         if self.ui:
@@ -311,6 +366,13 @@ class FM(Actions,  # pylint: disable=too-many-instance-attributes
             except Exception:  # pylint: disable=broad-except
                 if debug:
                     raise
+        if self.watcher:
+            self.watcher.close()
+            self.watcher = None
+        if self.preview_executor:
+            self.preview_executor.destroy()
+        self.mimetype_service.save()
+        self.previews.prune()
 
     @staticmethod
     def get_log():
@@ -477,20 +539,99 @@ class FM(Actions,  # pylint: disable=too-many-instance-attributes
                         or any(value in tab.pathway for tab in self.tabs.values()):
                     continue
             del self.directories[key]
+            if self.watcher is not None:
+                self.watcher.unwatch(value)
             if value.is_directory:
                 value.files = None
         self.settings.signal_garbage_collect()
         self.signal_garbage_collect()
 
+    def _directories_in_use(self):
+        """Returns the directories that must stay loaded"""
+        in_use = set()
+        for tab in self.tabs.values():
+            in_use.update(tab.pathway)
+            if tab.thisdir is not None:
+                in_use.add(tab.thisdir)
+            if tab.thisfile is not None and tab.thisfile.is_directory:
+                in_use.add(tab.thisfile)
+        for directory in self.directories.values():
+            if directory.load_generator is not None or directory.marked_items:
+                in_use.add(directory)
+        return in_use
+
+    def unload_directories(self, max_directories=None, max_entries=None):
+        """Unload the least recently used directories to limit memory usage
+
+        Directories are unloaded until no more than max_directories of them
+        with no more than max_entries entries in total are loaded.  They
+        default to the settings max_loaded_directories and
+        max_loaded_entries, a value of 0 means no limit.
+
+        Directories on the pathway of a tab, those that are being loaded
+        or have marked items are never unloaded.  Unloaded directories are
+        also removed from fm.directories, unless a loaded parent directory
+        still lists them.
+        """
+        if max_directories is None:
+            max_directories = self.settings.max_loaded_directories
+        if max_entries is None:
+            max_entries = self.settings.max_loaded_entries
+
+        loaded = [directory for directory in self.directories.values()
+                  if directory.files_all is not None]
+        n_directories = len(loaded)
+        n_entries = sum(len(directory.files_all) for directory in loaded)
+        if (not max_directories or n_directories <= max_directories) \
+                and (not max_entries or n_entries <= max_entries):
+            return 0
+
+        in_use = self._directories_in_use()
+        candidates = sorted((directory for directory in loaded if directory not in in_use),
+                            key=lambda directory: directory.last_used)
+        freed_directories = freed_entries = freed_bytes = 0
+        for directory in candidates:
+            if (not max_directories or n_directories <= max_directories) \
+                    and (not max_entries or n_entries <= max_entries):
+                break
+            entries = len(directory.files_all)
+            freed_bytes += directory.estimate_content_size()
+            directory.unload_content()
+            if self.watcher is not None:
+                self.watcher.unwatch(directory)
+            n_directories -= 1
+            n_entries -= entries
+            freed_directories += 1
+            freed_entries += entries
+
+        # Drop the directory objects that nothing refers to anymore.  VCS
+        # roots stay since the Vcs objects of their subdirectories use them.
+        for key in tuple(self.directories):
+            directory = self.directories[key]
+            if directory.files_all is not None or directory in in_use \
+                    or (directory.vcs and directory.vcs.is_root):
+                continue
+            parent = self.directories.get(os.path.dirname(key))
+            if parent is None or parent.files_all is None:
+                del self.directories[key]
+        self.settings.signal_garbage_collect()
+        self.signal_garbage_collect()
+
+        if freed_directories:
+            LOG.info("Unloaded %d directories with %d entries, freeing about %s",
+                     freed_directories, freed_entries, human_readable(freed_bytes))
+        return freed_directories
+
     def loop(self):
         """The main loop of ranger.
 
         It consists of:
         1. reloading bookmarks if outdated
-        2. letting the loader work
+        2. handling the events of the directory watcher and
+           letting the loader work
         3. drawing and finalizing ui
         4. reading and handling user input
-        5. after X loops: collecting unused directory objects
+        5. after X loops: unloading the least recently used directories
         """
 
         self.enter_dir(self.thistab.path)
@@ -499,21 +640,36 @@ class FM(Actions,  # pylint: disable=too-many-instance-attributes
         ui = self.ui
         throbber = ui.throbber
         loader = self.loader
+        preview_executor = self.preview_executor
         zombies = self.zombies
 
         ranger.api.hook_ready(self)
 
+        gc_tick = 0
+
         try:  # pylint: disable=too-many-nested-blocks
             while True:
+                if self.watcher is not None:
+                    self.watcher.poll()
+
                 loader.work()
+                # Wait for previews only while the loader has nothing to do,
+                # but not for longer than it takes to type a key
+                preview_executor.work(
+                    timeout=0 if loader.has_work() else loader.seconds_of_work_time,
+                    wake_fds=(sys.stdin.fileno(),))
                 if loader.has_work():
                     throbber(loader.status)
+                elif preview_executor.has_work():
+                    loader.rotate()
+                    throbber(loader.status)
                 else:
                     throbber(remove=True)
 
                 ui.redraw()
 
-                ui.set_load_mode(not loader.paused and loader.has_work())
+                ui.set_load_mode((not loader.paused and loader.has_work())
+                                 or preview_executor.has_work())
 
                 ui.draw_images()
 
@@ -524,10 +680,10 @@ class FM(Actions,  # pylint: disable=too-many-instance-attributes
                         if zombie.poll() is not None:
                             zombies.remove(zombie)
 
-                # gc_tick += 1
-                # if gc_tick > ranger.TICKS_BEFORE_COLLECTING_GARBAGE:
-                    # gc_tick = 0
-                    # self.garbage_collect(ranger.TIME_BEFORE_FILE_BECOMES_GARBAGE)
+                gc_tick += 1
+                if gc_tick > ranger.TICKS_BEFORE_COLLECTING_GARBAGE:
+                    gc_tick = 0
+                    self.unload_directories()
 
         except KeyboardInterrupt:
             # this only happens in --debug mode. By default, interrupts
@@ -13,6 +13,17 @@ from subprocess import Popen, PIPE
 from time import time, sleep
 import signal
 
+# Python 2 compatibility
+try:
+    import queue
+except ImportError:
+    import Queue as queue  # pylint: disable=import-error
+
+try:
+    from os import scandir
+except ImportError:  # Python < 3.5
+    scandir = None  # pylint: disable=invalid-name
+
 try:
     import chardet  # pylint: disable=import-error
     HAVE_CHARDET = True
@@ -22,6 +33,7 @@ except ImportError:
 from ranger import PY3
 from ranger.core.shared import FileManagerAware
 from ranger.ext.human_readable import human_readable
+from ranger.ext.mimetype_service import FILE_BATCH_SIZE
 from ranger.ext.safe_path import get_safe_path
 from ranger.ext.signals import SignalDispatcher
 
@@ -51,6 +63,22 @@ class Loadable(object):
         pass
 
 
+# With copy_workers, files up to this size are copied as a whole by a worker
+# thread, bigger ones are copied in chunks by the loader itself
+SMALL_FILE_SIZE = 4 * 1024 * 1024
+# How many files may wait for a worker per worker
+PENDING_FILES_PER_WORKER = 4
+
+
+def _copy_file(  # pylint: disable=too-many-positional-arguments
+        shutil_g, src, dst, overwrite, make_safe_path, progress):
+    """Copy a file or symlink completely, returns the given progress"""
+    for _ in shutil_g.copy2(src, dst, overwrite=overwrite, symlinks=True,
+                            make_safe_path=make_safe_path):
+        pass
+    return progress
+
+
 class CopyLoader(Loadable, FileManagerAware):  # pylint: disable=too-many-instance-attributes
     progressbar_supported = True
 
@@ -69,27 +97,47 @@ class CopyLoader(Loadable, FileManagerAware):  # pylint: disable=too-many-instan
         self.overwrite = overwrite
         self.make_safe_path = make_safe_path
         self.percent = 0
+        self._pool = None
+        self._results = None
+        self._pending = 0
+        self._done = 0
+        self._size = 1
+        self._errors = 0
         if self.copy_buffer:
             self.one_file = self.copy_buffer[0]
         Loadable.__init__(self, self.generate(), 'Calculating size...')
 
-    def _calculate_size(self, step):
+    def _calculate_sizes(self, step):
+        """Returns the size of the copy buffer and the sizes of its items
+        with every file rounded up to a multiple of step, from a single walk"""
         from os.path import join
         size = 0
-        stack = [fobj.path for fobj in self.copy_buffer]
-        while stack:
-            fname = stack.pop()
-            if os.path.islink(fname):
-                continue
-            if os.path.isdir(fname):
-                stack.extend([join(fname, item) for item in os.listdir(fname)])
-            else:
-                try:
-                    fstat = os.stat(fname)
-                except OSError:
+        rounded_sizes = []
+        for fobj in self.copy_buffer:
+            rounded_size = 0
+            stack = [fobj.path]
+            while stack:
+                fname = stack.pop()
+                if os.path.islink(fname):
                     continue
-                size += max(step, math.ceil(fstat.st_size / step) * step)
-        return size
+                if os.path.isdir(fname):
+                    try:
+                        stack.extend([join(fname, item) for item in os.listdir(fname)])
+                    except OSError:
+                        continue
+                else:
+                    try:
+                        fstat = os.stat(fname)
+                    except OSError:
+                        continue
+                    size += fstat.st_size
+                    rounded_size += max(step, math.ceil(fstat.st_size / step) * step)
+            rounded_sizes.append(rounded_size)
+        return size, rounded_sizes
+
+    def _set_percent(self, ticks=0):
+        """Shows the progress of the finished ticks and ticks more"""
+        self.percent = ((self._done + ticks) / self._size) * 100.
 
     def generate(self):
         if not self.copy_buffer:
@@ -97,62 +145,390 @@ class CopyLoader(Loadable, FileManagerAware):  # pylint: disable=too-many-instan
 
         from ranger.ext import shutil_generatorized as shutil_g
         # TODO: Don't calculate size when renaming (needs detection)
-        bytes_per_tick = shutil_g.BLOCK_SIZE
-        size = max(1, self._calculate_size(bytes_per_tick))
-        size_str = " (" + human_readable(self._calculate_size(1)) + ")"
-        done = 0
+        # Leave time for more than one chunk in each slice of the loader
+        chunk_time = self.fm.loader.seconds_of_work_time / 3
+        real_size, sizes = self._calculate_sizes(shutil_g.BLOCK_SIZE)
+        self._size = max(1, sum(sizes))
+        size_str = " (" + human_readable(real_size) + ")"
+        workers = self.fm.settings.copy_workers
+        if workers > 1:
+            from ranger.ext.worker_pool import WorkerPool
+            self._pool = WorkerPool(workers, name='copy')
+            self._results = queue.Queue()
         if self.do_cut:
             self.original_copy_buffer.clear()
             if len(self.copy_buffer) == 1:
                 self.description = "moving: " + self.one_file.path + size_str
             else:
                 self.description = "moving files from: " + self.one_file.dirname + size_str
-            for fobj in self.copy_buffer:
-                for path in self.fm.tags.tags:
-                    if path == fobj.path or str(path).startswith(fobj.path):
-                        tag = self.fm.tags.tags[path]
-                        self.fm.tags.remove(path)
-                        new_path = path.replace(
-                            fobj.path,
-                            os.path.join(self.original_path, fobj.basename))
-                        self.fm.tags.tags[new_path] = tag
-                        self.fm.tags.dump()
-                n = 0
-                for n in shutil_g.move(src=fobj.path, dst=self.original_path,
-                                       overwrite=self.overwrite,
-                                       make_safe_path=self.make_safe_path):
-                    self.percent = ((done + n) / size) * 100.
-                    yield
-                done += n
+            steps = self._move(shutil_g, sizes, chunk_time)
         else:
             if len(self.copy_buffer) == 1:
                 self.description = "copying: " + self.one_file.path + size_str
             else:
                 self.description = "copying files from: " + self.one_file.dirname + size_str
-            for fobj in self.copy_buffer:
-                if os.path.isdir(fobj.path) and not os.path.islink(fobj.path):
-                    n = 0
-                    for n in shutil_g.copytree(
-                            src=fobj.path,
-                            dst=os.path.join(self.original_path, fobj.basename),
-                            symlinks=True,
-                            overwrite=self.overwrite,
-                            make_safe_path=self.make_safe_path,
-                    ):
-                        self.percent = ((done + n) / size) * 100.
-                        yield
-                    done += n
-                else:
-                    n = 0
-                    for n in shutil_g.copy2(fobj.path, self.original_path,
-                                            symlinks=True, overwrite=self.overwrite,
-                                            make_safe_path=self.make_safe_path):
-                        self.percent = ((done + n) / size) * 100.
-                        yield
-                    done += n
+            steps = self._copy(shutil_g, sizes, chunk_time)
+        for _ in steps:
+            yield
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
         cwd = self.fm.get_directory(self.original_path)
         cwd.load_content()
 
+    def _move_tags(self, fobj):
+        for path in self.fm.tags.tags:
+            if path == fobj.path or str(path).startswith(fobj.path):
+                tag = self.fm.tags.tags[path]
+                self.fm.tags.remove(path)
+                new_path = path.replace(
+                    fobj.path,
+                    os.path.join(self.original_path, fobj.basename))
+                self.fm.tags.tags[new_path] = tag
+                self.fm.tags.dump()
+
+    def _move(self, shutil_g, sizes, chunk_time):
+        for fobj, size in zip(self.copy_buffer, sizes):
+            self._move_tags(fobj)
+            done = self._done
+            if self._pool is not None and os.path.isdir(fobj.path) \
+                    and not os.path.islink(fobj.path):
+                try:
+                    self._rename(fobj)
+                except OSError as ex:
+                    if ex.errno != errno.EXDEV:
+                        self._report_error(ex)
+                        self._done = done + size
+                        continue
+                    # Copy across file systems
+                    for _ in self._copy_in_pool(shutil_g, fobj, chunk_time):
+                        yield
+                    continue
+                else:
+                    self._done = done + size
+                    self._set_percent()
+                    yield
+                    continue
+            n = 0
+            for n in shutil_g.move(src=fobj.path, dst=self.original_path,
+                                   overwrite=self.overwrite,
+                                   make_safe_path=self.make_safe_path,
+                                   chunk_time=chunk_time):
+                self._set_percent(n)
+                yield
+            # Renaming within a file system doesn't report progress
+            self._done = done + max(n, size)
+
+    def _copy(self, shutil_g, sizes, chunk_time):
+        for fobj, size in zip(self.copy_buffer, sizes):
+            if self._pool is not None:
+                for _ in self._copy_in_pool(shutil_g, fobj, chunk_time):
+                    yield
+                continue
+            if os.path.isdir(fobj.path) and not os.path.islink(fobj.path):
+                copying = shutil_g.copytree(
+                    src=fobj.path,
+                    dst=os.path.join(self.original_path, fobj.basename),
+                    symlinks=True,
+                    overwrite=self.overwrite,
+                    make_safe_path=self.make_safe_path,
+                    chunk_time=chunk_time,
+                )
+            else:
+                copying = shutil_g.copy2(fobj.path, self.original_path,
+                                         symlinks=True, overwrite=self.overwrite,
+                                         make_safe_path=self.make_safe_path,
+                                         chunk_time=chunk_time)
+            n = 0
+            for n in copying:
+                self._set_percent(n)
+                yield
+            self._done += max(n, size)
+
+    def _rename(self, fobj):
+        dst = os.path.join(self.original_path, fobj.basename)
+        if not self.overwrite:
+            dst = self.make_safe_path(dst)
+        os.rename(fobj.path, dst)
+
+    def _reserve(self, dst):
+        """Create an empty placeholder for a file at dst or a safe path
+
+        Returns the path.  Other items with the same basename can't get the
+        same path then, even if the file is copied later by a worker.
+        """
+        while True:
+            dst = self.make_safe_path(dst)
+            try:
+                os.close(os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL))
+            except OSError as ex:
+                if ex.errno != errno.EEXIST:
+                    raise
+                continue
+            return dst
+
+    def _copy_targets(self, fobj):
+        """Return the (source, destination) pairs of fobj and the overwrite flag
+
+        The destination of a file is reserved right away unless overwriting,
+        the copy replaces the placeholder.
+        """
+        from os.path import join
+        dst = join(self.original_path, fobj.basename)
+        if not os.path.isdir(fobj.path) or os.path.islink(fobj.path):
+            if self.overwrite:
+                return [(fobj.path, dst)], True
+            return [(fobj.path, self._reserve(dst))], True
+        if not self.overwrite:
+            dst = self.make_safe_path(dst)
+        return self._walk_copy_tree(fobj.path, dst), self.overwrite
+
+    def _copy_in_pool(self, shutil_g, fobj, chunk_time):
+        """Copy fobj into the destination, small files in the worker pool
+
+        The directories are created right away, the files smaller than
+        SMALL_FILE_SIZE are handed to the workers and the other files are
+        copied in chunks between collecting the results of the workers.
+        Errors are reported with fm.notify.  When moving, the source is
+        removed if everything was copied.
+        """
+        errors = self._errors
+        step = shutil_g.BLOCK_SIZE
+        try:
+            files, overwrite = self._copy_targets(fobj)
+        except OSError as ex:
+            self._report_error(ex)
+            return
+        directories = []
+
+        for src, dst in files:
+            if src is None:
+                # A directory that was created, fix its stat info at the end
+                directories.append(dst)
+                continue
+            try:
+                file_size = os.lstat(src).st_size
+            except OSError as ex:
+                self._report_error(ex)
+                continue
+            if os.path.islink(src):
+                # Symlinks are not part of the size, see _calculate_sizes
+                ticks = 0
+            else:
+                ticks = max(step, math.ceil(file_size / step) * step)
+            if file_size < SMALL_FILE_SIZE or os.path.islink(src):
+                while self._pending >= self._pool.workers * PENDING_FILES_PER_WORKER:
+                    self._collect(timeout=0.005)
+                    self._set_percent()
+                    yield
+                self._pool.submit(self._results, _copy_file, shutil_g, src, dst,
+                                  overwrite, self.make_safe_path, ticks)
+                self._pending += 1
+                continue
+            n = 0
+            try:
+                for n in shutil_g.copy2(src, dst, overwrite=overwrite, symlinks=True,
+                                        make_safe_path=self.make_safe_path,
+                                        chunk_time=chunk_time):
+                    self._collect()
+                    self._set_percent(n)
+                    yield
+            except (EnvironmentError, shutil_g.Error) as ex:
+                self._report_error(ex)
+            self._done += ticks
+
+        while self._pending:
+            self._collect(timeout=0.005)
+            self._set_percent()
+            yield
+        for (src, dst) in reversed(directories):
+            try:
+                shutil_g.copystat(src, dst)
+            except OSError:
+                pass
+        if self.do_cut and self._errors == errors:
+            shutil_g.rmtree(fobj.path)
+
+    def _walk_copy_tree(self, src, dst):
+        """Creates the directories of the tree src in dst
+
+        Yields (None, (srcdir, dstdir)) for every directory after creating it
+        and (src, dst) for the files and symlinks in them.
+        """
+        from os.path import join
+        stack = [(src, dst)]
+        while stack:
+            srcdir, dstdir = stack.pop()
+            try:
+                names = os.listdir(srcdir)
+                try:
+                    os.makedirs(dstdir)
+                except OSError:
+                    if not self.overwrite:
+                        dstdir = self.make_safe_path(dstdir)
+                        os.makedirs(dstdir)
+            except OSError as ex:
+                self._report_error(ex)
+                continue
+            yield None, (srcdir, dstdir)
+            for name in names:
+                srcname, dstname = join(srcdir, name), join(dstdir, name)
+                if os.path.isdir(srcname) and not os.path.islink(srcname):
+                    stack.append((srcname, dstname))
+                else:
+                    yield srcname, dstname
+
+    def _collect(self, timeout=None):
+        """Collect the results of the workers, waits up to timeout seconds"""
+        while self._pending:
+            try:
+                if timeout is None:
+                    ticks, exception = self._results.get_nowait()
+                else:
+                    ticks, exception = self._results.get(timeout=timeout)
+                    timeout = None
+            except queue.Empty:
+                return
+            self._pending -= 1
+            if exception is not None:
+                self._report_error(exception)
+            else:
+                self._done += ticks
+
+    def _report_error(self, exception):
+        self._errors += 1
+        self.fm.notify(exception, bad=True)
+
+    def destroy(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+def _list_entries(path):
+    """Returns (path, is_directory) of every entry in the directory path
+
+    Symlinks to directories don't count as directories.
+    """
+    if scandir is None:
+        paths = [os.path.join(path, name) for name in os.listdir(path)]
+        return [(entry, os.path.isdir(entry) and not os.path.islink(entry))
+                for entry in paths]
+    return [(entry.path, entry.is_dir(follow_symlinks=False)) for entry in scandir(path)]
+
+
+class DeleteLoader(Loadable, FileManagerAware):  # pylint: disable=too-many-instance-attributes
+    """Delete files and directory trees with the loader.
+
+    Directories are walked and emptied one entry at a time, so deleting a
+    huge tree doesn't freeze ranger and can be paused or cancelled in the
+    task view.  Whatever was deleted before cancelling stays deleted.
+    """
+    progressbar_supported = True
+
+    def __init__(self, paths):
+        self.paths = tuple(paths)
+        self.entries_total = 0
+        self.entries_deleted = 0
+        self.bytes_deleted = 0
+        if len(self.paths) == 1:
+            self.target = "deleting: " + self.paths[0]
+        else:
+            self.target = "deleting files from: " + os.path.dirname(self.paths[0])
+        Loadable.__init__(self, self.generate(), 'Counting files...')
+
+    def _walk(self, top):
+        """Yields the paths below the directory top, children first
+
+        Yields (path, False) for files and (path, True) for directories.
+        Each directory is listed once, right before it is descended into.
+        """
+        stack = [(top, iter(_list_entries(top)))]
+        while stack:
+            path, entries = stack[-1]
+            for entry_path, is_directory in entries:
+                if is_directory:
+                    stack.append((entry_path, iter(_list_entries(entry_path))))
+                    break
+                yield entry_path, False
+            else:
+                stack.pop()
+                yield path, True
+
+    def _count(self, path):
+        if os.path.isdir(path) and not os.path.islink(path):
+            for _ in self._walk(path):
+                self.entries_total += 1
+                yield
+        else:
+            self.entries_total += 1
+
+    def _delete(self, path):
+        if os.path.isdir(path) and not os.path.islink(path):
+            entries = self._walk(path)
+        else:
+            entries = [(path, False)]
+        for entry_path, is_directory in entries:
+            if is_directory:
+                os.rmdir(entry_path)
+            else:
+                size = os.lstat(entry_path).st_size
+                os.remove(entry_path)
+                self.bytes_deleted += size
+            self.entries_deleted += 1
+            # Entries created since they were counted are deleted too
+            self.entries_total = max(self.entries_total, self.entries_deleted)
+            self.percent = 100 * self.entries_deleted / max(1, self.entries_total)
+            if self.entries_deleted % 100 == 0:
+                self._update_description()
+            yield
+
+    def _update_description(self):
+        self.description = "{0} ({1}/{2} files, {3})".format(
+            self.target, self.entries_deleted, self.entries_total,
+            human_readable(self.bytes_deleted))
+
+    def generate(self):
+        for path in self.paths:
+            try:
+                for _ in self._count(path):
+                    yield
+            except OSError:
+                pass  # Reported when deleting
+        self._update_description()
+
+        for path in self.paths:
+            try:
+                for _ in self._delete(path):
+                    yield
+            except OSError as err:
+                self.fm.notify(err, bad=True)
+        self.fm.thistab.ensure_correct_pointer()
+
+
+class MimetypeLoader(Loadable, FileManagerAware):
+    """Detect the mime types of the content of files with the loader.
+
+    The files are examined one batch for "file" at a time, so ranger stays
+    responsive.  Afterwards, the directory is filtered again with the mime
+    types in the cache.
+    """
+    progressbar_supported = True
+
+    def __init__(self, paths, directory=None):
+        self.paths = list(paths)
+        self.directory = directory
+        Loadable.__init__(self, self.generate(), 'Detecting mime types...')
+
+    def generate(self):
+        service = self.fm.mimetype_service
+        for i in range(0, len(self.paths), FILE_BATCH_SIZE):
+            service.detect_many(self.paths[i:i + FILE_BATCH_SIZE])
+            self.percent = 100 * min(len(self.paths), i + FILE_BATCH_SIZE) / len(self.paths)
+            yield
+        if self.directory is not None:
+            self.directory.refilter()
+
 
 class CommandLoader(  # pylint: disable=too-many-instance-attributes
         Loadable, SignalDispatcher, FileManagerAware):
@@ -265,6 +641,10 @@ class CommandLoader(  # pylint: disable=too-many-instance-attributes
 
     def pause(self):
         if not self.finished and not self.paused:
+            if self.process is None:
+                # Not started yet, nothing to stop
+                Loadable.pause(self)
+                return
             if self.kill_on_pause:
                 self.finished = True
                 try:
@@ -283,10 +663,11 @@ class CommandLoader(  # pylint: disable=too-many-instance-attributes
 
     def unpause(self):
         if not self.finished and self.paused:
-            try:
-                self.process.send_signal(signal.SIGCONT)
-            except OSError:
-                pass
+            if self.process is not None:
+                try:
+                    self.process.send_signal(signal.SIGCONT)
+                except OSError:
+                    pass
             Loadable.unpause(self)
             self.signal_emit('unpause', process=self.process, loader=self)
 
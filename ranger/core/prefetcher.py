@@ -0,0 +1,140 @@
+# This file is part of ranger, the console file manager.
+# License: GNU GPL version 3, see the file "AUTHORS" for details.
+
+"""Runs the preview script for the neighbours of the focused file in advance.
+
+Whenever the preview of the focused file is requested, the PreviewPrefetcher
+requests the previews of the next `preview_prefetch` files in the direction
+in which the cursor moved last, or of the files on both sides if it didn't
+move within the directory.  Prefetched previews are queued in the preview
+executor behind the focused preview, and no more than
+`preview_prefetch_workers` of them are queued or running at once.  When the
+cursor moves, prefetches that are no longer next to it are cancelled, and a
+prefetch of the newly focused file becomes the focused preview.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+from collections import deque
+
+from ranger.core.preview_executor import PreviewJob
+from ranger.core.shared import FileManagerAware
+
+
+def neighbours(files, index, direction, count):
+    """Return up to count files next to files[index] in direction
+
+    Without a direction, count files on each side are returned, nearest
+    first.
+
+    >>> neighbours('abcdefg', 3, 1, 2)
+    ['e', 'f']
+    >>> neighbours('abcdefg', 1, -1, 2)
+    ['a']
+    >>> neighbours('abcdefg', 3, 0, 2)
+    ['e', 'c', 'f', 'b']
+    """
+    after = list(files[index + 1:index + 1 + count])
+    before = list(reversed(files[max(0, index - count):index]))
+    if direction > 0:
+        return after
+    if direction < 0:
+        return before
+    result = []
+    for i in range(count):
+        result.extend(side[i] for side in (after, before) if i < len(side))
+    return result
+
+
+class PreviewPrefetcher(FileManagerAware):
+    """Keeps the previews of the files around the cursor loading"""
+
+    def __init__(self):
+        self.jobs = {}  # real path -> PreviewJob
+        self.pending = deque()  # files waiting until a prefetch is done
+        self.size = None
+        self._directory = None
+        self._index = None
+        self._focused = None
+        self.fm.signal_bind('move', self._on_move)
+        self.fm.signal_bind('preview.done', self._on_preview_done)
+
+    def _locate(self, fobj):
+        """Return the index of fobj in the current directory or None"""
+        directory = self.fm.thisdir
+        if directory is None or not directory.files:
+            return None
+        files = directory.files
+        index = directory.pointer
+        if 0 <= index < len(files) and files[index] is fobj:
+            return index
+        try:
+            return files.index(fobj)
+        except ValueError:
+            return None
+
+    def _neighbours(self, index, direction):
+        return [fobj for fobj in neighbours(self.fm.thisdir.files, index, direction,
+                                            self.fm.settings.preview_prefetch)
+                if fobj.is_file and fobj.has_preview()]
+
+    def prefetch(self, fobj, width, height):
+        """Prefetch the previews of the neighbours of the focused file fobj"""
+        if fobj is self._focused and self.size == (width, height):
+            return
+        settings = self.fm.settings
+        if settings.preview_prefetch <= 0 or not settings.preview_script \
+                or not settings.use_preview_script:
+            return
+        index = self._locate(fobj)
+        if index is None:
+            return
+        direction = 0
+        if self._directory is self.fm.thisdir and self._index is not None:
+            direction = index - self._index
+        self._directory, self._index = self.fm.thisdir, index
+        self._focused, self.size = fobj, (width, height)
+
+        files = self._neighbours(index, direction)
+        self.cancel(keep=set(neighbour.realpath for neighbour in files))
+        self.pending = deque(neighbour for neighbour in files
+                             if neighbour.realpath not in self.jobs)
+        self._submit()
+
+    def _submit(self):
+        workers = max(1, self.fm.settings.preview_prefetch_workers)
+        while self.pending and len(self.jobs) < workers:
+            fobj = self.pending.popleft()
+            result = self.fm.get_preview(fobj, self.size[0], self.size[1], prefetch=True)
+            if isinstance(result, PreviewJob) and not result.end_time:
+                self.jobs[fobj.realpath] = result
+
+    def cancel(self, keep=()):
+        """Cancel the prefetches of all files except those in keep"""
+        for path in list(self.jobs):
+            if path not in keep:
+                self.fm.preview_executor.cancel(self.jobs.pop(path))
+        self.pending = deque(fobj for fobj in self.pending if fobj.realpath in keep)
+
+    def _on_move(self, signal):
+        if signal.tab is not self.fm.thistab or signal.new is None:
+            return
+        job = self.jobs.pop(signal.new.realpath, None)
+        if job is not None:
+            self.fm.preview_executor.promote(job)
+        index = self._locate(signal.new)
+        if index is None:
+            self.cancel()
+        else:
+            self.cancel(keep=set(fobj.realpath for fobj in self._neighbours(index, 0)))
+
+    def _on_preview_done(self, signal):
+        if self.jobs.get(signal.job.key) is signal.job:
+            del self.jobs[signal.job.key]
+            self._submit()
+
+
+if __name__ == '__main__':
+    import doctest
+    import sys
+    sys.exit(doctest.testmod()[0])
@@ -0,0 +1,263 @@
+# This file is part of ranger, the console file manager.
+# License: GNU GPL version 3, see the file "AUTHORS" for details.
+
+"""Runs preview scripts in parallel, separately from the loader.
+
+The PreviewExecutor keeps up to `workers` preview processes running at the
+same time.  Their output is read from non-blocking pipes whenever select()
+reports it, so a slow preview neither waits for nor delays directory loads and
+copies in the loader.  FM.loop calls work() on every iteration.
+
+Jobs for the focused file are started before prefetched ones.  When the
+cursor moves to another file, the focused jobs of other files are killed,
+since their previews would not be shown anyway.  How long jobs take from
+submission to completion and how many are waiting is recorded in the metrics
+returned by stats().
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+from collections import deque
+import errno
+import fcntl
+from io import open
+from logging import DEBUG, getLogger
+import os
+import select
+from subprocess import Popen, PIPE
+from time import time
+
+from ranger import PY3
+from ranger.core.loader import safe_decode
+from ranger.core.shared import FileManagerAware
+
+LOG = getLogger(__name__)
+
+# How many bytes are read from a pipe at once
+READ_SIZE = 64 * 1024
+# How many latencies are kept for stats()
+LATENCY_SAMPLES = 200
+
+
+class PreviewJob(object):  # pylint: disable=too-many-instance-attributes
+    """A run of the preview script
+
+    on_done(job) is called once the process exited or the job was cancelled,
+    which is indicated by the attribute cancelled.  The output is in
+    stdout_buffer then.
+    """
+
+    def __init__(self, key, args, on_done, focused=True):
+        self.key = key
+        self.args = args
+        self.on_done = on_done
+        self.focused = focused
+        self.process = None
+        self.returncode = None
+        self.cancelled = False
+        self.stdout_buffer = ""
+        self._chunks = []
+        self.submit_time = time()
+        self.start_time = None
+        self.end_time = None
+
+    def start(self):
+        # pylint: disable=consider-using-with
+        with open(os.devnull, 'rb') as devnull:
+            self.process = Popen(self.args, stdin=devnull, stdout=PIPE, stderr=devnull)
+        fd = self.process.stdout.fileno()
+        fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+        self.start_time = time()
+        return fd
+
+    def read(self):
+        """Read the available output
+
+        Returns True if something was read, None if nothing is available at
+        the moment and False at the end of the output.
+        """
+        try:
+            data = os.read(self.process.stdout.fileno(), READ_SIZE)
+        except OSError as ex:
+            if ex.errno in (errno.EAGAIN, errno.EINTR):
+                return None
+            data = b''
+        if data:
+            self._chunks.append(data)
+            return True
+        return False
+
+    def finish(self):
+        """Collect the exit code and the output of the process"""
+        self.process.stdout.close()
+        self.returncode = self.process.wait()
+        output = b''.join(self._chunks)
+        self.stdout_buffer = safe_decode(output) if PY3 else output
+        self._chunks = []
+        self.end_time = time()
+
+    def kill(self):
+        self.cancelled = True
+        if self.process is not None and self.returncode is None:
+            try:
+                self.process.kill()
+            except OSError:
+                pass
+            self.process.stdout.close()
+            self.returncode = self.process.wait()
+        self.end_time = time()
+
+    @property
+    def latency(self):
+        """Seconds from the submission of the job until it was done"""
+        if self.end_time is None:
+            return None
+        return self.end_time - self.submit_time
+
+
+class PreviewExecutor(FileManagerAware):  # pylint: disable=too-many-instance-attributes
+    """Runs PreviewJobs, up to `workers` at a time"""
+
+    def __init__(self, workers=4):
+        self.workers = workers
+        self.queue = deque()
+        self.running = {}  # stdout file descriptor -> job
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.completed = 0
+        self.cancelled = 0
+        self.max_queue_depth = 0
+        self.fm.signal_bind('move', self._on_move)
+
+    def submit(self, key, args, on_done, focused=True):
+        """Queue a preview script run with the arguments args for key
+
+        key is usually the path of the previewed file.  Returns the job.
+        """
+        job = PreviewJob(key, args, on_done, focused=focused)
+        if focused:
+            self.queue.appendleft(job)
+        else:
+            self.queue.append(job)
+        self._start_jobs()
+        self.max_queue_depth = max(self.max_queue_depth, len(self.queue))
+        return job
+
+    def promote(self, job):
+        """Make a prefetch job the focused one and start it first"""
+        job.focused = True
+        if job in self.queue:
+            self.queue.remove(job)
+            self.queue.appendleft(job)
+            self._start_jobs()
+
+    def cancel(self, job):
+        """Kill or unqueue job"""
+        if job in self.queue:
+            self.queue.remove(job)
+        elif job.process is None or job.returncode is not None:
+            return
+        else:
+            self.running.pop(job.process.stdout.fileno(), None)
+            job.kill()
+        job.cancelled = True
+        self.cancelled += 1
+        self._done(job)
+        self._start_jobs()
+
+    def cancel_stale(self, key):
+        """Cancel the focused jobs of anything but key"""
+        for job in list(self.queue) + list(self.running.values()):
+            if job.focused and job.key != key:
+                self.cancel(job)
+
+    def _on_move(self, signal):
+        if signal.tab is self.fm.thistab and signal.new is not None:
+            self.cancel_stale(signal.new.realpath)
+
+    def _start_jobs(self):
+        while self.queue and len(self.running) < self.workers:
+            # Keep a worker free for the focused file.  Focused jobs are at
+            # the front of the queue, so the remaining ones are prefetches.
+            if not self.queue[0].focused and 1 < self.workers <= len(self.running) + 1:
+                break
+            job = self.queue.popleft()
+            try:
+                fd = job.start()
+            except OSError as ex:
+                LOG.debug("Preview of %s failed: %s", job.key, ex)
+                job.cancelled = True
+                self._done(job)
+                continue
+            self.running[fd] = job
+
+    def has_work(self):
+        return bool(self.running or self.queue)
+
+    def work(self, timeout=0, wake_fds=()):
+        """Read the output of the running jobs and finish those that exited
+
+        Waits up to timeout seconds for output, but returns as soon as one of
+        wake_fds, such as the terminal, is readable.
+        """
+        self._start_jobs()
+        if not self.running:
+            return
+        fds = list(self.running)
+        try:
+            readable, _, _ = select.select(fds + list(wake_fds), [], [], timeout)
+        except (select.error, OSError, ValueError):
+            return
+        for fd in readable:
+            job = self.running.get(fd)
+            if job is not None and job.read() is False:
+                self._finish(fd, job)
+        # Children of the script may keep the pipe open after it exited
+        for fd, job in list(self.running.items()):
+            if self.running.get(fd) is job and job.process.poll() is not None:
+                while job.read():
+                    pass
+                self._finish(fd, job)
+        self._start_jobs()
+
+    def _finish(self, fd, job):
+        del self.running[fd]
+        job.finish()
+        self.completed += 1
+        self.latencies.append(job.latency)
+        if LOG.isEnabledFor(DEBUG):
+            LOG.debug("Preview of %s took %.3fs (exit code %d), previews: %s",
+                      job.key, job.latency, job.returncode, self.stats())
+        self._done(job)
+
+    def _done(self, job):
+        job.on_done(job)
+        self.fm.signal_emit('preview.done', job=job)
+
+    def stats(self):
+        """Return a dict with the queue depth and the latencies of the jobs
+
+        The latencies are in seconds, over the last LATENCY_SAMPLES jobs.
+        """
+        latencies = sorted(self.latencies)
+        stats = {
+            'queued': len(self.queue),
+            'running': len(self.running),
+            'max_queue_depth': self.max_queue_depth,
+            'completed': self.completed,
+            'cancelled': self.cancelled,
+            'latency_mean': None,
+            'latency_median': None,
+            'latency_p95': None,
+        }
+        if latencies:
+            stats['latency_mean'] = sum(latencies) / len(latencies)
+            stats['latency_median'] = latencies[len(latencies) // 2]
+            stats['latency_p95'] = latencies[min(len(latencies) - 1,
+                                                 int(len(latencies) * 0.95))]
+        return stats
+
+    def destroy(self):
+        for job in list(self.queue) + list(self.running.values()):
+            job.kill()
+        self.queue.clear()
+        self.running.clear()
@@ -0,0 +1,181 @@
+# This file is part of ranger, the console file manager.
+# License: GNU GPL version 3, see the file "AUTHORS" for details.
+
+"""Notices changes in loaded directories without polling their mtime.
+
+The DirectoryWatcher registers an inotify watch for every directory once it
+has been loaded, and for all subdirectories of directories in flat mode.
+Events are read in batches from FM.loop.  Directories in which entries were
+created, deleted or renamed are flagged with `content_changed` and reloaded
+incrementally when they are drawn next.  Files that were only written to are
+updated in place.
+
+Watched directories skip the os.stat() in load_content_if_outdated.  Where
+inotify isn't available, or a watch can't be added (e.g. because the limit
+fs.inotify.max_user_watches is reached), directories are polled as before.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import os.path
+from time import time
+
+from ranger.core.shared import FileManagerAware
+from ranger.ext import inotify
+
+# Events that change the listing of the watched directory
+STRUCTURE_EVENTS = (inotify.IN_CREATE | inotify.IN_DELETE | inotify.IN_MOVED_FROM
+                    | inotify.IN_MOVED_TO | inotify.IN_DELETE_SELF | inotify.IN_MOVE_SELF)
+# Events that only change an entry of the watched directory
+MODIFY_EVENTS = inotify.IN_MODIFY | inotify.IN_CLOSE_WRITE | inotify.IN_ATTRIB
+WATCH_MASK = STRUCTURE_EVENTS | MODIFY_EVENTS | inotify.IN_ONLYDIR
+
+
+class DirectoryWatcher(FileManagerAware):
+    """Keeps inotify watches for the directories in fm.directories"""
+
+    def __init__(self):
+        try:
+            self.inotify = inotify.Inotify()
+        except OSError:
+            self.inotify = None
+        self._wds = {}  # watched path -> watch descriptor
+        self._paths = {}  # watch descriptor -> watched path
+        self._owners = {}  # watch descriptor -> set of Directory paths
+        self._owned = {}  # Directory path -> set of watch descriptors
+
+    @property
+    def available(self):
+        return self.inotify is not None
+
+    def watch(self, directory):
+        """Start watching a loaded directory, replacing its old watches"""
+        if self.inotify is None or directory.files_all is None:
+            return False
+
+        paths = [directory.path]
+        if directory.flat:
+            paths += [fobj.path for fobj in directory.files_all
+                      if fobj.is_directory and not fobj.is_link]
+        wds = set()
+        for path in paths:
+            try:
+                wd = self._add_watch(path)  # pylint: disable=invalid-name
+            except OSError:
+                # Fall back to polling the mtime of this directory
+                self.unwatch(directory)
+                return False
+            wds.add(wd)
+            self._owners.setdefault(wd, set()).add(directory.path)
+        for wd in self._owned.get(directory.path, set()) - wds:  # pylint: disable=invalid-name
+            self._release(wd, directory.path)
+        self._owned[directory.path] = wds
+
+        directory.watched = True
+        directory.content_changed = False
+        # Catch changes between listing the directory and adding the watch
+        if not directory.flat:
+            try:
+                if os.stat(directory.path).st_mtime != directory.load_content_mtime:
+                    directory.content_changed = True
+            except OSError:
+                directory.content_changed = True
+        return True
+
+    def _add_watch(self, path):
+        wd = self._wds.get(path)  # pylint: disable=invalid-name
+        if wd is None:
+            wd = self.inotify.add_watch(path, WATCH_MASK)
+            old_path = self._paths.get(wd)
+            if old_path is not None and old_path != path:
+                # The same inode, e.g. through a symlinked parent
+                del self._wds[old_path]
+            self._wds[path] = wd
+            self._paths[wd] = path
+        return wd
+
+    def unwatch(self, directory):
+        """Stop watching a directory, e.g. when it is garbage collected"""
+        directory.watched = False
+        for wd in self._owned.pop(directory.path, ()):  # pylint: disable=invalid-name
+            self._release(wd, directory.path)
+
+    def _release(self, wd, owner):  # pylint: disable=invalid-name
+        owners = self._owners.get(wd)
+        if owners is None:
+            return
+        owners.discard(owner)
+        if not owners:
+            self._forget(wd)
+            self.inotify.rm_watch(wd)
+
+    def _forget(self, wd):  # pylint: disable=invalid-name
+        self._owners.pop(wd, None)
+        path = self._paths.pop(wd, None)
+        if path is not None and self._wds.get(path) == wd:
+            del self._wds[path]
+
+    def poll(self):
+        """Handle all pending events, returns whether a directory was affected"""
+        if self.inotify is None:
+            return False
+        events = self.inotify.read_events()
+        if not events:
+            return False
+
+        changed = set()
+        modified = {}  # Directory path -> set of modified paths
+        for wd, mask, _, name in events:  # pylint: disable=invalid-name
+            if mask & inotify.IN_Q_OVERFLOW:
+                # Events were lost, so every directory may have changed
+                changed.update(self._owned)
+                continue
+            owners = self._owners.get(wd)
+            if not owners:
+                continue
+            if mask & inotify.IN_IGNORED:
+                # The watched directory is gone or its file system unmounted
+                changed.update(owners)
+                for owner in list(owners):
+                    self._drop_owner(owner)
+                self._forget(wd)
+            elif mask & STRUCTURE_EVENTS:
+                changed.update(owners)
+            elif mask & MODIFY_EVENTS and name:
+                path = os.path.join(self._paths[wd], name)
+                for owner in owners:
+                    modified.setdefault(owner, set()).add(path)
+
+        directories = self.fm.directories
+        for path in changed:
+            try:
+                directories[path].content_changed = True
+            except KeyError:
+                pass
+        for path, modified_paths in modified.items():
+            if path not in changed and path in directories:
+                self._update_in_place(directories[path], modified_paths)
+        return bool(changed or modified)
+
+    def _drop_owner(self, path):
+        try:
+            self.unwatch(self.fm.directories[path])
+        except KeyError:
+            self._owned.pop(path, None)
+
+    @staticmethod
+    def _update_in_place(directory, paths):
+        if not directory.files_all:
+            return
+        for fobj in directory.files_all:
+            if fobj.path in paths and not fobj.is_directory:
+                if fobj.load_if_outdated():
+                    directory.last_update_time = time()
+
+    def close(self):
+        """Remove all watches, the directories go back to being polled"""
+        for path in list(self._owned):
+            self._drop_owner(path)
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
@@ -1,25 +1,38 @@
 # This file is part of ranger, the console file manager.
 # License: GNU GPL version 3, see the file "AUTHORS" for details.
 
+"""Lookup of the executables in $PATH
+
+The executables are kept in an index of each directory of $PATH along with
+the mtime of the directory.  Since creating, removing or renaming a file
+changes the mtime of its directory, only the directories whose mtime changed
+are read again, which takes one stat() per directory instead of one per file.
+With an index path set, the index is kept across sessions.
+
+Changing the mode of a file, e.g. with "chmod +x", leaves the mtime of its
+directory alone and so isn't noticed until the directory changes otherwise.
+This only matters for entries that aren't regular files, since regular files
+count as executables whatever their mode.
+"""
+
 from __future__ import (absolute_import, division, print_function)
 
+from io import open
+import json
+import os
 from os import listdir, environ, stat
 import platform
 import shlex
 from stat import S_IXOTH, S_IFREG
+from time import time
 
 from ranger.ext.iter_tools import unique
 
 
-_cached_executables = None  # pylint: disable=invalid-name
-
-
-def get_executables():
-    """Return all executable files in $PATH. Cached version."""
-    global _cached_executables  # pylint: disable=global-statement,invalid-name
-    if _cached_executables is None:
-        _cached_executables = get_executables_uncached()
-    return _cached_executables
+# Seconds during which get_executables() trusts its result without stat()ing
+# the directories in $PATH again
+REFRESH_INTERVAL = 5.0
+ENCODING = 'utf-8'
 
 
 def _in_wsl():
@@ -29,35 +42,157 @@ def _in_wsl():
     return 'microsoft' in platform.release()
 
 
+def _path_directories():
+    try:
+        pathstring = environ['PATH']
+    except KeyError:
+        return []
+    return list(unique(pathstring.split(':')))
+
+
+def _scan_directory(path):
+    """Return the executable files in the directory path"""
+    executables = []
+    try:
+        content = listdir(path)
+    except OSError:
+        return executables
+    for item in content:
+        abspath = path + '/' + item
+        try:
+            filestat = stat(abspath)
+        except OSError:
+            continue
+        if filestat.st_mode & (S_IXOTH | S_IFREG):
+            executables.append(item)
+    return executables
+
+
+class ExecutableIndex(object):
+    """The executables of directories, indexed by the mtime of each directory
+
+    With a path, the index is read from and written to that file.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.directories = {}
+        self.scanned = 0
+        self._loaded = False
+
+    def load(self):
+        """Read the index from path, if not done already"""
+        if self._loaded:
+            return
+        self._loaded = True
+        if self.path is None:
+            return
+        try:
+            with open(self.path, 'r', encoding=ENCODING) as fobj:
+                directories = json.load(fobj)
+        except (IOError, OSError, ValueError):
+            return
+        if not isinstance(directories, dict):
+            return
+        for directory, entry in directories.items():
+            try:
+                mtime, executables = entry
+            except (TypeError, ValueError):
+                continue
+            self.directories.setdefault(directory, (mtime, executables))
+
+    def save(self):
+        """Write the index to path"""
+        if self.path is None:
+            return
+        try:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            with open(self.path + '.tmp', 'w', encoding=ENCODING) as fobj:
+                fobj.write(json.dumps(self.directories))
+            os.rename(self.path + '.tmp', self.path)
+        except (IOError, OSError):
+            pass
+
+    def update(self, paths):
+        """Return the executables in paths, reading the changed directories
+
+        The index is saved if any directory had to be read.
+        """
+        self.load()
+        executables = set()
+        changed = False
+        in_wsl = _in_wsl()
+        for path in paths:
+            if in_wsl and path.startswith('/mnt/c/'):
+                continue
+            try:
+                mtime = stat(path).st_mtime
+            except OSError:
+                if self.directories.pop(path, None) is not None:
+                    changed = True
+                continue
+            entry = self.directories.get(path)
+            if entry is None or entry[0] != mtime:
+                entry = (mtime, _scan_directory(path))
+                self.directories[path] = entry
+                self.scanned += 1
+                changed = True
+            executables.update(entry[1])
+        if changed:
+            self.save()
+        return executables
+
+
+_index = ExecutableIndex()  # pylint: disable=invalid-name
+_cached_executables = None  # pylint: disable=invalid-name
+_cached_key = None  # pylint: disable=invalid-name
+_cached_time = 0  # pylint: disable=invalid-name
+
+
+def set_index_path(path):
+    """Keep the index of executables in the file path across sessions"""
+    global _index, _cached_executables  # pylint: disable=global-statement,invalid-name
+    if path != _index.path:
+        _index = ExecutableIndex(path)
+        _cached_executables = None
+
+
+def get_executables():
+    """Return all executable files in $PATH. Cached version.
+
+    The directories in $PATH are checked for changes at most once every
+    REFRESH_INTERVAL seconds, in between the result is returned as it is.
+    """
+    global _cached_executables, _cached_key  # pylint: disable=global-statement,invalid-name
+    global _cached_time  # pylint: disable=global-statement,invalid-name
+    paths = environ.get('PATH')
+    now = time()
+    if _cached_executables is None or paths != _cached_key \
+            or now - _cached_time > REFRESH_INTERVAL:
+        _cached_executables = _index.update(_path_directories())
+        _cached_key = paths
+        _cached_time = now
+    return _cached_executables
+
+
 def get_executables_uncached(*paths):
     """Return all executable files in each of the given directories.
 
     Looks in $PATH by default.
     """
     if not paths:
-        try:
-            pathstring = environ['PATH']
-        except KeyError:
+        if 'PATH' not in environ:
             return ()
-        paths = unique(pathstring.split(':'))
+        paths = _path_directories()
 
     executables = set()
     in_wsl = _in_wsl()
     for path in paths:
         if in_wsl and path.startswith('/mnt/c/'):
             continue
-        try:
-            content = listdir(path)
-        except OSError:
-            continue
-        for item in content:
-            abspath = path + '/' + item
-            try:
-                filestat = stat(abspath)
-            except OSError:
-                continue
-            if filestat.st_mode & (S_IXOTH | S_IFREG):
-                executables.add(item)
+        executables.update(_scan_directory(path))
     return executables
 
 
@@ -44,16 +44,20 @@ class lazy_property(object):  # pylint: disable=invalid-name,too-few-public-meth
         if obj is None:  # to fix issues with pydoc
             return None
 
+        # The reset function is a method of the class rather than a closure
+        # stored in every instance, which would cost more memory than most
+        # of the cached values
         reset_function_name = self.__name__ + "__reset"
+        owner = obj.__class__
+        if reset_function_name not in owner.__dict__:
+            name = self.__name__
 
-        if not hasattr(obj, reset_function_name):
-            def reset_function():
-                setattr(obj, self.__name__, self)
-                del obj.__dict__[self.__name__]  # force "__get__" being called
-            obj.__dict__[reset_function_name] = reset_function
+            def reset_function(obj):
+                obj.__dict__.pop(name, None)  # force "__get__" being called
+            setattr(owner, reset_function_name, reset_function)
 
         result = self._method(obj)
-        obj.__dict__[self.__name__] = result
+        setattr(obj, self.__name__, result)
         return result
 
 
@@ -0,0 +1,199 @@
+# This file is part of ranger, the console file manager.
+# License: GNU GPL version 3, see the file "AUTHORS" for details.
+
+"""The lines of a file, read from a memory map only as far as needed
+
+MappedLines is a sequence of the decoded lines of a file.  The file is
+mapped into memory, and a sparse index records how many lines start before
+each block of BLOCK_SIZE bytes.  The index is only extended as far as the
+requested lines, so opening a file and looking at its first lines is cheap,
+no matter how big the file is.  A line is decoded when it is requested, and
+at most MAX_LINE_SIZE bytes of it.  Memory use is thus bounded by the index
+and the lines being looked at, while the map itself is paged in and out by
+the operating system.
+
+When the file grows, update() maps it again and only the appended bytes, plus
+the rest of the last block, are indexed when they are looked at.
+
+>>> import tempfile
+>>> with tempfile.TemporaryFile() as fobj:
+...     _ = fobj.write(b'first\\nsecond\\n\\nlast')
+...     fobj.flush()
+...     lines = MappedLines(fobj)
+...     print(lines[1], lines.extent(2), len(lines), lines[-1])
+second 2 4 last
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+from bisect import bisect_left
+import mmap
+import os
+import stat
+
+ENCODING = 'utf-8'
+# How many bytes are indexed by one entry of the sparse index
+BLOCK_SIZE = 1024 * 1024
+# How many bytes of a line are decoded at most
+MAX_LINE_SIZE = 1024 * 1024
+# More lines than any file has
+FAR_AWAY = 2 ** 62
+# How many lines away from the last looked up line are found by searching
+# from there rather than from the start of a block
+CURSOR_DISTANCE = 256
+
+
+class MappedLines(object):
+    """The lines of the file object fobj, without their line breaks
+
+    fobj must be a regular file that stays open while the lines are used.
+    """
+
+    def __init__(self, fobj, encoding=ENCODING, errors='ignore'):
+        self.encoding = encoding
+        self.errors = errors
+        self._fileno = fobj.fileno()
+        self.size = os.fstat(self._fileno).st_size
+        self._map = mmap.mmap(self._fileno, 0, access=mmap.ACCESS_READ)
+        # _newlines[b] is the number of newlines before block b
+        self._newlines = [0]
+        # The offset where the line after the last one looked up starts
+        self._cursor = (0, 0)
+
+    @staticmethod
+    def supports(fobj):
+        """Whether fobj is a non-empty regular file that can be mapped"""
+        try:
+            stat_result = os.fstat(fobj.fileno())
+        except (AttributeError, OSError, ValueError):
+            return False
+        return stat.S_ISREG(stat_result.st_mode) and stat_result.st_size > 0
+
+    def close(self):
+        self._map.close()
+
+    def update(self):
+        """Map the file again if it grew
+
+        Returns the number of bytes that were appended, or None if the file
+        got smaller, in which case the lines are no longer valid.
+        """
+        size = os.fstat(self._fileno).st_size
+        if size < self.size:
+            return None
+        if size == self.size:
+            return 0
+        appended = size - self.size
+        self._map.close()
+        self._map = mmap.mmap(self._fileno, 0, access=mmap.ACCESS_READ)
+        if (len(self._newlines) - 1) * BLOCK_SIZE > self.size:
+            # The last block was indexed before it was full
+            self._newlines.pop()
+        self.size = size
+        # The last line may have been continued
+        self._cursor = (0, 0)
+        return appended
+
+    @property
+    def indexed(self):
+        """Whether the index covers the whole file"""
+        return (len(self._newlines) - 1) * BLOCK_SIZE >= self.size
+
+    def _index_block(self):
+        """Add the next block to the index"""
+        start = (len(self._newlines) - 1) * BLOCK_SIZE
+        newlines = self._map[start:start + BLOCK_SIZE].count(b'\n')
+        self._newlines.append(self._newlines[-1] + newlines)
+        if hasattr(self._map, 'madvise') and start % mmap.PAGESIZE == 0:
+            # Don't keep the pages that were only counted in memory
+            try:
+                self._map.madvise(mmap.MADV_DONTNEED, start,
+                                  min(BLOCK_SIZE, self.size - start))
+            except OSError:
+                pass
+
+    def _index_until(self, newlines):
+        """Extend the index until it covers that many newlines or the file"""
+        while self._newlines[-1] < newlines and not self.indexed:
+            self._index_block()
+
+    def __len__(self):
+        while not self.indexed:
+            self._index_block()
+        last = self._newlines[-1]
+        if self.size and self._map[self.size - 1:self.size] != b'\n':
+            last += 1
+        return last
+
+    def extent(self, count):
+        """Return the number of lines, but at most count
+
+        Only indexes the file as far as needed for count lines.
+        """
+        self._index_until(count)
+        if self._newlines[-1] >= count:
+            return count
+        return min(count, len(self))
+
+    def _start(self, index):
+        """Return the offset at which line index starts or None"""
+        if index == 0:
+            return 0
+        line, offset = self._cursor
+        # Close to the last line, as when scrolling
+        if abs(index - line) <= CURSOR_DISTANCE:
+            return self._walk(offset, index - line)
+        self._index_until(index)
+        block = bisect_left(self._newlines, index) - 1
+        if block + 1 >= len(self._newlines):
+            return None
+        return self._walk(block * BLOCK_SIZE, index - self._newlines[block])
+
+    def _walk(self, offset, lines):
+        """Return the offset lines after the line starting at offset or None
+
+        Negative lines walk backwards.
+        """
+        for _ in range(lines):
+            offset = self._map.find(b'\n', offset) + 1
+            if offset == 0:
+                return None
+        for _ in range(-lines):
+            offset = self._map.rfind(b'\n', 0, offset - 1) + 1
+        return offset
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            if index.stop is not None and index.stop >= 0 and (index.start or 0) >= 0:
+                # No need to count all lines
+                indices = slice(index.start, self.extent(index.stop), index.step)
+                return [self[i] for i in range(*indices.indices(FAR_AWAY))]
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        start = self._start(index) if index >= 0 else None
+        if start is None or start >= self.size:
+            raise IndexError(index)
+        end = self._map.find(b'\n', start, start + MAX_LINE_SIZE)
+        if end < 0:
+            end = min(self.size, start + MAX_LINE_SIZE)
+            following = self._map.find(b'\n', end)
+            self._cursor = (index + 1, self.size if following < 0 else following + 1)
+        else:
+            self._cursor = (index + 1, end + 1)
+        return self._map[start:end].decode(self.encoding, self.errors)
+
+    def __iter__(self):
+        index = 0
+        while True:
+            try:
+                yield self[index]
+            except IndexError:
+                return
+            index += 1
+
+
+if __name__ == '__main__':
+    import doctest
+    import sys
+    sys.exit(doctest.testmod()[0])
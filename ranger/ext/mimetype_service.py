@@ -0,0 +1,284 @@
+# This file is part of ranger, the console file manager.
+# License: GNU GPL version 3, see the file "AUTHORS" for details.
+
+"""Detection of mime types by name and content, with a persistent cache
+
+The content of a file is only looked at when its name is not enough.  The
+result is cached by (device, inode, mtime, size) of the file, so a file is
+never examined twice while it is unchanged, not even across sessions if a
+cache_path is set.  A few binary formats with unambiguous signatures are
+recognized from their first bytes, the other files (containers like zip,
+RIFF or MP4 included) are passed to "file", many at once if possible.  Text
+is left to "file", which tells scripts, markup and such apart, and only
+recognized here when "file" fails.
+
+>>> service = MimetypeService()
+>>> service.guess_type('song.mp3')
+'audio/mpeg'
+>>> service.sniff(b'%PDF-1.7')
+'application/pdf'
+>>> service.sniff(b'just some text\\n') is None
+True
+>>> service.sniff_text(b'just some text\\n')
+'text/plain'
+>>> service.sniff_text(b'\\x00\\x01\\x02') is None
+True
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+from codecs import getincrementaldecoder
+from collections import OrderedDict
+from io import open
+import json
+import mimetypes
+import os
+import re
+import stat
+from subprocess import PIPE, Popen
+
+ENCODING = 'utf-8'
+
+# (first bytes, mime type) of formats whose signature is unambiguous and that
+# "file" reports the same way.  Containers and formats that "file" names
+# by their content are left to it.
+MAGIC_BYTES = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'%PDF-', 'application/pdf'),
+    (b'\xfd7zXZ\x00', 'application/x-xz'),
+    (b'BZh', 'application/x-bzip2'),
+    (b'(\xb5/\xfd', 'application/zstd'),
+    (b'7z\xbc\xaf\x27\x1c', 'application/x-7z-compressed'),
+    (b'fLaC', 'audio/flac'),
+)
+# How many bytes sniff() and sniff_text() look at
+SNIFF_SIZE = 512
+# Control characters that may appear in text
+TEXT_CONTROL = set(bytearray(b'\t\n\r\f\b\x1b'))
+
+# How many paths are passed to one "file" process
+FILE_BATCH_SIZE = 64
+# How many mime types are remembered
+MAX_CACHE_ENTRIES = 20000
+
+_MIMETYPE_RE = re.compile(r'^[\w.+-]+/[\w.+-]+$')
+
+
+class MimetypeService(object):
+    """Determines mime types of files and caches them
+
+    known_files are mime.types files added to the ones of the mimetypes
+    module.  With a cache_path, load() and save() keep the cache across
+    sessions.
+    """
+
+    def __init__(self, known_files=(), cache_path=None):
+        self.known_files = list(known_files)
+        self.cache_path = cache_path
+        self._cache = OrderedDict()
+        self._loaded = False
+        self._dirty = False
+
+    # Cache
+
+    def load(self):
+        """Read the cache from cache_path, if not done already"""
+        if self._loaded:
+            return
+        self._loaded = True
+        if self.cache_path is None:
+            return
+        try:
+            with open(self.cache_path, 'r', encoding=ENCODING) as fobj:
+                entries = json.load(fobj)
+        except (IOError, OSError, ValueError):
+            return
+        if not isinstance(entries, list):
+            return
+        for entry in entries[-MAX_CACHE_ENTRIES:]:
+            try:
+                key, mimetype = entry
+                self._cache.setdefault(tuple(key), mimetype)
+            except (TypeError, ValueError):
+                continue
+
+    def save(self):
+        """Write the cache to cache_path if it changed"""
+        if not self._dirty or self.cache_path is None:
+            return
+        entries = [[list(key), mimetype] for key, mimetype in self._cache.items()]
+        try:
+            directory = os.path.dirname(self.cache_path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            with open(self.cache_path + '.tmp', 'w', encoding=ENCODING) as fobj:
+                fobj.write(json.dumps(entries))
+            os.rename(self.cache_path + '.tmp', self.cache_path)
+        except (IOError, OSError):
+            return
+        self._dirty = False
+
+    @staticmethod
+    def _key(stat_result):
+        return (stat_result.st_dev, stat_result.st_ino, stat_result.st_mtime,
+                stat_result.st_size)
+
+    def _remember(self, key, mimetype):
+        self._cache[key] = mimetype
+        self._dirty = True
+        while len(self._cache) > MAX_CACHE_ENTRIES:
+            self._cache.popitem(last=False)
+
+    def cached(self, path, stat_result=None):
+        """Returns the cached mime type of the content of path or None
+
+        Never examines the file, so this is cheap enough for drawing.
+        """
+        self.load()
+        if stat_result is None:
+            try:
+                stat_result = os.stat(path)
+            except OSError:
+                return None
+        return self._cache.get(self._key(stat_result))
+
+    # Detection
+
+    def guess_type(self, name, strict=True):
+        """Returns the mime type for the name of a file or None"""
+        if not mimetypes.inited:
+            mimetypes.init(mimetypes.knownfiles + self.known_files)
+        return mimetypes.guess_type(name, strict)[0]
+
+    @staticmethod
+    def sniff(data):
+        """Returns the mime type of a binary file starting with data or None"""
+        if not data:
+            return 'inode/x-empty'
+        for magic, mimetype in MAGIC_BYTES:
+            if data.startswith(magic):
+                return mimetype
+        return None
+
+    @staticmethod
+    def sniff_text(data):
+        """Returns text/plain if data looks like the start of a text file
+
+        Only a fallback for when "file" fails, as it is more specific.
+        """
+        try:
+            # Not final, the data may end in the middle of a character
+            getincrementaldecoder(ENCODING)().decode(data, final=False)
+        except UnicodeDecodeError:
+            return None
+        for char in bytearray(data):
+            if char < 32 and char not in TEXT_CONTROL:
+                return None
+        return 'text/plain'
+
+    @staticmethod
+    def _sniff_file(path, sniff):
+        try:
+            with open(path, 'rb') as fobj:
+                return sniff(fobj.read(SNIFF_SIZE))
+        except (IOError, OSError):
+            return None
+
+    @staticmethod
+    def _run_file(paths):
+        """Returns the mime types "file" finds for paths, None if it fails"""
+        try:
+            process = Popen(  # pylint: disable=consider-using-with
+                ['file', '--mime-type', '-L', '-r', '-N', '-0', '--'] + paths,
+                stdout=PIPE, stderr=PIPE)
+            output, _ = process.communicate()
+        except OSError:
+            return [None] * len(paths)
+        # Each line is "<path>\0: <mime type>\n", in the order of paths
+        results = []
+        position = 0
+        for path in paths:
+            name = path.encode(ENCODING, 'surrogateescape') \
+                if not isinstance(path, bytes) else path
+            start = position + len(name) + 1
+            if output[position:start] != name + b'\0':
+                results.extend([None] * (len(paths) - len(results)))
+                break
+            end = output.find(b'\n', start)
+            if end < 0:
+                end = len(output)
+            mimetype = output[start:end].decode(ENCODING, 'replace').lstrip(': ').strip()
+            results.append(mimetype if _MIMETYPE_RE.match(mimetype) else None)
+            position = end + 1
+        return results
+
+    @staticmethod
+    def _run_mimetype(path):
+        """Ask "mimetype", which knows more formats than "file" """
+        try:
+            process = Popen(  # pylint: disable=consider-using-with
+                ['mimetype', '--output-format', '%m', path], stdout=PIPE, stderr=PIPE)
+            output, _ = process.communicate()
+        except OSError:
+            return None
+        mimetype = output.decode(ENCODING, 'replace').strip()
+        return mimetype if _MIMETYPE_RE.match(mimetype) else None
+
+    def detect_many(self, paths):
+        """Returns a dict of the mime types of the content of paths
+
+        Paths that can't be examined map to None.  The paths that are neither
+        cached nor recognized by sniff() are passed to "file" in batches.
+        Those that "file" can't tell either are checked with sniff_text().
+        """
+        self.load()
+        results = {}
+        unknown = []
+        for path in paths:
+            try:
+                stat_result = os.stat(path)
+            except OSError:
+                results[path] = None
+                continue
+            key = self._key(stat_result)
+            mimetype = self._cache.get(key)
+            if mimetype is None:
+                if stat.S_ISDIR(stat_result.st_mode):
+                    mimetype = 'inode/directory'
+                elif stat.S_ISREG(stat_result.st_mode):
+                    mimetype = self._sniff_file(path, self.sniff)
+                if mimetype is None:
+                    unknown.append((path, key))
+                    continue
+                self._remember(key, mimetype)
+            results[path] = mimetype
+
+        for i in range(0, len(unknown), FILE_BATCH_SIZE):
+            batch = unknown[i:i + FILE_BATCH_SIZE]
+            mimetypes_found = self._run_file([path for path, _ in batch])
+            for (path, key), mimetype in zip(batch, mimetypes_found):
+                if mimetype == 'application/octet-stream':
+                    mimetype = self._run_mimetype(path) or mimetype
+                elif mimetype is None:
+                    mimetype = self._sniff_file(path, self.sniff_text)
+                if mimetype is not None:
+                    self._remember(key, mimetype)
+                results[path] = mimetype
+        return results
+
+    def detect(self, path):
+        """Returns the mime type of the content of path or None"""
+        return self.detect_many([path])[path]
+
+    def get(self, path):
+        """Returns the mime type of path, by its name if possible"""
+        return self.guess_type(path) or self.detect(path)
+
+
+if __name__ == '__main__':
+    import doctest
+    import sys
+    sys.exit(doctest.testmod()[0])
@@ -0,0 +1,224 @@
+# This file is part of ranger, the console file manager.
+# License: GNU GPL version 3, see the file "AUTHORS" for details.
+
+"""A bounded cache of file previews, optionally kept on disk
+
+The previews of a file are stored in a dict per path, as described in
+Actions.get_preview.  The cache holds those dicts in the order they were
+used and forgets the least recently used ones when the previews take more
+than max_bytes.
+
+With a directory, previews are also written to disk, keyed by the real path,
+inode, mtime and size of the file, the size class of the preview, a hash of
+the preview script and any other argument that changes the script's output.
+The size class is what the exit code of the script says the preview depends
+on: (width, height), (-1, height), (width, -1) or (-1, -1).  A preview that
+doesn't depend on the size of the terminal is therefore reused for any size.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+from collections import OrderedDict
+from hashlib import sha256
+from io import open
+import json
+import os
+
+ENCODING = 'utf-8'
+# Bytes that the previews on disk may take before the oldest are removed
+MAX_DISK_BYTES = 256 * 1024 * 1024
+# Bytes counted for each path in addition to its previews, so that the number
+# of paths without previews is bounded too
+ENTRY_OVERHEAD = 256
+
+
+def _size_classes(width, height):
+    return ((-1, -1), (width, -1), (-1, height), (width, height))
+
+
+class PreviewCache(object):
+    """Least recently used previews, bounded by the bytes of their content"""
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, directory=None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.size = 0
+        self.disk_hits = 0
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._script_hashes = {}
+
+    # The mapping of paths to the dicts of their previews
+
+    def __getitem__(self, path):
+        data = self._entries.pop(path)
+        self._entries[path] = data
+        return data
+
+    def __setitem__(self, path, data):
+        self._discard(path)
+        self._entries[path] = data
+        self.update_entry(path)
+
+    def __delitem__(self, path):
+        if path not in self._entries:
+            raise KeyError(path)
+        self._discard(path)
+
+    def __contains__(self, path):
+        return path in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, path, default=None):
+        return self._entries.get(path, default)
+
+    def clear(self):
+        self._entries.clear()
+        self._sizes.clear()
+        self.size = 0
+
+    def _discard(self, path):
+        self._entries.pop(path, None)
+        self.size -= self._sizes.pop(path, 0)
+
+    def update_entry(self, path):
+        """Account for previews added to the dict of path
+
+        Forgets the least recently used paths that aren't loading until the
+        previews fit into max_bytes again.
+        """
+        data = self._entries.get(path)
+        if data is None:
+            return
+        size = ENTRY_OVERHEAD + sum(len(value) for key, value in data.items()
+                                    if isinstance(key, tuple) and value)
+        self.size += size - self._sizes.get(path, 0)
+        self._sizes[path] = size
+        for old_path in list(self._entries):
+            if self.size <= self.max_bytes:
+                break
+            if old_path != path and not self._entries[old_path].get('loading'):
+                self._discard(old_path)
+
+    # Disk
+
+    def save(self, key, size_class, content):
+        """Write the preview for key and size_class to disk
+
+        key identifies the file and the way the preview was generated, see
+        make_key().
+        """
+        if self.directory is None or content is None:
+            return
+        self._write(self._disk_path(key, size_class), content)
+
+    def load(self, key, width, height):
+        """Return (size class, preview) from disk for width and height
+
+        Returns None if there is no preview on disk that fits.
+        """
+        if self.directory is None:
+            return None
+        for size_class in _size_classes(width, height):
+            filename = self._disk_path(key, size_class)
+            content = self._read(filename)
+            if content is not None:
+                self.disk_hits += 1
+                try:
+                    os.utime(filename, None)
+                except OSError:
+                    pass
+                return size_class, content
+        return None
+
+    def script_hash(self, script, stat_result):
+        """Return a hash of the content of the file script
+
+        The hash is remembered as long as the mtime and size of script stay.
+        """
+        stamp = (stat_result.st_mtime, stat_result.st_size)
+        try:
+            old_stamp, digest = self._script_hashes[script]
+        except KeyError:
+            pass
+        else:
+            if old_stamp == stamp:
+                return digest
+        try:
+            with open(script, 'rb') as fobj:
+                digest = sha256(fobj.read()).hexdigest()
+        except (IOError, OSError):
+            digest = ''
+        self._script_hashes[script] = (stamp, digest)
+        return digest
+
+    @staticmethod
+    def make_key(path, stat_result, *arguments):
+        """Return the key of a preview of path
+
+        arguments are anything that changes the preview, such as the hash of
+        the preview script.
+        """
+        return [path, stat_result.st_ino, stat_result.st_mtime, stat_result.st_size] \
+            + list(arguments)
+
+    def _disk_path(self, key, size_class):
+        encoded = json.dumps(key + list(size_class)).encode(ENCODING, 'replace')
+        return os.path.join(self.directory, sha256(encoded).hexdigest())
+
+    @staticmethod
+    def _read(filename):
+        try:
+            with open(filename, 'rb') as fobj:
+                content = fobj.read()
+        except (IOError, OSError):
+            return None
+        if str is bytes:
+            return content
+        return content.decode(ENCODING, 'surrogateescape')
+
+    def _write(self, filename, content):
+        if not isinstance(content, bytes):
+            content = content.encode(ENCODING, 'surrogateescape')
+        try:
+            # Previews show the content of the files, keep them private
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory, 0o700)
+            fd = os.open(filename + '.tmp', os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with open(fd, 'wb') as fobj:
+                fobj.write(content)
+            os.rename(filename + '.tmp', filename)
+        except (IOError, OSError):
+            pass
+
+    def clear_disk(self):
+        """Remove all previews from disk"""
+        self.prune(max_bytes=0)
+
+    def prune(self, max_bytes=MAX_DISK_BYTES):
+        """Remove the least recently used previews on disk beyond max_bytes"""
+        if self.directory is None:
+            return
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        files = []
+        for name in names:
+            filename = os.path.join(self.directory, name)
+            try:
+                stat_result = os.stat(filename)
+            except OSError:
+                continue
+            files.append((stat_result.st_mtime, stat_result.st_size, filename))
+        files.sort(reverse=True)
+        total = 0
+        for _, size, filename in files:
+            total += size
+            if total > max_bytes:
+                try:
+                    os.remove(filename)
+                except OSError:
+                    pass
@@ -72,6 +72,11 @@ except ImportError:
         return cached_executables
 
 
+try:
+    from ranger.ext.mimetype_service import MimetypeService
+except ImportError:
+    MimetypeService = None  # pylint: disable=invalid-name
+
 try:
     from ranger.ext.popen23 import Popen23
 except ImportError:
@@ -225,7 +230,10 @@ class Rifle(object):  # pylint: disable=too-many-instance-attributes
         self._app_label = None
         self._mimetype = None
         self._skip = None
+        self._memo = {}
         self.rules = None
+        self._compiled_rules = None
+        self._candidates_by_ext = {}
 
         # get paths for mimetype files
         self._mimetype_known_files = [os.path.expanduser("~/.mime.types")]
@@ -233,6 +241,10 @@ class Rifle(object):  # pylint: disable=too-many-instance-attributes
             # Add ranger's default mimetypes when run from ranger directory
             self._mimetype_known_files.append(
                 __file__.replace("ext/rifle.py", "data/mime.types"))
+        # Caches the mime types, may be shared with the embedding program
+        self.mimetype_service = None
+        if MimetypeService is not None:
+            self.mimetype_service = MimetypeService(self._mimetype_known_files)
 
     def reload_config(self, config_file=None):
         """Replace the current configuration with the one in config_file"""
@@ -252,50 +264,125 @@ class Rifle(object):  # pylint: disable=too-many-instance-attributes
                 tests = tuple(tuple(f.strip().split(None, 1)) for f in tests)
                 command = command.strip()
                 self.rules.append((command, tests))
+        self._compile_rules()
+
+    @staticmethod
+    def _compile_test(test):
+        """Returns (negated, function, argument, regex) for a test of a rule
+
+        The regex is compiled here once instead of for every file.  A pattern
+        that does not compile stays a string, so it raises the same error as
+        before when the test is evaluated.
+        """
+        function = test[0]
+        negated = function.startswith('!')
+        if negated:
+            function = function[1:]
+        argument = test[1] if len(test) > 1 else ''
+        regex = None
+        if function in ('ext', 'name', 'match', 'path', 'mime'):
+            regex = '^(' + argument + ')$' if function == 'ext' else argument
+            try:
+                regex = re.compile(regex)
+            except re.error:
+                pass
+        return (negated, function, argument, regex)
+
+    def _compile_rules(self):
+        """Compile self.rules into self._compiled_rules
+
+        Each compiled rule is (command, tests, extension regex), the latter
+        taken from a test "ext" that is not negated, if any.  Only rules whose
+        extension regex matches the extension of a file can apply to it, which
+        _candidate_rules uses to skip the other rules.
+        """
+        self._compiled_rules = []
+        for command, tests in self.rules:
+            compiled_tests = tuple(self._compile_test(test) for test in tests if test)
+            ext_regex = None
+            for negated, function, _, regex in compiled_tests:
+                if function == 'ext' and not negated:
+                    ext_regex = regex
+                    break
+            self._compiled_rules.append((command, compiled_tests, ext_regex))
+        self._candidates_by_ext = {}
+
+    def _memoized(self, name, function, *args):
+        """Returns function(*args), computed once per call of list_commands"""
+        try:
+            return self._memo[name]
+        except KeyError:
+            value = self._memo[name] = function(*args)
+            return value
+
+    def _extension(self, fname):
+        """The lowercase extension of fname if it is a file, None otherwise"""
+        if not self._memoized('isfile', os.path.isfile, fname):
+            return None
+        partitions = self._memoized('basename', os.path.basename, fname).rpartition('.')
+        if not partitions[0]:
+            return None
+        return partitions[2].lower()
+
+    def _candidate_rules(self, files):
+        """Returns the compiled rules that may apply to files"""
+        if not files:
+            return self._compiled_rules
+        ext = self._memoized('ext', self._extension, files[0])
+        try:
+            return self._candidates_by_ext[ext]
+        except KeyError:
+            pass
+        candidates = []
+        for rule in self._compiled_rules:
+            command, _, ext_regex = rule
+            # "ask" rules count even if they don't match, see list_commands
+            if command != ASK_COMMAND and ext_regex is not None:
+                if ext is None:
+                    continue
+                if not isinstance(ext_regex, str) and not ext_regex.search(ext):
+                    continue
+            candidates.append(rule)
+        self._candidates_by_ext[ext] = candidates
+        return candidates
 
     def _eval_condition(self, condition, files, label):
         # Handle the negation of conditions starting with an exclamation mark,
         # then pass on the arguments to _eval_condition2().
 
-        if not condition:
-            return True
-        if condition[0].startswith('!'):
-            new_condition = tuple([condition[0][1:]]) + tuple(condition[1:])
-            return not self._eval_condition2(new_condition, files, label)
-        return self._eval_condition2(condition, files, label)
+        negated = condition[0]
+        result = self._eval_condition2(condition, files, label)
+        return not result if negated else result
 
     def _eval_condition2(  # pylint: disable=too-many-return-statements,too-many-branches
             self, rule, files, label):
-        # This function evaluates the condition, after _eval_condition() handled
-        # negation of conditions starting with a "!".
+        # This function evaluates the compiled condition, after
+        # _eval_condition() handled negation of conditions starting with a "!".
 
         if not files:
             return False
 
-        function = rule[0]
-        argument = rule[1] if len(rule) > 1 else ''
+        _, function, argument, regex = rule
 
         if function == 'ext':
-            if os.path.isfile(files[0]):
-                partitions = os.path.basename(files[0]).rpartition('.')
-                if not partitions[0]:
-                    return False
-                return bool(re.search('^(' + argument + ')$', partitions[2].lower()))
+            ext = self._memoized('ext', self._extension, files[0])
+            if ext is not None:
+                return bool(re.search(regex, ext))
         elif function == 'name':
-            return bool(re.search(argument, os.path.basename(files[0])))
+            return bool(re.search(regex, self._memoized('basename', os.path.basename, files[0])))
         elif function == 'match':
-            return bool(re.search(argument, files[0]))
+            return bool(re.search(regex, files[0]))
         elif function == 'file':
-            return os.path.isfile(files[0])
+            return self._memoized('isfile', os.path.isfile, files[0])
         elif function == 'directory':
-            return os.path.isdir(files[0])
+            return self._memoized('isdir', os.path.isdir, files[0])
         elif function == 'path':
-            return bool(re.search(argument, os.path.abspath(files[0])))
+            return bool(re.search(regex, self._memoized('abspath', os.path.abspath, files[0])))
         elif function == 'mime':
             mimetype = self.get_mimetype(files[0])
             if mimetype is None:
                 return False
-            return bool(re.search(argument, mimetype))
+            return bool(re.search(regex, mimetype))
         elif function == 'has':
             if argument.startswith("$"):
                 if argument[1:] in os.environ:
@@ -304,7 +391,7 @@ class Rifle(object):  # pylint: disable=too-many-instance-attributes
             else:
                 return argument in get_executables()
         elif function == 'terminal':
-            return _is_terminal()
+            return self._memoized('terminal', _is_terminal)
         elif function == 'number':
             if argument.isdigit():
                 self._skip = int(argument)
@@ -331,6 +418,9 @@ class Rifle(object):  # pylint: disable=too-many-instance-attributes
         # Spawn "file" to determine the mime-type of the given file.
         if self._mimetype:
             return self._mimetype
+        if self.mimetype_service is not None:
+            self._mimetype = self.mimetype_service.get(fname)
+            return self._mimetype
 
         import mimetypes
         if not mimetypes.inited:
@@ -378,8 +468,9 @@ class Rifle(object):  # pylint: disable=too-many-instance-attributes
         label and flags are the label and flags specified in the rule.
         """
         self._mimetype = mimetype
+        self._memo = {}
         count = -1
-        for cmd, tests in self.rules:
+        for cmd, tests, _ in self._candidate_rules(files):
             self._skip = None
             self._app_flags = ''
             self._app_label = None
@@ -1,18 +1,38 @@
 # This file was taken from the python 2.7.13 standard library and has been
-# slightly modified to do a "yield" after every 16KB of copying
+# modified to do a "yield" after every chunk of copying.  The chunks grow or
+# shrink so that copying one takes about chunk_time seconds.
 
 from __future__ import (absolute_import, division, print_function)
 
+import errno
 import os
 import stat
 import sys
+from time import time
 from shutil import (_samefile, rmtree, _basename, _destinsrc, Error, SpecialFileError)
 from ranger.ext.safe_path import get_safe_path
 
-__all__ = ["copyfileobj", "copyfileobj_range", "copyfile", "copystat", "copy2", "BLOCK_SIZE",
-           "copytree", "move", "rmtree", "Error", "SpecialFileError"]
+__all__ = ["copyfileobj", "copyfileobj_range", "copyfd", "copyfile", "copystat", "copy2",
+           "BLOCK_SIZE", "CHUNK_TIME", "COPY_METHODS", "copytree", "move", "rmtree", "Error",
+           "SpecialFileError"]
 
+# The smallest chunk that is copied between two yields
 BLOCK_SIZE = 16 * 1024
+# The size of the first chunk and the largest chunk
+FIRST_CHUNK_SIZE = 1024 * 1024
+MAX_CHUNK_SIZE = 256 * 1024 * 1024
+# How many seconds copying one chunk should take
+CHUNK_TIME = 0.01
+
+# In the order of preference.  copy_file_range() copies inside the kernel
+# and can use reflinks or server-side copies, sendfile() copies inside the
+# kernel, reading and writing goes through a buffer.
+COPY_METHODS = ('copy_file_range', 'sendfile', 'readwrite')
+# Errors that mean that a method doesn't work for these files
+_UNSUPPORTED_ERRNOS = frozenset(
+    getattr(errno, name) for name in (
+        'EXDEV', 'ENOSYS', 'EINVAL', 'EOPNOTSUPP', 'ENOTSUP', 'EBADF', 'ETXTBSY', 'ENODATA')
+    if hasattr(errno, name))
 
 
 if sys.version_info < (3, 3):
@@ -133,7 +153,68 @@ except AttributeError:
     pass
 
 
-def copyfile(src, dst):
+def _copy_chunk_function(method, src_fd, dst_fd):
+    """Returns a function that copies up to n bytes and returns how many"""
+    if method == 'copy_file_range':
+        copy_file_range = getattr(os, 'copy_file_range', None)
+        if copy_file_range is None:
+            return None
+        return lambda n: copy_file_range(src_fd, dst_fd, n)
+    if method == 'sendfile':
+        sendfile = getattr(os, 'sendfile', None)
+        if sendfile is None or not sys.platform.startswith('linux'):
+            # Only Linux can sendfile() into regular files
+            return None
+        return lambda n: sendfile(dst_fd, src_fd, None, n)
+
+    def read_write(n):
+        buf = os.read(src_fd, n)
+        written = os.write(dst_fd, buf)
+        while written < len(buf):
+            written += os.write(dst_fd, buf[written:])
+        return written
+    return read_write
+
+
+def copyfd(src_fd, dst_fd, chunk_time=CHUNK_TIME, methods=COPY_METHODS):
+    """Copy data from the file descriptor src_fd to dst_fd
+
+    Yields the number of bytes copied so far after every chunk.  The first
+    of the methods that works for the two files is used.  Copying continues
+    from the current offsets of the descriptors, so switching methods after
+    a failure doesn't lose data.  The chunk size is adapted so that a chunk
+    takes about chunk_time seconds.
+    """
+    done = 0
+    length = FIRST_CHUNK_SIZE
+    for method in methods:
+        copy_chunk = _copy_chunk_function(method, src_fd, dst_fd)
+        if copy_chunk is None:
+            continue
+        while True:
+            start = time()
+            try:
+                copied = copy_chunk(length)
+            except OSError as ex:
+                if ex.errno in _UNSUPPORTED_ERRNOS and method != methods[-1]:
+                    break  # try the next method
+                raise
+            if not copied:
+                if done == 0 and method != methods[-1]:
+                    # Some files, like those in /proc, claim to be empty to
+                    # copy_file_range() and sendfile() but can be read
+                    break
+                return
+            done += copied
+            duration = time() - start
+            if duration < chunk_time / 2 and copied == length:
+                length = min(length * 2, MAX_CHUNK_SIZE)
+            elif duration > chunk_time:
+                length = max(length // 2, BLOCK_SIZE)
+            yield done
+
+
+def copyfile(src, dst, chunk_time=CHUNK_TIME):
     """Copy data from src to dst"""
     if _samefile(src, dst):
         raise Error("`%s` and `%s` are the same file" % (src, dst))
@@ -151,20 +232,18 @@ def copyfile(src, dst):
 
     with open(src, 'rb') as fsrc:
         with open(dst, 'wb') as fdst:
-            try:
-                for done in copyfileobj_range(fsrc, fdst):
-                    yield done
-            except OSError:
-                # Return to start of files first, then use old method
-                fsrc.seek(0, 0)
-                fdst.seek(0, 0)
-            except NameError:
-                pass  # Just fall back if there's no copy_file_range
-            for done in copyfileobj(fsrc, fdst):
+            for done in copyfd(fsrc.fileno(), fdst.fileno(), chunk_time):
                 yield done
 
 
-def copy2(src, dst, overwrite=False, symlinks=False, make_safe_path=get_safe_path):
+def copy2(  # pylint: disable=too-many-positional-arguments
+    src,
+    dst,
+    overwrite=False,
+    symlinks=False,
+    make_safe_path=get_safe_path,
+    chunk_time=CHUNK_TIME,
+):
     """Copy data and all stat info ("cp -p src dst").
 
     The destination may be a directory.
@@ -180,13 +259,13 @@ def copy2(src, dst, overwrite=False, symlinks=False, make_safe_path=get_safe_pat
             os.unlink(dst)
         os.symlink(linkto, dst)
     else:
-        for done in copyfile(src, dst):
+        for done in copyfile(src, dst, chunk_time):
             yield done
         copystat(src, dst)
 
 
 def copytree(
-    # pylint: disable=too-many-locals,too-many-branches
+    # pylint: disable=too-many-locals,too-many-branches,too-many-arguments
     # pylint: disable=too-many-positional-arguments
     src,
     dst,
@@ -194,6 +273,7 @@ def copytree(
     ignore=None,
     overwrite=False,
     make_safe_path=get_safe_path,
+    chunk_time=CHUNK_TIME,
 ):
     """Recursively copy a directory tree using copy2().
 
@@ -255,6 +335,7 @@ def copytree(
                     ignore=ignore,
                     overwrite=overwrite,
                     make_safe_path=make_safe_path,
+                    chunk_time=chunk_time,
                 ):
                     yield done + n
                 done += n
@@ -262,7 +343,7 @@ def copytree(
                 # Will raise a SpecialFileError for unsupported file types
                 n = 0
                 for n in copy2(srcname, dstname, overwrite=overwrite, symlinks=symlinks,
-                               make_safe_path=make_safe_path):
+                               make_safe_path=make_safe_path, chunk_time=chunk_time):
                     yield done + n
                 done += n
         # catch the Error from the recursive copytree so that we can
@@ -279,7 +360,7 @@ def copytree(
         raise Error(errors)
 
 
-def move(src, dst, overwrite=False, make_safe_path=get_safe_path):
+def move(src, dst, overwrite=False, make_safe_path=get_safe_path, chunk_time=CHUNK_TIME):
     """Recursively move a file or directory to another location. This is
     similar to the Unix "mv" command.
 
@@ -314,11 +395,11 @@ def move(src, dst, overwrite=False, make_safe_path=get_safe_path):
             if _destinsrc(src, dst):
                 raise Error("Cannot move a directory '%s' into itself '%s'." % (src, dst))
             for done in copytree(src, real_dst, symlinks=True, overwrite=overwrite,
-                                 make_safe_path=make_safe_path):
+                                 make_safe_path=make_safe_path, chunk_time=chunk_time):
                 yield done
             rmtree(src)
         else:
             for done in copy2(src, real_dst, symlinks=True, overwrite=overwrite,
-                              make_safe_path=make_safe_path):
+                              make_safe_path=make_safe_path, chunk_time=chunk_time):
                 yield done
             os.unlink(src)
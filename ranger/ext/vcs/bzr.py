@@ -118,6 +118,9 @@ class Bzr(Vcs):
 
         return statuses
 
+    def data_state_files(self):
+        return [self.repodir, os.path.join(self.repodir, 'checkout', 'dirstate')]
+
     def data_status_remote(self):
         if not self._remote_url():
             return 'none'
@@ -6,10 +6,13 @@
 from __future__ import (absolute_import, division, print_function)
 
 from datetime import datetime
+from io import open
 import os
 import re
+import subprocess
 import unicodedata
 
+from ranger.ext.spawn import ENCODING
 from .vcs import Vcs, VcsError
 
 
@@ -33,6 +36,9 @@ class Git(Vcs):
         ('?', '?', 'untracked'),
         ('!', '!', 'ignored'),
     )
+    # Number of spaces before the path in changed (1), renamed or copied (2)
+    # and unmerged (u) entries of "git status --porcelain=v2"
+    _status_v2_fields = {'1': 8, '2': 9, 'u': 10}
 
     # Generic
 
@@ -75,6 +81,30 @@ class Git(Vcs):
             })
         return log
 
+    def _run_records(self, args, chunk_size=65536):
+        """Run git and yield its NUL separated output records as they arrive"""
+        cmd = [self.repotype] + args
+        try:
+            with open(os.devnull, mode='w', encoding="utf-8") as fd_devnull:
+                process = subprocess.Popen(  # pylint: disable=consider-using-with
+                    cmd, cwd=self.path, stdout=subprocess.PIPE, stderr=fd_devnull)
+        except OSError:
+            raise VcsError('{0:s}: {1:s}'.format(str(cmd), self.path))
+        try:
+            rest = b''
+            while True:
+                chunk = process.stdout.read(chunk_size)
+                if not chunk:
+                    break
+                records = (rest + chunk).split(b'\0')
+                rest = records.pop()
+                for record in records:
+                    yield record.decode(ENCODING)
+        finally:
+            process.stdout.close()
+            if process.wait() != 0:
+                raise VcsError('{0:s}: {1:s}'.format(str(cmd), self.path))
+
     def _status_translate(self, code):
         """Translate status code"""
         for code_x, code_y, status in self._status_translations:
@@ -122,14 +152,16 @@ class Git(Vcs):
 
     def data_status_subpaths(self):
         statuses = {}
+        ignored = self.obj.settings.vcs_git_ignored
 
         # Ignored directories
-        paths = self._run([
-            'ls-files', '-z', '--others', '--directory', '--ignored', '--exclude-standard'
-        ]).split('\0')[:-1]
-        for path in paths:
-            if path.endswith('/'):
-                statuses[os.path.normpath(path)] = 'ignored'
+        if ignored:
+            paths = self._run([
+                'ls-files', '-z', '--others', '--directory', '--ignored', '--exclude-standard'
+            ]).split('\0')[:-1]
+            for path in paths:
+                if path.endswith('/'):
+                    statuses[os.path.normpath(path)] = 'ignored'
 
         # Empty directories
         paths = self._run(
@@ -139,7 +171,10 @@ class Git(Vcs):
                 statuses[os.path.normpath(path)] = 'none'
 
         # Paths with status
-        lines = self._run(['status', '--porcelain', '-z', '--ignored']).split('\0')[:-1]
+        args = ['status', '--porcelain', '-z']
+        if ignored:
+            args.append('--ignored')
+        lines = self._run(args).split('\0')[:-1]
         skip = False
         for line in lines:
             if skip:
@@ -151,6 +186,70 @@ class Git(Vcs):
 
         return statuses
 
+    def data_status(self):
+        if not self.obj.settings.vcs_git_single_status:
+            return super(Git, self).data_status()
+
+        statuses = {}
+        branch = 'detached'
+        remote = 'none'
+        revid = None
+        ignored = 'matching' if self.obj.settings.vcs_git_ignored else 'no'
+        skip = False
+        for record in self._run_records(
+                ['status', '--porcelain=v2', '--branch', '-z', '--ignored=' + ignored]):
+            if skip:
+                # The original path of a renamed or copied file
+                skip = False
+                continue
+            kind = record[:1]
+            if kind == '#':
+                _, header, value = record.split(' ', 2)
+                if header == 'branch.oid' and value != '(initial)':
+                    revid = value
+                elif header == 'branch.head' and value != '(detached)':
+                    branch = value
+                elif header == 'branch.ab':
+                    ahead, behind = (int(count[1:]) for count in value.split(' '))
+                    if ahead:
+                        remote = 'diverged' if behind else 'ahead'
+                    else:
+                        remote = 'behind' if behind else 'sync'
+            elif kind in self._status_v2_fields:
+                fields = record.split(' ', self._status_v2_fields[kind])
+                status = self._status_translate(fields[1].replace('.', ' '))
+                statuses[os.path.normpath(fields[-1])] = status
+                skip = kind == '2'
+            elif kind == '?':
+                statuses[os.path.normpath(record[2:])] = 'untracked'
+            elif kind == '!':
+                statuses[os.path.normpath(record[2:])] = 'ignored'
+        return statuses, branch, remote, revid
+
+    def data_state_files(self):
+        gitdir = self.repodir
+        if os.path.isfile(gitdir):
+            # A worktree or submodule, the file points to the git directory
+            with open(gitdir, 'r', encoding=ENCODING) as fobj:
+                gitdir = os.path.join(self.root, fobj.read().strip()[len('gitdir: '):])
+        paths = [os.path.join(gitdir, 'index'), os.path.join(gitdir, 'HEAD')]
+        try:
+            with open(os.path.join(gitdir, 'HEAD'), 'r', encoding=ENCODING) as fobj:
+                head = fobj.read().strip()
+        except (IOError, OSError):
+            return paths
+        if head.startswith('ref: '):
+            # Branches are shared by all worktrees
+            commondir = gitdir
+            try:
+                with open(os.path.join(gitdir, 'commondir'), 'r', encoding=ENCODING) as fobj:
+                    commondir = os.path.join(gitdir, fobj.read().strip())
+            except (IOError, OSError):
+                pass
+            paths += [os.path.join(commondir, head[len('ref: '):]),
+                      os.path.join(commondir, 'packed-refs')]
+        return paths
+
     def data_status_remote(self):
         try:
             head = self._head_ref()
@@ -113,6 +113,9 @@ class Hg(Vcs):
 
         return statuses
 
+    def data_state_files(self):
+        return [self.repodir, os.path.join(self.repodir, 'dirstate')]
+
     def data_status_remote(self):
         if self._remote_url() is None:
             return 'none'
@@ -126,6 +126,9 @@ class SVN(Vcs):
 
         return statuses
 
+    def data_state_files(self):
+        return [self.repodir, os.path.join(self.repodir, 'wc.db')]
+
     def data_status_remote(self):
         remote = self._remote_url()
         if remote is None or remote.startswith('file://'):
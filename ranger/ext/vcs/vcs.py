@@ -5,13 +5,18 @@
 
 from __future__ import (absolute_import, division, print_function)
 
+import json
 import os
 import subprocess
 import threading
 import time
+from datetime import datetime
+from hashlib import sha256
 from io import open
 
+import ranger
 from ranger.ext import spawn
+from ranger.ext.worker_pool import WorkerPool
 
 # Python 2 compatibility
 try:
@@ -220,18 +225,66 @@ class Vcs(object):  # pylint: disable=too-many-instance-attributes
         """Returns the current named branch, if this makes sense for the backend. None otherwise"""
         raise NotImplementedError
 
+    def data_status(self):
+        """
+        Returns (subpath statuses, branch, remote status, head revision id)
+        The first three as returned by data_status_subpaths, data_branch and
+        data_status_remote. Backends that can gather them at once may override
+        this, the head revision id is None when unknown
+        """
+        return (self.data_status_subpaths(), self.data_branch(), self.data_status_remote(),
+                None)
+
     def data_info(self, rev=None):
         """Returns info string about revision rev. None in special cases"""
         raise NotImplementedError
 
+    def data_state_files(self):
+        """
+        Returns paths of the files of the repository whose modification times
+        change when its index, branch or head change, without running the backend
+        """
+        return [self.repodir]
+
 
-class VcsRoot(Vcs):  # pylint: disable=abstract-method
+class VcsRoot(Vcs):  # pylint: disable=abstract-method,too-many-instance-attributes
     """Vcs root"""
     rootinit = False
     head = None
     branch = None
     updatetime = None
     status_subpaths = None
+    # Most important status in DIRSTATUSES of the subpaths of each directory,
+    # built from status_subpaths by _index_status_subpaths
+    status_directories = {}
+    # Version of the format of the status cache files
+    STATUS_CACHE_VERSION = 1
+    status_cache_tried = False
+    # The content of the cache file as last loaded or written
+    status_cache = None
+
+    def _index_status_subpaths(self, status_subpaths):
+        """Returns status_subpaths aggregated for status_directories
+
+        Each subpath raises the status of its parent directories, stopping at
+        the first one that already has a status at least as important, so
+        looking up a directory later does not depend on the number of
+        subpaths.
+        """
+        priorities = dict((status, i) for i, status in enumerate(self.DIRSTATUSES))
+        directories = {}
+        for subpath, status in status_subpaths.items():
+            priority = priorities.get(status)
+            if priority is None:
+                continue
+            parent = os.path.dirname(subpath)
+            while parent:
+                if directories.get(parent, len(priorities)) <= priority:
+                    break
+                directories[parent] = priority
+                parent = os.path.dirname(parent)
+        return dict(
+            (path, self.DIRSTATUSES[priority]) for path, priority in directories.items())
 
     def _status_root(self):
         """Returns root status"""
@@ -244,8 +297,99 @@ class VcsRoot(Vcs):  # pylint: disable=abstract-method
                 return status
         return 'sync'
 
+    def _status_cache_path(self):
+        path = self.path
+        if ranger.PY3:
+            path = path.encode('utf-8', 'surrogateescape')
+        return os.path.join(ranger.args.cachedir, 'vcs', sha256(path).hexdigest() + '.json')
+
+    def _status_cache_key(self):
+        """The modification times and sizes of the state files of the backend"""
+        key = []
+        for path in self.data_state_files():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                key.append([path, None, None])
+            else:
+                key.append([path, stat.st_mtime, stat.st_size])
+        return key
+
+    def load_status_cache(self):
+        """Take the state from the cache of the last update, if still valid
+
+        The cache is only valid while the state files of the backend, e.g. the
+        index and the current branch of git, are unchanged.  Changes in the
+        work tree are not noticed, so the root stays outdated until the next
+        update_root.
+        """
+        self.status_cache_tried = True
+        if not self.obj.settings.vcs_status_cache:
+            return False
+        try:
+            with open(self._status_cache_path(), 'r', encoding='utf-8') as fobj:
+                cache = json.load(fobj)
+        except (IOError, OSError, ValueError):
+            return False
+        try:
+            if cache['version'] != self.STATUS_CACHE_VERSION \
+                    or cache['key'] != self._status_cache_key():
+                return False
+            head = cache['head']
+            if head is not None:
+                head = dict(head)
+                head['date'] = datetime.fromtimestamp(head['date'])
+            self.head = head
+            self.branch = cache['branch']
+            status_subpaths = cache['status_subpaths']
+            self.obj.vcsremotestatus = cache['remote']
+            status_directories = self._index_status_subpaths(status_subpaths)
+        except (KeyError, TypeError, ValueError, AttributeError):
+            return False
+        self.status_cache = cache
+        self.status_subpaths, self.status_directories = status_subpaths, status_directories
+        self.obj.vcsstatus = self._status_root()
+        self.rootinit = True
+        return True
+
+    def dump_status_cache(self):
+        """Save the state of the root for load_status_cache
+
+        The file is only written when the state differs from the one last
+        loaded or written.
+        """
+        if not self.obj.settings.vcs_status_cache:
+            return
+        head = self.head
+        if head is not None:
+            head = dict(head)
+            head['date'] = time.mktime(head['date'].timetuple())
+        cache = {
+            'version': self.STATUS_CACHE_VERSION,
+            'key': self._status_cache_key(),
+            'head': head,
+            'branch': self.branch,
+            'remote': self.obj.vcsremotestatus,
+            'status_subpaths': self.status_subpaths,
+        }
+        if cache == self.status_cache:
+            return
+        path = self._status_cache_path()
+        try:
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            # Write a temporary file first, others may read the cache any time
+            with open(path + '.tmp', 'w', encoding='utf-8') as fobj:
+                json.dump(cache, fobj)
+            os.rename(path + '.tmp', path)
+        except (IOError, OSError):
+            return
+        self.status_cache = cache
+
     def init_root(self):
         """Initialize root cheaply"""
+        if not self.status_cache_tried and self.load_status_cache():
+            return True
         try:
             self.head = self.data_info(self.HEAD)
             self.branch = self.data_branch()
@@ -260,16 +404,22 @@ class VcsRoot(Vcs):  # pylint: disable=abstract-method
     def update_root(self):
         """Update root state"""
         try:
-            self.head = self.data_info(self.HEAD)
-            self.branch = self.data_branch()
-            self.status_subpaths = self.data_status_subpaths()
-            self.obj.vcsremotestatus = self.data_status_remote()
+            status_subpaths, self.branch, self.obj.vcsremotestatus, revid = \
+                self.data_status()
+            # The log of HEAD is only needed again when HEAD moved
+            if revid is None or self.head is None or self.head['revid'] != revid:
+                self.head = self.data_info(self.HEAD)
+            # Both at once, status_subpath may look them up from the main thread
+            self.status_subpaths, self.status_directories = \
+                status_subpaths, self._index_status_subpaths(status_subpaths)
             self.obj.vcsstatus = self._status_root()
         except VcsError as ex:
             self.obj.fm.notify('VCS Exception: View log for more info', bad=True, exception=ex)
             return False
         self.rootinit = True
+        # Taken afterwards, as gathering the state may rewrite e.g. the git index
         self.updatetime = time.time()
+        self.dump_status_cache()
         return True
 
     def _update_walk(self, path, purge):  # pylint: disable=too-many-branches
@@ -341,24 +491,84 @@ class VcsRoot(Vcs):  # pylint: disable=abstract-method
         if purge:
             self.init_state(self.obj)
 
-    def check_outdated(self):
-        """Check if root is outdated"""
+    def _iter_loaded_directories(self):
+        """Yields the loaded directories tracked by this root"""
+        prefixes = tuple(path + '/' for path in [self.path] + list(self.links))
+        repodir = self.repodir + '/'
+        # The directories may change in the main thread
+        for dirobj in list(self.obj.fm.directories.values()):
+            if dirobj.path != self.path and not dirobj.path.startswith(prefixes) \
+                    and dirobj.path not in self.links:
+                continue
+            if dirobj.path.startswith(repodir) or not dirobj.vcs \
+                    or dirobj.vcs.rootvcs is not self:
+                continue
+            yield dirobj
+
+    def _walk_outdated(self):
+        """Walks the work tree for anything modified since the last update
+
+        Only stats paths, no directory objects are created for them.
+        """
+        for wroot, wdirs, wfiles in os.walk(self.path):
+            if os.stat(wroot).st_mtime > self.updatetime:
+                return True
+            wdirs[:] = [
+                wdir for wdir in wdirs
+                if os.path.join(wroot, wdir) != self.repodir
+                and not self._get_repotype(os.path.join(wroot, wdir))[0]
+            ]
+            for wfile in wfiles:
+                try:
+                    if os.lstat(os.path.join(wroot, wfile)).st_mtime > self.updatetime:
+                        return True
+                except OSError:
+                    continue
+        return False
+
+    def _loaded_outdated(self):
+        """Check if the loaded directories or their files changed since the update"""
+        for dirobj in self._iter_loaded_directories():
+            try:
+                if os.stat(dirobj.path).st_mtime > self.updatetime:
+                    return True
+            except OSError:
+                # A removed directory is a change, too
+                return True
+            for fsobj in dirobj.files_all or ():
+                # Deferred stats would be taken from this thread, changes of
+                # those files are only found by walking
+                if fsobj.stat_deferred:
+                    continue
+                if fsobj.stat and fsobj.stat.st_mtime > self.updatetime:
+                    return True
+        return False
+
+    def check_outdated(self, walk=False):
+        """Check if root is outdated
+
+        The cheap signals are the state files of the backend, e.g. the index and
+        HEAD of git, and the loaded directories and their files.  Changes in
+        directories that are not loaded are only found with walk.
+        """
         if self.updatetime is None:
             return True
 
-        for wroot, wdirs, _ in os.walk(self.path):
-            wrootobj = self.obj.fm.get_directory(wroot)
-            wrootobj.load_if_outdated()
-            if wroot != self.path and wrootobj.vcs.is_root_pointer:
-                wdirs[:] = []
+        for path in self.data_state_files():
+            try:
+                if os.stat(path).st_mtime > self.updatetime:
+                    return True
+            except OSError:
                 continue
 
-            if wrootobj.stat and self.updatetime < wrootobj.stat.st_mtime:
+        if self._loaded_outdated():
+            return True
+
+        if walk:
+            try:
+                return self._walk_outdated()
+            except OSError:
                 return True
-            if wrootobj.files_all:
-                for wfile in wrootobj.files_all:
-                    if wfile.stat and self.updatetime < wfile.stat.st_mtime:
-                        return True
         return False
 
     def status_subpath(self, path, is_directory=False):
@@ -381,16 +591,29 @@ class VcsRoot(Vcs):  # pylint: disable=abstract-method
 
         # check if path contains some file in status
         if is_directory:
-            statuses = set(status for subpath, status in self.status_subpaths.items()
-                           if subpath.startswith(relpath + '/'))
-            for status in self.DIRSTATUSES:
-                if status in statuses:
-                    return status
+            return self.status_directories.get(relpath, 'sync')
         return 'sync'
 
 
+def _run_root_job(rootvcs, method):
+    """Run init_root or update_root of rootvcs, in a worker of VcsThread"""
+    return rootvcs, method, getattr(rootvcs, method)()
+
+
 class VcsThread(threading.Thread):  # pylint: disable=too-many-instance-attributes
-    """VCS thread"""
+    """VCS thread
+
+    The counters refreshes_run, refreshes_skipped (the root was up to date)
+    and requests_coalesced (merged into a pending request) show how much work
+    the scheduler saved.
+    """
+
+    # Seconds to wait for more requests for a directory before processing it,
+    # but no longer than max_delay after the first one
+    debounce_time = 0.1
+    max_delay = 1.0
+    # Minimum seconds between two refreshes of the same root
+    refresh_interval = 1.0
 
     def __init__(self, ui):
         super(VcsThread, self).__init__()
@@ -405,6 +628,20 @@ class VcsThread(threading.Thread):  # pylint: disable=too-many-instance-attribut
         self._awoken = threading.Event()
         self._redraw = False
         self._roots = set()
+        # path: (dirobj, walk, due time, time of the first request)
+        self._pending = {}
+        # root path: (rootvcs, walk, due time)
+        self._deferred_roots = {}
+        self._refresh_times = {}
+        # (rootvcs, method) to run in the pool at the end of a pass
+        self._jobs = []
+        self._links = []
+        self._pool = None
+        self.refreshes_run = 0
+        self.refreshes_skipped = 0
+        self.requests_coalesced = 0
+        # Source of the current time of the scheduler, replaceable in tests
+        self.clock = time.time
 
     def _is_targeted(self, dirobj):
         """Check if dirobj is targeted"""
@@ -425,45 +662,133 @@ class VcsThread(threading.Thread):  # pylint: disable=too-many-instance-attribut
             rootvcs = fsobj.vcs.rootvcs
             if fsobj.vcs.is_root_pointer:
                 has_vcschild = True
-                if not rootvcs.rootinit and not self._is_targeted(rootvcs.obj):
+                if not rootvcs.rootinit and not self._is_targeted(rootvcs.obj) \
+                        and rootvcs.path not in self._roots:
                     self._roots.add(rootvcs.path)
-                    if not rootvcs.init_root():
-                        rootvcs.update_tree(purge=True)
-                    self._redraw = True
+                    self._jobs.append((rootvcs, 'init_root'))
                 if fsobj.is_link:
-                    fsobj.vcsstatus = rootvcs.obj.vcsstatus
-                    fsobj.vcsremotestatus = rootvcs.obj.vcsremotestatus
-                    self._redraw = True
+                    # Updated once the root is initialized
+                    self._links.append(fsobj)
 
         return has_vcschild
 
-    def _queue_process(self):  # pylint: disable=too-many-branches
-        """Process queue"""
-        dirobjs = []
-        paths = set()
+    def _is_prioritized(self, dirobj):
+        """Check if dirobj is the current directory or the one under the cursor"""
+        fm = self._ui.fm
+        return dirobj is getattr(fm, 'thisdir', None) \
+            or dirobj is getattr(fm, 'thisfile', None) or self._is_targeted(dirobj)
+
+    def _timeout(self):
+        """Seconds until the next scheduled work is due, None without any"""
+        dues = [due for _, _, due, _ in self._pending.values()]
+        dues += [due for _, _, due in self._deferred_roots.values()]
+        if not dues:
+            return None
+        return max(0, min(dues) - self.clock())
+
+    def _refresh_root(self, rootvcs, walk, now):
+        """Refresh rootvcs if it is outdated and was not refreshed too recently"""
+        self._roots.add(rootvcs.path)
+        # Until the first update, the statuses of the last session do
+        if not rootvcs.status_cache_tried and rootvcs.load_status_cache():
+            rootvcs.update_tree()
+            self._redraw = True
+        if not rootvcs.check_outdated(walk=walk):
+            self.refreshes_skipped += 1
+            return
+        last = self._refresh_times.get(rootvcs.path)
+        if last is not None and now - last < self.refresh_interval:
+            if rootvcs.path in self._deferred_roots:
+                self.requests_coalesced += 1
+                walk = walk or self._deferred_roots[rootvcs.path][1]
+            self._deferred_roots[rootvcs.path] = (rootvcs, walk, last + self.refresh_interval)
+            return
+        self._deferred_roots.pop(rootvcs.path, None)
+        self._refresh_times[rootvcs.path] = now
+        self.refreshes_run += 1
+        self._jobs.append((rootvcs, 'update_root'))
+
+    def _run_jobs(self):
+        """Run the collected root jobs in the worker pool and apply the results
+
+        Different roots don't share state, so they are initialized or updated
+        concurrently.  The trees are updated here, one after another, as the
+        results come in.
+        """
+        if self._jobs:
+            workers = max(1, self._ui.fm.settings.vcs_workers)
+            if self._pool is None or self._pool.workers != workers:
+                if self._pool is not None:
+                    self._pool.shutdown()
+                self._pool = WorkerPool(workers, name='VcsWorker')
+
+            results = queue.Queue()
+            for rootvcs, method in self._jobs:
+                self._pool.submit(results, _run_root_job, rootvcs, method)
+            for _ in self._jobs:
+                result, exception = results.get()
+                if exception is not None:
+                    self._ui.fm.notify('VCS Exception: View log for more info', bad=True,
+                                       exception=exception)
+                    continue
+                rootvcs, method, success = result
+                if not success:
+                    rootvcs.update_tree(purge=True)
+                elif method == 'update_root':
+                    rootvcs.update_tree()
+                self._redraw = True
+            self._jobs = []
+
+        for fsobj in self._links:
+            rootvcs = fsobj.vcs.rootvcs
+            fsobj.vcsstatus = rootvcs.obj.vcsstatus
+            fsobj.vcsremotestatus = rootvcs.obj.vcsremotestatus
+            self._redraw = True
+        self._links = []
+
+    def _queue_process(self):
+        """Process the queued directories and roots that are due
+
+        Requests for a directory are coalesced and processed once no new
+        request came for debounce_time (or max_delay passed), the current
+        directory and the one under the cursor come first and without delay.
+        Outdated roots are refreshed at most once every refresh_interval, later
+        requests wait until then.  The roots are initialized and updated in
+        vcs_workers threads.
+        """
         self._roots.clear()
+        now = self.clock()
 
         while True:
             try:
-                dirobjs.append(self._queue.get(block=False))
+                dirobj, walk = self._queue.get(block=False)
             except queue.Empty:
                 break
-
-        for dirobj in dirobjs:
-            if dirobj.path in paths:
-                continue
-            paths.add(dirobj.path)
-
+            due_time = now + self.debounce_time
+            if dirobj.path in self._pending:
+                self.requests_coalesced += 1
+                _, pending_walk, _, first_time = self._pending[dirobj.path]
+                walk = walk or pending_walk
+                # Don't postpone a directory forever while it keeps changing
+                due_time = min(due_time, first_time + self.max_delay)
+            else:
+                first_time = now
+            self._pending[dirobj.path] = (dirobj, walk, due_time, first_time)
+
+        due = []
+        for path, (dirobj, walk, due_time, _) in list(self._pending.items()):
+            prioritized = self._is_prioritized(dirobj)
+            if prioritized or due_time <= now:
+                del self._pending[path]
+                due.append((not prioritized, due_time, dirobj, walk))
+        due.sort(key=lambda item: item[:2])
+
+        for _, _, dirobj, walk in due:
             dirobj.vcs.reinit()
             if dirobj.vcs.track:
                 rootvcs = dirobj.vcs.rootvcs
-                if rootvcs.path not in self._roots and rootvcs.check_outdated():
-                    self._roots.add(rootvcs.path)
-                    if rootvcs.update_root():
-                        rootvcs.update_tree()
-                    else:
-                        rootvcs.update_tree(purge=True)
-                    self._redraw = True
+                if rootvcs.path not in self._roots:
+                    self._refresh_root(rootvcs, walk, now)
 
             has_vcschild = self._update_subroots(dirobj.files_all)
 
@@ -471,11 +796,17 @@ class VcsThread(threading.Thread):  # pylint: disable=too-many-instance-attribut
                 dirobj.has_vcschild = has_vcschild
                 self._redraw = True
 
+        for path, (rootvcs, walk, due_time) in list(self._deferred_roots.items()):
+            if due_time <= now and path not in self._roots:
+                self._refresh_root(rootvcs, walk, now)
+
+        self._run_jobs()
+
     def run(self):
         while True:
             self.paused.set()
             self._advance.wait()
-            self._awoken.wait()
+            self._awoken.wait(self._timeout())
             if self.__stop.is_set():
                 self.stopped.set()
                 return
@@ -500,6 +831,8 @@ class VcsThread(threading.Thread):  # pylint: disable=too-many-instance-attribut
     def stop(self):
         """Stop thread synchronously"""
         self.__stop.set()
+        if self._pool is not None:
+            self._pool.shutdown()
         self.paused.wait(5)
         self._advance.set()
         self._awoken.set()
@@ -514,9 +847,13 @@ class VcsThread(threading.Thread):  # pylint: disable=too-many-instance-attribut
         """Unpause thread"""
         self._advance.set()
 
-    def process(self, dirobj):
-        """Process dirobj"""
-        self._queue.put(dirobj)
+    def process(self, dirobj, walk=False):
+        """Process dirobj
+
+        With walk, changes anywhere in the work tree of its repository are
+        looked for, not just in the loaded directories.
+        """
+        self._queue.put((dirobj, walk))
         self._awoken.set()
 
 
@@ -0,0 +1,88 @@
+# This file is part of ranger, the console file manager.
+# License: GNU GPL version 3, see the file "AUTHORS" for details.
+
+"""A minimal pool of worker threads.
+
+Jobs are submitted together with a queue.  When a job is done, the tuple
+(result, exception) is put on that queue, so the submitter can collect the
+results whenever it suits it, e.g. between two steps of a load_generator.
+
+>>> pool = WorkerPool(2)
+>>> results = queue.Queue()
+>>> pool.submit(results, sum, [1, 2, 3])
+>>> results.get(timeout=5)
+(6, None)
+>>> pool.submit(results, int, 'x')
+>>> result, exception = results.get(timeout=5)
+>>> isinstance(exception, ValueError)
+True
+>>> pool.shutdown()
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import threading
+
+# Python 2 compatibility
+try:
+    import queue
+except ImportError:
+    import Queue as queue  # pylint: disable=import-error
+
+
+class WorkerPool(object):
+    """Runs submitted jobs in up to `workers` daemon threads
+
+    The threads are started lazily and live until shutdown() is called.
+    """
+
+    def __init__(self, workers, name='WorkerPool'):
+        self.workers = max(1, workers)
+        self.name = name
+        self._jobs = queue.Queue()
+        self._threads = []
+        # The workers waiting for a job less the jobs waiting for a worker
+        self._idle = 0
+        self._lock = threading.Lock()
+
+    def submit(self, results, func, *args):
+        """Run func(*args) in a worker and put (result, exception) on results"""
+        self._jobs.put((results, func, args))
+        with self._lock:
+            self._idle -= 1
+            if self._idle < 0 and len(self._threads) < self.workers:
+                self._idle += 1
+                thread = threading.Thread(
+                    target=self._work,
+                    name='%s-%d' % (self.name, len(self._threads)))
+                thread.daemon = True
+                self._threads.append(thread)
+                thread.start()
+
+    def _work(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            results, func, args = job
+            try:
+                result = func(*args)
+            except Exception as ex:  # pylint: disable=broad-except
+                results.put((None, ex))
+            else:
+                results.put((result, None))
+            with self._lock:
+                self._idle += 1
+
+    def shutdown(self):
+        """Let the threads exit once the queued jobs are done"""
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._jobs.put(None)
+
+
+if __name__ == '__main__':
+    import doctest
+    import sys
+    sys.exit(doctest.testmod()[0])
@@ -1,14 +1,22 @@
+# -*- encoding: utf-8 -*-
 # This file is part of ranger, the console file manager.
 # License: GNU GPL version 3, see the file "AUTHORS" for details.
 # Author: David Barnett <davidbarnett2@gmail.com>, 2010
 
-"""A library to help to convert ANSI codes to curses instructions."""
+"""A library to help to convert ANSI codes to curses instructions.
+
+A text with ANSI codes is parsed once into runs of text with the same colors
+and attributes, see parse().  The runs of recently parsed texts are cached,
+so measuring, slicing and drawing the same lines again, as when redrawing or
+scrolling, doesn't split them with regular expressions again.
+"""
 
 from __future__ import (absolute_import, division, print_function)
 
+from collections import OrderedDict
 import re
 
-from ranger.ext.widestring import WideString
+from ranger.ext.widestring import WideString, string_to_charlist
 from ranger.gui import color
 
 
@@ -18,6 +26,14 @@ codesplit_re = re.compile(r'38;5;(\d+);|48;5;(\d+);|(\d*);')
 reset = '\x1b[0m'
 # pylint: enable=invalid-name
 
+# How many characters of parsed texts are cached
+MAX_CACHE_SIZE = 4 * 1024 * 1024
+# Characters counted for each cached text in addition to its length
+ENTRY_OVERHEAD = 64
+
+_cache = OrderedDict()
+_cache_size = [0]
+
 
 def split_ansi_from_text(ansi_text):
     if isinstance(ansi_text, WideString):
@@ -29,83 +45,196 @@ def split_ansi_from_text(ansi_text):
 # githttp://en.wikipedia.org/wiki/ANSI_escape_code
 
 
-def text_with_fg_bg_attr(ansi_text):  # pylint: disable=too-many-branches,too-many-statements
-    fg, bg, attr = -1, -1, 0
-    for chunk in split_ansi_from_text(ansi_text):
-        if chunk and chunk[0] == '\x1b':
-            if chunk[-1] != 'm':
+def _apply_codes(chunk, fg, bg, attr):  # pylint: disable=too-many-branches,too-many-statements
+    """Return (fg, bg, attr) after the escape sequence chunk
+
+    Returns None if chunk doesn't change colors or attributes.
+    """
+    if chunk[-1] != 'm':
+        return None
+    match = re.match(r'^.\[(.*).$', chunk)
+    if not match:
+        # XXX I have no test case to determine what should happen here
+        return None
+    attr_args = match.group(1)
+
+    # Convert arguments to attributes/colors
+    for x256fg, x256bg, arg in codesplit_re.findall(attr_args + ';'):
+        # first handle xterm256 codes
+        try:
+            if x256fg:       # xterm256 foreground
+                fg = int(x256fg)
                 continue
-            match = re.match(r'^.\[(.*).$', chunk)
-            if not match:
-                # XXX I have no test case to determine what should happen here
+            elif x256bg:     # xterm256 background
+                bg = int(x256bg)
                 continue
-            attr_args = match.group(1)
-
-            # Convert arguments to attributes/colors
-            for x256fg, x256bg, arg in codesplit_re.findall(attr_args + ';'):
-                # first handle xterm256 codes
-                try:
-                    if x256fg:       # xterm256 foreground
-                        fg = int(x256fg)
-                        continue
-                    elif x256bg:     # xterm256 background
-                        bg = int(x256bg)
-                        continue
-                    elif arg:        # usual ansi code
-                        n = int(arg)
-                    else:            # empty code means reset
-                        n = 0
-                except ValueError:
-                    continue
-
-                if n == 0:           # reset colors and attributes
-                    fg, bg, attr = -1, -1, 0
-
-                elif n == 1:         # enable attribute
-                    attr |= color.bold
-                elif n == 4:
-                    attr |= color.underline
-                elif n == 5:
-                    attr |= color.blink
-                elif n == 7:
-                    attr |= color.reverse
-                elif n == 8:
-                    attr |= color.invisible
-
-                elif n == 22:        # disable attribute
-                    attr &= not color.bold
-                elif n == 24:
-                    attr &= not color.underline
-                elif n == 25:
-                    attr &= not color.blink
-                elif n == 27:
-                    attr &= not color.reverse
-                elif n == 28:
-                    attr &= not color.invisible
-
-                elif 30 <= n <= 37:  # 8 ansi foreground and background colors
-                    fg = n - 30
-                elif n == 39:
-                    fg = -1
-                elif 40 <= n <= 47:
-                    bg = n - 40
-                elif n == 49:
-                    bg = -1
-
-                # 8 aixterm high intensity colors (light but not bold)
-                elif 90 <= n <= 97:
-                    fg = n - 90 + 8
-                elif n == 99:
-                    fg = -1
-                elif 100 <= n <= 107:
-                    bg = n - 100 + 8
-                elif n == 109:
-                    bg = -1
-
-            yield (fg, bg, attr)
-
-        else:
-            yield chunk
+            elif arg:        # usual ansi code
+                n = int(arg)
+            else:            # empty code means reset
+                n = 0
+        except ValueError:
+            continue
+
+        if n == 0:           # reset colors and attributes
+            fg, bg, attr = -1, -1, 0
+
+        elif n == 1:         # enable attribute
+            attr |= color.bold
+        elif n == 4:
+            attr |= color.underline
+        elif n == 5:
+            attr |= color.blink
+        elif n == 7:
+            attr |= color.reverse
+        elif n == 8:
+            attr |= color.invisible
+
+        elif n == 22:        # disable attribute
+            attr &= not color.bold
+        elif n == 24:
+            attr &= not color.underline
+        elif n == 25:
+            attr &= not color.blink
+        elif n == 27:
+            attr &= not color.reverse
+        elif n == 28:
+            attr &= not color.invisible
+
+        elif 30 <= n <= 37:  # 8 ansi foreground and background colors
+            fg = n - 30
+        elif n == 39:
+            fg = -1
+        elif 40 <= n <= 47:
+            bg = n - 40
+        elif n == 49:
+            bg = -1
+
+        # 8 aixterm high intensity colors (light but not bold)
+        elif 90 <= n <= 97:
+            fg = n - 90 + 8
+        elif n == 99:
+            fg = -1
+        elif 100 <= n <= 107:
+            bg = n - 100 + 8
+        elif n == 109:
+            bg = -1
+
+    return (fg, bg, attr)
+
+
+def _parse(text):
+    runs = []
+    codes, fg_bg_attr = '', None
+    state = (-1, -1, 0)
+    chunks = ansi_re.split(text)
+    for i, chunk in enumerate(chunks):
+        if i % 2 == 1:
+            codes += chunk
+            new_state = _apply_codes(chunk, *state)
+            if new_state is not None:
+                state = fg_bg_attr = new_state
+            continue
+        if not chunk and (not codes or i + 1 < len(chunks)):
+            # Merge the codes with those of the next text
+            continue
+        chars = string_to_charlist(chunk)
+        if len(chars) == len(chunk):
+            chars = None
+        runs.append((codes, fg_bg_attr, chunk, chars))
+        codes, fg_bg_attr = '', None
+    return tuple(runs)
+
+
+def parse(ansi_text):
+    """Split a text with ANSI codes into runs of text with the same colors
+
+    Returns a tuple of runs (codes, fg_bg_attr, text, chars).  codes are the
+    escape sequences before the text, fg_bg_attr is the (fg, bg, attr) tuple
+    they result in or None if they don't change it, and chars is the list of
+    characters from string_to_charlist() or None if each character takes one
+    cell.  The result is cached.
+
+    >>> parse("a\x1b[1m\x1b[31mb")[1][:3] == ('\x1b[1m\x1b[31m', (1, -1, color.bold), 'b')
+    True
+    >>> [run[2] for run in parse("a\x1b[31mb\x1b[0m")]
+    ['a', 'b', '']
+    """
+    if isinstance(ansi_text, WideString):
+        ansi_text = ansi_text.string
+    try:
+        runs = _cache.pop(ansi_text)
+    except KeyError:
+        runs = _parse(ansi_text)
+        size = len(ansi_text) + ENTRY_OVERHEAD
+        if size > MAX_CACHE_SIZE:
+            return runs
+        _cache_size[0] += size
+        while _cache_size[0] > MAX_CACHE_SIZE:
+            text, _ = _cache.popitem(last=False)
+            _cache_size[0] -= len(text) + ENTRY_OVERHEAD
+    _cache[ansi_text] = runs
+    return runs
+
+
+def _width(run):
+    return len(run[2] if run[3] is None else run[3])
+
+
+def runs_with_fg_bg_attr(runs):
+    """Yield the texts of runs and (fg, bg, attr) tuples where they change"""
+    for _, fg_bg_attr, text, _ in runs:
+        if fg_bg_attr is not None:
+            yield fg_bg_attr
+        yield text
+
+
+def text_with_fg_bg_attr(ansi_text):
+    return runs_with_fg_bg_attr(parse(ansi_text))
+
+
+def slice_runs(runs, start, length):
+    """Return the runs of the cells from start to start + length
+
+    The first run has the codes and colors of the run it was sliced from.
+    Halves of wide characters at the edges become spaces.
+
+    >>> runs = parse("ab\x1b[31mモヒカン\x1b[0mcd")
+    >>> [run[2] for run in slice_runs(runs, 2, 4)] == ['モヒ']
+    True
+    >>> [run[2] for run in slice_runs(runs, 3, 4)] == [' ヒ ']
+    True
+    >>> [run[2] for run in slice_runs(runs, 1, 6)] == ['b', 'モヒ ']
+    True
+    >>> [run[:3] for run in slice_runs(runs, 9, 5)] == [
+    ...     ('\x1b[31m', (1, -1, 0), ' '), ('\x1b[0m', (-1, -1, 0), 'cd')]
+    True
+    """
+    if length <= 0:
+        return ()
+    result = []
+    codes, fg_bg_attr = '', None
+    pos = 0
+    for run in runs:
+        if run[0]:
+            codes, fg_bg_attr = run[0], run[1]
+        old_pos = pos
+        pos += _width(run)
+        if pos > start:
+            text, chars = run[2], run[3]
+            begin = max(0, start - old_pos)
+            end = start - old_pos + length
+            if begin > 0 or end < pos - old_pos:
+                if chars is None:
+                    text = text[begin:end]
+                else:
+                    text = str(WideString(text, chars)[begin:end])
+                    chars = string_to_charlist(text)
+                    if len(chars) == len(text):
+                        chars = None
+            result.append((codes, fg_bg_attr, text, chars))
+        if pos - start >= length:
+            break
+    return tuple(result)
 
 
 def char_len(ansi_text):
@@ -123,10 +252,7 @@ def char_len(ansi_text):
     0
     """
 
-    if isinstance(ansi_text, WideString):
-        ansi_text = ansi_text.string
-
-    return len(WideString(ansi_re.sub('', ansi_text)))
+    return sum(_width(run) for run in parse(ansi_text))
 
 
 def char_slice(ansi_text, start, length):
@@ -153,31 +279,8 @@ def char_slice(ansi_text, start, length):
     >>> char_slice(test_string, 9, 4)
     '\\x1b[31mar\\x1b[0mno'
     """
-    chunks = []
-    last_color = ""
-    pos = old_pos = 0
-    for i, chunk in enumerate(split_ansi_from_text(ansi_text)):
-        if i % 2 == 1:
-            last_color = chunk
-            continue
-
-        chunk = WideString(chunk)
-        old_pos = pos
-        pos += len(chunk)
-        if pos <= start:
-            pass  # seek
-        elif old_pos < start <= pos:
-            chunks.append(last_color)
-            chunks.append(str(chunk[start - old_pos:start - old_pos + length]))
-        elif pos > length + start:
-            chunks.append(last_color)
-            chunks.append(str(chunk[:start - old_pos + length]))
-        else:
-            chunks.append(last_color)
-            chunks.append(str(chunk))
-        if pos - start >= length:
-            break
-    return ''.join(chunks)
+    return ''.join(codes + text for codes, _, text, _ in
+                   slice_runs(parse(ansi_text), start, length))
 
 
 if __name__ == '__main__':
@@ -6,17 +6,24 @@
 from __future__ import (absolute_import, division, print_function)
 
 import curses
+from io import open
 import logging
+import os
+from time import time
 
 from ranger.gui import ansi
 from ranger.ext.direction import Direction
 from ranger.ext.img_display import ImgDisplayUnsupportedException
+from ranger.ext.mapped_lines import FAR_AWAY, MappedLines
 
 from . import Widget
 
 
 LOG = logging.getLogger(__name__)
 
+# Seconds between two checks whether a followed file changed
+FOLLOW_INTERVAL = 0.2
+
 
 # TODO: Scrolling in embedded pager
 class Pager(Widget):  # pylint: disable=too-many-instance-attributes
@@ -29,6 +36,8 @@ class Pager(Widget):  # pylint: disable=too-many-instance-attributes
     need_clear_image = False
     need_redraw_image = False
     max_width = None
+    follow_path = None
+    follow_time = 0
 
     def __init__(self, win, embedded=False):
         Widget.__init__(self, win)
@@ -42,7 +51,10 @@ class Pager(Widget):  # pylint: disable=too-many-instance-attributes
         self.image_drawn = False
 
     def _close_source(self):
-        if self.source and self.source_is_stream:
+        if isinstance(self.lines, MappedLines):
+            self.lines.close()
+            self.lines = []
+        if self.source is not None and hasattr(self.source, 'close'):
             try:
                 self.source.close()
             except OSError as ex:
@@ -66,6 +78,7 @@ class Pager(Widget):  # pylint: disable=too-many-instance-attributes
         if self.image:
             self.need_clear_image = True
             self.clear_image()
+        self.follow_path = None
         self._close_source()
 
     def destroy(self):
@@ -75,13 +88,24 @@ class Pager(Widget):  # pylint: disable=too-many-instance-attributes
     def finalize(self):
         self.fm.ui.win.move(self.y, self.x)
 
+    def _line_count(self, needed):
+        """Return the number of lines, counting no further than needed"""
+        if isinstance(self.lines, MappedLines):
+            return self.lines.extent(needed)
+        return len(self.lines)
+
     def scrollbit(self, lines):
         target_scroll = self.scroll_extra + lines
-        max_scroll = len(self.lines) - self.hei
+        max_scroll = self._line_count(target_scroll + self.hei) - self.hei
         self.scroll_extra = max(0, min(target_scroll, max_scroll))
         self.need_redraw = True
 
     def draw(self):
+        if self.follow_path is not None and time() - self.follow_time > FOLLOW_INTERVAL:
+            self.follow_time = time()
+            if self._update_followed():
+                self.need_redraw = True
+
         if self.need_clear_image:
             self.need_redraw = True
 
@@ -134,15 +158,18 @@ class Pager(Widget):  # pylint: disable=too-many-instance-attributes
             except curses.error:
                 pass
             else:
-                for chunk in ansi.text_with_fg_bg_attr(line):
+                for chunk in ansi.runs_with_fg_bg_attr(line):
                     if isinstance(chunk, tuple):
                         self.set_fg_bg_attr(*chunk)
                     else:
                         self.addstr(chunk)
+                self.set_fg_bg_attr(-1, -1, 0)
 
     def move(self, narg=None, **kw):
         direction = Direction(kw)
         if direction.horizontal():
+            if self.max_width is None:
+                self.max_width = max(len(line) for line in self.lines) if self.lines else 0
             self.startx = direction.move(
                 direction=direction.right(),
                 override=narg,
@@ -167,14 +194,92 @@ class Pager(Widget):  # pylint: disable=too-many-instance-attributes
                 # Then, read the new lines as needed to produce a more accurate
                 # maximum for the movement:
                 self._get_line(desired_position + self.hei)
+                maximum = len(self.lines)
+            elif isinstance(self.lines, MappedLines):
+                # Only index the file as far as the movement goes
+                desired_position = direction.move(maximum=FAR_AWAY, **movement)
+                maximum = self.lines.extent(desired_position + self.hei)
+            else:
+                maximum = len(self.lines)
             self.scroll_begin = direction.move(
-                maximum=len(self.lines),
+                maximum=maximum,
                 **movement)
 
     def press(self, key):
         self.fm.ui.keymaps.use_keymap('pager')
         self.fm.ui.press(key)
 
+    def follow(self, path):
+        """Show the file at path and what is appended to it, like tail -f
+
+        Stops following if path is None.  Returns whether path is followed.
+        """
+        if path is None:
+            self.follow_path = None
+            return False
+        if not os.path.isfile(path):
+            return False
+        try:
+            source = open(path, 'rb')  # pylint: disable=consider-using-with
+        except (IOError, OSError) as ex:
+            LOG.debug("Unable to follow %s: %s", path, ex)
+            return False
+        self.set_source(source)
+        if not isinstance(self.lines, MappedLines):
+            # Empty for now, or not a regular file
+            self.source_is_stream = False
+            self.lines = []
+        self.follow_path = path
+        self.move(to=-1)
+        return True
+
+    def _update_followed(self):
+        """Show what was appended to the followed file
+
+        Reopens it if it was replaced, e.g. by log rotation, and starts over
+        if it was truncated.  Keeps the end in view if it was in view before.
+        Returns whether anything changed.
+        """
+        try:
+            stat_path = os.stat(self.follow_path)
+            stat_fd = os.fstat(self.source.fileno())
+        except (OSError, ValueError):
+            # Replaced, but the new file doesn't exist yet
+            return False
+        lines = self.lines
+        at_end = self._line_count(self.scroll_begin + self.hei + 1) \
+            <= self.scroll_begin + self.hei
+        changed = False
+        if (stat_path.st_dev, stat_path.st_ino) != (stat_fd.st_dev, stat_fd.st_ino):
+            try:
+                source = open(self.follow_path, 'rb')  # pylint: disable=consider-using-with
+            except (IOError, OSError):
+                return False
+            self._close_source()
+            self.source = self.old_source = source
+            self.scroll_begin = 0
+            changed = True
+        elif isinstance(lines, MappedLines):
+            appended = lines.update()
+            if appended == 0:
+                return False
+            if appended is None:
+                # Truncated, the lines are no longer valid
+                self.lines.close()
+                self.lines = []
+                self.scroll_begin = 0
+                changed = True
+        if not isinstance(self.lines, MappedLines):
+            if not MappedLines.supports(self.source):
+                return changed
+            try:
+                self.lines = MappedLines(self.source)
+            except (EnvironmentError, ValueError):
+                return changed
+        if at_end:
+            self.scroll_begin = max(0, len(self.lines) - self.hei)
+        return True
+
     def set_image(self, image):
         if self.image:
             self.need_clear_image = True
@@ -187,19 +292,27 @@ class Pager(Widget):  # pylint: disable=too-many-instance-attributes
         if self.image:
             self.image = None
             self.need_clear_image = True
+        self.follow_path = None
         self._close_source()
 
         self.max_width = 0
         if isinstance(source, str):
             self.source_is_stream = False
             self.lines = source.splitlines()
-            if self.lines:
-                self.max_width = max(len(line) for line in self.lines)
+            # Measured when scrolling horizontally
+            self.max_width = None
         elif hasattr(source, '__getitem__'):
             self.source_is_stream = False
             self.lines = source
-            if self.lines:
-                self.max_width = max(len(line) for line in source)
+            self.max_width = None
+        elif hasattr(source, 'readline') and MappedLines.supports(source):
+            # Regular files are mapped into memory instead of being read
+            self.source_is_stream = False
+            try:
+                self.lines = MappedLines(source)
+            except (EnvironmentError, ValueError):
+                self.source_is_stream = True
+                self.lines = []
         elif hasattr(source, 'readline'):
             self.source_is_stream = True
             self.lines = []
@@ -209,7 +322,7 @@ class Pager(Widget):  # pylint: disable=too-many-instance-attributes
             return False
         self.markup = 'ansi'
 
-        if not self.source_is_stream and strip:
+        if not self.source_is_stream and strip and not isinstance(self.lines, MappedLines):
             self.lines = [line.strip() for line in self.lines]
 
         self.source = source
@@ -225,7 +338,11 @@ class Pager(Widget):  # pylint: disable=too-many-instance-attributes
     def _get_line(self, n, attempt_to_read=True):
         assert isinstance(n, int), n
         try:
-            return self.lines[n]
+            line = self.lines[n]
+            if isinstance(self.lines, MappedLines):
+                # The widest line isn't known before all are read
+                self.max_width = max(self.max_width, len(line))
+            return line
         except (KeyError, IndexError):
             if attempt_to_read and self.source_is_stream:
                 try:
@@ -251,13 +368,12 @@ class Pager(Widget):  # pylint: disable=too-many-instance-attributes
                              range(max(1, ((len(line) - 1) // self.wid) + 1))):
                     shift = part * self.wid
                     if self.markup == 'ansi':
-                        line_bit = (ansi.char_slice(line, startx + shift,
-                                                    self.wid + shift)
-                                    + ansi.reset)
+                        # The line is only parsed once, see ansi.parse()
+                        yield ansi.slice_runs(ansi.parse(line.rstrip('\r\n')),
+                                              startx + shift, self.wid)
                     else:
-                        line_bit = line[startx + shift:self.wid + startx
-                                        + shift]
-                    yield line_bit.rstrip().replace('\r\n', '\n')
+                        line_bit = line[startx + shift:self.wid + startx + shift]
+                        yield line_bit.rstrip().replace('\r\n', '\n')
             except IndexError:
                 return
             i += 1
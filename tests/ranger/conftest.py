@@ -0,0 +1,37 @@
+from __future__ import (absolute_import, division, print_function)
+
+import pytest
+
+import ranger
+from ranger.container.settings import Settings
+from ranger.core.fm import FM
+from ranger.core.shared import FileManagerAware, SettingsAware
+from ranger.ext.openstruct import OpenStruct
+
+
+def restore_attribute(cls, name, value):
+    """Set the attribute name of cls back to value, None if it had none"""
+    if value is not None:
+        setattr(cls, name, value)
+    elif name in vars(cls):
+        delattr(cls, name)
+
+
+@pytest.fixture(name='fm')
+def fixture_fm():
+    """An FM with the default settings, set up as the global one"""
+    old_args = ranger.args
+    old_fm = vars(FileManagerAware).get('fm')
+    old_settings = vars(SettingsAware).get('settings')
+
+    ranger.args = OpenStruct(clean=True, debug=False)
+    SettingsAware.settings_set(Settings())
+    fm = FM()
+    fm.thistab = OpenStruct(path=None, thisdir=None, thisfile=None,
+                            ensure_correct_pointer=lambda: None)
+    FileManagerAware.fm_set(fm)
+    yield fm
+
+    ranger.args = old_args
+    restore_attribute(FileManagerAware, 'fm', old_fm)
+    restore_attribute(SettingsAware, 'settings', old_settings)
@@ -0,0 +1,198 @@
+from __future__ import (absolute_import, division, print_function)
+
+from io import open
+import os
+
+import pytest
+
+from ranger.container import directory as directory_module, fsobject
+from ranger.container.directory import scandir
+from ranger.container.fsobject import CompactStat
+
+
+def touch(*paths):
+    for path in paths:
+        with open(str(path), 'w', encoding='utf-8'):
+            pass
+
+
+def load(fm, path, **kw):
+    directory = fm.get_directory(str(path))
+    directory.load_content(schedule=False, **kw)
+    return directory
+
+
+def load_listing(fm, path):
+    """Load path until the listing is done, before the deferred stats"""
+    directory = fm.get_directory(str(path))
+    directory.load_generator = directory.load_bit_by_bit()
+    while directory.loading or not directory.content_loaded:
+        next(directory.load_generator)
+    return directory
+
+
+def test_stat_workers_load_everything(fm, tmpdir):
+    touch(*[tmpdir.join('file%d' % i) for i in range(300)])
+    tmpdir.mkdir('subdir')
+    serial = [fobj.path for fobj in load(fm, tmpdir).files_all]
+
+    fm.directories.clear()
+    fm.settings.stat_workers = 4
+    threaded = [fobj.path for fobj in load(fm, tmpdir).files_all]
+    assert threaded == serial
+    assert len(serial) == 301
+
+
+class CountingEntry(object):  # pylint: disable=too-few-public-methods
+    """An os.DirEntry that counts its stat() calls"""
+
+    def __init__(self, entry, calls):
+        self._entry = entry
+        self._calls = calls
+
+    def __getattr__(self, name):
+        return getattr(self._entry, name)
+
+    def stat(self, follow_symlinks=True):
+        self._calls.append(self._entry.name)
+        return self._entry.stat(follow_symlinks=follow_symlinks)
+
+
+@pytest.mark.skipif(scandir is None, reason="needs os.scandir")
+def test_scandir_defers_stat(fm, tmpdir, monkeypatch):
+    touch(*[tmpdir.join('file%d' % i) for i in range(20)])
+    tmpdir.mkdir('subdir')
+    calls = []
+    monkeypatch.setattr(directory_module, 'scandir', lambda path: [
+        CountingEntry(entry, calls) for entry in scandir(path)])
+    lstats = []
+    real_lstat = fsobject.lstat
+    monkeypatch.setattr(fsobject, 'lstat', lambda path: lstats.append(path) or real_lstat(path))
+
+    fm.settings.sort = 'natural'
+    directory = load_listing(fm, tmpdir)
+    assert len(directory.files_all) == 21
+    # Only the subdirectory needs a stat for its cached Directory object
+    assert calls == ['subdir']
+    assert lstats == [str(tmpdir)]
+    del lstats[:]
+
+    fobj = directory.files_all[5]
+    assert fobj.size == 0
+    assert lstats == [fobj.path]
+
+    fm.settings.sort = 'size'
+    directory.sort()
+    assert len(lstats) == 20
+
+
+@pytest.mark.parametrize('stat_workers', [1, 4])
+def test_deferred_stats_in_loader(fm, tmpdir, stat_workers):
+    for i in range(300):
+        tmpdir.join('file%d' % i).write('x' * i)
+    tmpdir.mkdir('subdir')
+    fm.settings.stat_workers = stat_workers
+    directory = load_listing(fm, tmpdir)
+    assert directory.disk_usage == 0
+    drawn = directory.files_all[10]
+    size = drawn.size
+
+    # The loader stats the other files after the listing and sums them up
+    for _ in directory.load_generator:
+        pass
+    assert not any(fobj.stat_deferred for fobj in directory.files_all)
+    assert directory.disk_usage == sum(range(300))
+    assert drawn.size == size
+
+
+def test_entries_are_compact(fm, tmpdir):
+    tmpdir.join('file').write('content')
+    fobj = load(fm, tmpdir).files_all[0]
+    assert isinstance(fobj.stat, CompactStat)
+    assert fobj.stat.st_size == os.stat(str(tmpdir.join('file'))).st_size
+    assert 'display_data' not in vars(fobj)
+
+    fobj.display_data['key'] = 'value'
+    fobj.load()
+    assert fobj.display_data == {}
+
+
+@pytest.mark.parametrize('reverse', [False, True])
+def test_sort_directories_first(fm, tmpdir, reverse):
+    touch(tmpdir.join('a1'), tmpdir.join('a10'), tmpdir.join('a9'))
+    tmpdir.mkdir('b2')
+    tmpdir.mkdir('B11')
+    fm.settings.sort = 'natural'
+    fm.settings.sort_case_insensitive = True
+    fm.settings.sort_directories_first = True
+    fm.settings.sort_reverse = reverse
+    names = [fobj.basename for fobj in load(fm, tmpdir).files_all]
+    if reverse:
+        assert names == ['B11', 'b2', 'a10', 'a9', 'a1']
+    else:
+        assert names == ['b2', 'B11', 'a1', 'a9', 'a10']
+
+
+@pytest.mark.skipif(scandir is None, reason="needs os.scandir")
+@pytest.mark.parametrize('reverse', [False, True])
+def test_incremental_reload(fm, tmpdir, reverse):
+    fm.settings.sort = 'natural'
+    fm.settings.sort_directories_first = True
+    fm.settings.sort_reverse = reverse
+    touch(*[tmpdir.join('file%d' % i) for i in range(0, 100, 2)])
+    tmpdir.mkdir('dir5')
+    directory = load(fm, tmpdir)
+    old_objects = dict((fobj.path, fobj) for fobj in directory.files_all)
+    marked = directory.files_all[3]
+    directory.mark_item(marked, True)
+
+    touch(*[tmpdir.join('file%d' % i) for i in range(1, 20, 2)])
+    tmpdir.mkdir('dir1')
+    os.remove(str(tmpdir.join('file10')))
+    load(fm, tmpdir, incremental=True)
+
+    paths = [fobj.path for fobj in directory.files_all]
+    assert str(tmpdir.join('file10')) not in paths
+    for fobj in directory.files_all:
+        if fobj.path in old_objects:
+            assert fobj is old_objects[fobj.path]
+    assert directory.marked_items == [marked]
+
+    directory.sort()
+    assert [fobj.path for fobj in directory.files_all] == paths
+
+
+@pytest.mark.skipif(scandir is None, reason="needs os.scandir")
+def test_incremental_reload_modified_in_place(fm, tmpdir):
+    tmpdir.join('changed').write('old')
+    tmpdir.join('same').write('same')
+    directory = load(fm, tmpdir)
+    changed, same = directory.files_all
+    assert changed.size == 3
+    assert same.size == 4
+
+    with open(str(tmpdir.join('changed')), 'ab') as fobj:
+        fobj.write(b' and new')
+    os.utime(str(tmpdir.join('changed')), (1, 1))
+    load(fm, tmpdir, incremental=True)
+
+    assert directory.files_all[1] is same
+    assert directory.files_all[0].size == 11
+    assert directory.files_all[0].stat.st_mtime == 1
+
+
+def test_unload_least_recently_used(fm, tmpdir):
+    paths = [tmpdir.mkdir('dir%d' % i) for i in range(4)]
+    for path in paths:
+        touch(path.join('file'))
+    directories = [load(fm, path) for path in paths]
+    for i, directory in enumerate(directories):
+        directory.last_used = i
+    directories[0].mark_item(directories[0].files_all[0], True)
+
+    assert fm.unload_directories(max_directories=2) == 2
+    assert directories[0].files_all is not None
+    assert directories[1].files_all is None
+    assert directories[2].files_all is None
+    assert directories[3].files_all is not None
+    assert str(paths[1]) not in fm.directories
@@ -0,0 +1,13 @@
+from __future__ import (absolute_import, division, print_function)
+
+from ranger.container.tags import Tags
+
+
+def test_remove_trees(tmpdir):
+    tags = Tags(str(tmpdir.join('tagged')))
+    tags.add('/a/b', '/a/b/c', '/a/b/c/d', '/a/b.txt', '/a/bc', '/a/x', '/z')
+    tags.remove_trees('/a/b', '/z/')
+    assert sorted(tags.tags) == ['/a/b.txt', '/a/bc', '/a/x', '/z']
+
+    tags.remove_trees('/z')
+    assert sorted(Tags(str(tmpdir.join('tagged'))).tags) == ['/a/b.txt', '/a/bc', '/a/x']
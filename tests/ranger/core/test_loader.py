@@ -0,0 +1,187 @@
+from __future__ import (absolute_import, division, print_function)
+
+import errno
+import os
+
+import pytest
+
+from ranger.container.file import File
+from ranger.core.filter_stack import MimeFilter
+from ranger.core.loader import SMALL_FILE_SIZE, CopyLoader, DeleteLoader
+from ranger.ext import shutil_generatorized as shutil_g
+from ranger.ext.mimetype_service import FILE_BATCH_SIZE
+from ranger.ext.openstruct import OpenStruct
+
+
+def make_tree(path):
+    for i in range(3):
+        subdir = path.mkdir('dir%d' % i)
+        subdir.mkdir('empty')
+        for j in range(10):
+            subdir.join('file%d' % j).write('x' * j)
+    path.join('top').write('content')
+    os.symlink(str(path.join('dir0')), str(path.join('link')))
+
+
+def test_delete_loader(fm, tmpdir):  # pylint: disable=unused-argument
+    make_tree(tmpdir)
+    paths = [str(tmpdir.join(name)) for name in ('dir0', 'dir1', 'dir2', 'top', 'link')]
+    loader = DeleteLoader(paths)
+    for _ in loader.load_generator:
+        pass
+
+    assert tmpdir.listdir() == []
+    assert loader.entries_deleted == loader.entries_total == 3 * 12 + 2
+    # The size of a symlink is the length of its target
+    assert loader.bytes_deleted == 3 * 45 + len('content') + len(str(tmpdir.join('dir0')))
+    assert loader.percent == 100
+
+
+def test_delete_loader_cancel(fm, tmpdir):  # pylint: disable=unused-argument
+    make_tree(tmpdir)
+    loader = DeleteLoader([str(tmpdir.join('dir0'))])
+    for _ in range(20):
+        next(loader.load_generator)
+    loader.destroy()
+
+    assert 0 < loader.entries_deleted < loader.entries_total
+    assert 0 < loader.percent < 100
+    assert tmpdir.join('dir0').check(dir=True)
+
+
+@pytest.mark.usefixtures('fm')
+def test_delete_loader_new_entries(tmpdir):
+    make_tree(tmpdir)
+    loader = DeleteLoader([str(tmpdir.join('dir0'))])
+    while loader.entries_total < 12:
+        next(loader.load_generator)
+    tmpdir.join('dir0', 'empty', 'new').write('')
+    for _ in loader.load_generator:
+        assert loader.percent <= 100
+
+    assert not tmpdir.join('dir0').check()
+    assert loader.entries_deleted == loader.entries_total == 13
+    assert loader.percent == 100
+
+
+@pytest.mark.parametrize('method', shutil_g.COPY_METHODS)
+def test_copyfd(tmpdir, method):
+    data = os.urandom(3 * shutil_g.FIRST_CHUNK_SIZE + 123)
+    tmpdir.join('src').write_binary(data)
+    with open(str(tmpdir.join('src')), 'rb') as fsrc:
+        with open(str(tmpdir.join('dst')), 'wb') as fdst:
+            progress = list(shutil_g.copyfd(fsrc.fileno(), fdst.fileno(), methods=(method,)))
+    assert tmpdir.join('dst').read_binary() == data
+    assert progress == sorted(progress)
+    assert progress[-1] == len(data)
+
+
+@pytest.mark.usefixtures('fm')
+def test_copy_loader(tmpdir):
+    data = os.urandom(5 * shutil_g.FIRST_CHUNK_SIZE)
+    tmpdir.join('src').write_binary(data)
+    dest = tmpdir.mkdir('dest')
+    loader = CopyLoader([File(str(tmpdir.join('src')))], dest=str(dest))
+    percents = [loader.percent for _ in loader.load_generator]
+    assert dest.join('src').read_binary() == data
+    assert percents == sorted(percents)
+    assert percents[-1] == 100
+
+
+def test_copy_loader_parallel(fm, tmpdir):
+    fm.settings.copy_workers = 4
+    src = tmpdir.mkdir('src')
+    make_tree(src)
+    data = os.urandom(shutil_g.FIRST_CHUNK_SIZE + SMALL_FILE_SIZE)
+    src.join('big').write_binary(data)
+    dest = tmpdir.mkdir('dest')
+    loader = CopyLoader([File(str(src))], dest=str(dest))
+    percents = [loader.percent for _ in loader.load_generator]
+
+    for i in range(3):
+        for j in range(10):
+            assert dest.join('src', 'dir%d' % i, 'file%d' % j).read() == 'x' * j
+        assert dest.join('src', 'dir%d' % i, 'empty').check(dir=True)
+    assert dest.join('src', 'big').read_binary() == data
+    assert dest.join('src', 'link').readlink() == str(src.join('dir0'))
+    assert percents == sorted(percents)
+    assert percents[-1] == 100
+
+
+def test_move_loader_parallel(fm, tmpdir):
+    fm.settings.copy_workers = 4
+    fm.tags = OpenStruct(tags={})
+    src = tmpdir.mkdir('src')
+    make_tree(src)
+    dest = tmpdir.mkdir('dest')
+    paths = [src.join(name) for name in ('dir0', 'top', 'dir1')]
+    loader = CopyLoader([File(str(path)) for path in paths], do_cut=True, dest=str(dest))
+    percents = [loader.percent for _ in loader.load_generator]
+
+    assert sorted(path.basename for path in dest.listdir()) == ['dir0', 'dir1', 'top']
+    assert not any(path.check() for path in paths)
+    assert percents == sorted(percents)
+    assert percents[-1] == 100
+
+
+def test_copy_loader_same_basename(fm, tmpdir):
+    fm.settings.copy_workers = 4
+    paths = []
+    for i in range(3):
+        path = tmpdir.mkdir('src%d' % i).join('file')
+        path.write('content%d' % i)
+        paths.append(path)
+    dest = tmpdir.mkdir('dest')
+    dest.join('file').write('old')
+    loader = CopyLoader([File(str(path)) for path in paths], dest=str(dest))
+    for _ in loader.load_generator:
+        pass
+
+    assert sorted(path.read() for path in dest.listdir()) == \
+        ['content0', 'content1', 'content2', 'old']
+
+
+def test_move_loader_rename_error(fm, tmpdir, monkeypatch):
+    fm.settings.copy_workers = 4
+    fm.tags = OpenStruct(tags={})
+    notified = []
+    fm.notify = lambda text, bad=False: notified.append(text)
+    src = tmpdir.mkdir('src')
+    make_tree(src)
+    dest = tmpdir.mkdir('dest')
+
+    def rename(src, dst):
+        raise OSError(errno.EACCES, 'Permission denied', dst)
+    monkeypatch.setattr(os, 'rename', rename)
+    loader = CopyLoader([File(str(src.join('dir0')))], do_cut=True, dest=str(dest))
+    for _ in loader.load_generator:
+        pass
+
+    # Only a move across file systems falls back to copying
+    assert src.join('dir0').check(dir=True)
+    assert dest.listdir() == []
+    assert len(notified) == 1
+
+
+def test_mime_filter_loader(fm, tmpdir):
+    for i in range(FILE_BATCH_SIZE + 1):
+        tmpdir.join('image%d' % i).write_binary(b'\x89PNG\r\n\x1a\n')
+    files = [File(str(path)) for path in sorted(tmpdir.listdir())]
+    refilters = []
+    fm.directories[str(tmpdir)] = OpenStruct(
+        files_all=files, refilter=lambda: refilters.append(True))
+    added = []
+    fm.loader = OpenStruct(add=added.append)
+
+    # Unknown files are left to the loader, all of the directory at once
+    mime_filter = MimeFilter('^image/')
+    assert not any(mime_filter(fobj) for fobj in files)
+    assert len(added) == 1
+    loader = added[0]
+    assert sorted(loader.paths) == [fobj.path for fobj in files]
+    percents = [loader.percent for _ in loader.load_generator]
+
+    assert percents == [100 * FILE_BATCH_SIZE / len(files), 100]
+    assert refilters == [True]
+    assert all(mime_filter(fobj) for fobj in files)
+    assert len(added) == 1
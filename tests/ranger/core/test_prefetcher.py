@@ -0,0 +1,70 @@
+from __future__ import (absolute_import, division, print_function)
+
+import os
+
+import pytest
+
+from ranger.container.file import File
+from ranger.core.prefetcher import PreviewPrefetcher
+from ranger.core.preview_executor import PreviewExecutor
+from ranger.ext.openstruct import OpenStruct
+
+
+@pytest.fixture(name='fm')
+def fixture_fm(fm, tmpdir):
+    fm.settings.preview_files = True
+    fm.settings.preview_max_size = 0
+    fm.settings.preview_script = '/bin/true'
+    fm.settings.use_preview_script = True
+    fm.settings.preview_prefetch = 2
+    fm.settings.preview_prefetch_workers = 2
+
+    files = []
+    for i in range(8):
+        tmpdir.join('file%d' % i).write('content')
+        fobj = File(str(tmpdir.join('file%d' % i)))
+        fobj.load()
+        files.append(fobj)
+    fm.thistab = OpenStruct(thisdir=OpenStruct(files=files, pointer=0))
+    # Without workers, the jobs stay in the queue
+    fm.preview_executor = PreviewExecutor(workers=0)
+
+    def get_preview(fobj, width, height, prefetch=False):  # pylint: disable=unused-argument
+        return fm.preview_executor.submit(fobj.realpath, ['true'], lambda job: None,
+                                          focused=not prefetch)
+    fm.get_preview = get_preview
+    return fm
+
+
+def queued(fm):
+    return [os.path.basename(job.key) + (' (focused)' if job.focused else '')
+            for job in fm.preview_executor.queue]
+
+
+def focus(fm, prefetcher, index):
+    fm.thisdir.pointer = index
+    fobj = fm.thisdir.files[index]
+    fm.signal_emit('move', previous=None, new=fobj, tab=fm.thistab)
+    prefetcher.prefetch(fobj, 80, 24)
+
+
+def test_prefetcher(fm):
+    prefetcher = PreviewPrefetcher()
+    focus(fm, prefetcher, 3)
+    assert queued(fm) == ['file4', 'file2']
+
+    # Moving down prefetches the files below, the other prefetches are
+    # cancelled and the one of the focused file is moved to the front
+    focus(fm, prefetcher, 4)
+    assert queued(fm) == ['file4 (focused)', 'file5', 'file6']
+    assert sorted(prefetcher.jobs) == [fm.thisdir.files[5].realpath,
+                                       fm.thisdir.files[6].realpath]
+
+    # Finished prefetches make room for pending ones
+    fm.settings.preview_prefetch_workers = 1
+    focus(fm, prefetcher, 5)
+    assert queued(fm) == ['file5 (focused)', 'file6']
+    assert list(prefetcher.pending) == [fm.thisdir.files[7]]
+    fm.preview_executor.cancel(prefetcher.jobs[fm.thisdir.files[6].realpath])
+    assert queued(fm) == ['file5 (focused)', 'file7']
+    assert list(prefetcher.jobs) == [fm.thisdir.files[7].realpath]
@@ -0,0 +1,56 @@
+from __future__ import (absolute_import, division, print_function)
+
+import logging
+from time import time
+
+from ranger.core.preview_executor import PreviewExecutor
+from ranger.ext.openstruct import OpenStruct
+
+
+def run(executor, timeout=5):
+    """Work until all jobs are done, returns the numbers of running jobs"""
+    running = []
+    end = time() + timeout
+    while executor.has_work() and time() < end:
+        running.append(len(executor.running))
+        executor.work(timeout=0.05)
+    return running
+
+
+def test_preview_executor(fm, caplog):  # pylint: disable=unused-argument
+    caplog.set_level(logging.DEBUG, logger='ranger.core.preview_executor')
+    executor = PreviewExecutor(workers=2)
+    done = []
+    for i in range(4):
+        executor.submit('file%d' % i, ['sh', '-c', 'sleep 0.3; echo preview %d; exit 5' % i],
+                        done.append)
+    running = run(executor)
+
+    # Two jobs ran at a time
+    assert max(running) == 2
+    assert sorted(job.stdout_buffer for job in done) == \
+        ['preview %d\n' % i for i in range(4)]
+    assert [job.returncode for job in done] == [5] * 4
+    stats = executor.stats()
+    assert stats['completed'] == 4
+    assert stats['max_queue_depth'] == 2
+    assert stats['latency_mean'] >= 0.3
+    # The stats are logged as the previews finish
+    assert "'completed': 4" in caplog.records[-1].getMessage()
+
+
+def test_preview_executor_stale(fm):
+    executor = PreviewExecutor(workers=2)
+    done = []
+    slow = executor.submit('slow', ['sleep', '10'], done.append)
+    prefetch = executor.submit('next', ['sleep', '10'], done.append, focused=False)
+    # One worker is kept free for the focused file
+    assert list(executor.running.values()) == [slow]
+    assert list(executor.queue) == [prefetch]
+
+    # Moving to another file kills the focused job, but not the prefetch
+    fm.signal_emit('move', previous=None, new=OpenStruct(realpath='other'), tab=fm.thistab)
+    assert done == [slow] and slow.cancelled and slow.returncode is not None
+    assert list(executor.running.values()) == [prefetch]
+    assert executor.stats()['cancelled'] == 1
+    executor.destroy()
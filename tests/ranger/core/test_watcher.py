@@ -0,0 +1,40 @@
+from __future__ import (absolute_import, division, print_function)
+
+import pytest
+
+from ranger.core.watcher import DirectoryWatcher
+
+
+@pytest.fixture(name='watcher')
+def fixture_watcher(fm):
+    watcher = DirectoryWatcher()
+    if not watcher.available:
+        pytest.skip("inotify is not available")
+    fm.watcher = watcher
+    yield watcher
+    watcher.close()
+
+
+def test_watcher(fm, watcher, tmpdir):
+    tmpdir.join('log').write('epoch 1\n')
+    directory = fm.get_directory(str(tmpdir))
+    directory.load_content(schedule=False)
+    assert watcher.watch(directory)
+    assert directory.watched
+    assert not directory.load_content_if_outdated()
+
+    tmpdir.join('log').write('epoch 1\nepoch 2\n')
+    assert watcher.poll()
+    assert not directory.content_changed
+    assert directory.files_all[0].size == len('epoch 1\nepoch 2\n')
+
+    tmpdir.join('checkpoint').write('')
+    assert watcher.poll()
+    assert directory.content_changed
+    assert directory.load_content_if_outdated(schedule=False)
+    assert sorted(fobj.basename for fobj in directory.files_all) == ['checkpoint', 'log']
+
+    watcher.unwatch(directory)
+    assert not directory.watched
+    tmpdir.join('other').write('')
+    assert not watcher.poll()
@@ -0,0 +1,53 @@
+from __future__ import (absolute_import, division, print_function)
+
+import os
+
+from ranger.ext import get_executables as module
+from ranger.ext.get_executables import ExecutableIndex
+
+
+def make_executable(path):
+    path.write('#!/bin/sh\n')
+    path.chmod(0o755)
+
+
+def test_executable_index(tmpdir):
+    bin1 = tmpdir.mkdir('bin1')
+    bin2 = tmpdir.mkdir('bin2')
+    make_executable(bin1.join('foo'))
+    make_executable(bin2.join('bar'))
+    paths = [str(bin1), str(bin2), str(tmpdir.join('missing'))]
+    cache = str(tmpdir.join('cache', 'executables.json'))
+
+    index = ExecutableIndex(cache)
+    assert index.update(paths) == set(['foo', 'bar'])
+    assert index.scanned == 2
+    assert index.update(paths) == set(['foo', 'bar'])
+    assert index.scanned == 2
+
+    # Only the changed directory is read again
+    make_executable(bin2.join('baz'))
+    os.utime(str(bin2), (0, 12345))
+    assert index.update(paths) == set(['foo', 'bar', 'baz'])
+    assert index.scanned == 3
+
+    # A new session starts from the saved index
+    index = ExecutableIndex(cache)
+    assert index.update(paths) == set(['foo', 'bar', 'baz'])
+    assert index.scanned == 0
+
+
+def test_get_executables(tmpdir, monkeypatch):
+    bin1 = tmpdir.mkdir('bin1')
+    make_executable(bin1.join('foo'))
+    monkeypatch.setenv('PATH', str(bin1))
+    module.set_index_path(str(tmpdir.join('executables.json')))
+    try:
+        assert module.get_executables() == set(['foo'])
+        assert module.get_executables_uncached() == set(['foo'])
+        bin2 = tmpdir.mkdir('bin2')
+        make_executable(bin2.join('bar'))
+        monkeypatch.setenv('PATH', str(bin1) + ':' + str(bin2))
+        assert module.get_executables() == set(['foo', 'bar'])
+    finally:
+        module.set_index_path(None)
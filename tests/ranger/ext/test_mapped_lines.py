@@ -0,0 +1,70 @@
+from __future__ import (absolute_import, division, print_function)
+
+import random
+
+from ranger.ext import mapped_lines
+from ranger.ext.mapped_lines import MappedLines
+
+
+def test_mapped_lines(tmpdir, monkeypatch):
+    monkeypatch.setattr(mapped_lines, 'BLOCK_SIZE', 64)
+    rand = random.Random(0)
+    for trailing_newline in (False, True):
+        expected = ['line %d %s' % (i, 'x' * rand.randint(0, 100)) for i in range(500)]
+        data = '\n'.join(expected) + ('\n' if trailing_newline else '')
+        tmpdir.join('log').write(data)
+        with open(str(tmpdir.join('log')), 'rb') as fobj:
+            lines = MappedLines(fobj)
+            # Looking at the first lines only indexes the start of the file
+            assert lines[:3] == expected[:3]
+            assert lines.extent(10) == 10
+            assert not lines.indexed
+
+            order = list(range(len(expected)))
+            rand.shuffle(order)
+            for i in order:
+                assert lines[i] == expected[i]
+            assert len(lines) == len(expected)
+            assert lines[-1] == expected[-1]
+            assert lines.extent(10000) == len(expected)
+            assert list(lines) == expected
+            lines.close()
+
+
+def test_mapped_lines_long_line(tmpdir, monkeypatch):
+    monkeypatch.setattr(mapped_lines, 'MAX_LINE_SIZE', 10)
+    tmpdir.join('log').write('short\n' + 'x' * 100 + '\nend')
+    with open(str(tmpdir.join('log')), 'rb') as fobj:
+        lines = MappedLines(fobj)
+        assert list(lines) == ['short', 'x' * 10, 'end']
+        lines.close()
+
+
+def test_mapped_lines_supports(tmpdir):
+    tmpdir.join('empty').write('')
+    with open(str(tmpdir.join('empty')), 'rb') as fobj:
+        assert not MappedLines.supports(fobj)
+    assert not MappedLines.supports('text')
+
+
+def test_mapped_lines_update(tmpdir, monkeypatch):
+    monkeypatch.setattr(mapped_lines, 'BLOCK_SIZE', 64)
+    expected = ['line %d' % i for i in range(20)]
+    tmpdir.join('log').write('\n'.join(expected) + '\npart')
+    with open(str(tmpdir.join('log')), 'rb') as fobj:
+        lines = MappedLines(fobj)
+        assert len(lines) == 21
+        assert lines.update() == 0
+
+        # The last line is continued and the last block was only partly indexed
+        with open(str(tmpdir.join('log')), 'ab') as log:
+            log.write(b'ial\n' + b'\n'.join(b'more %d' % i for i in range(10)))
+        assert lines.update() > 0
+        expected += ['partial'] + ['more %d' % i for i in range(10)]
+        assert len(lines) == len(expected)
+        assert list(lines) == expected
+
+        with open(str(tmpdir.join('log')), 'wb') as log:
+            log.write(b'new\n')
+        assert lines.update() is None
+        lines.close()
@@ -0,0 +1,101 @@
+from __future__ import (absolute_import, division, print_function)
+
+import os
+
+import pytest
+
+from ranger.ext.mimetype_service import MimetypeService
+from ranger.ext.which import which
+
+
+def make_files(tmpdir):
+    tmpdir.join('image').write_binary(b'\x89PNG\r\n\x1a\n' + b'\x00' * 100)
+    tmpdir.join('log').write('line 1\nline 2\n')
+    tmpdir.join('empty').write('')
+    tmpdir.join('model1').write_binary(os.urandom(1000))
+    tmpdir.join('model2').write_binary(b'\x00\x01\x02' * 100)
+    return [str(tmpdir.join(name)) for name in ('image', 'log', 'empty', 'model1', 'model2')]
+
+
+FILE_RESULTS = {'log': 'text/x-log', 'model1': 'application/octet-stream',
+                'model2': 'application/octet-stream'}
+
+
+@pytest.mark.parametrize('data', [
+    b'PK\x03\x04', b'RIFF\x00\x00\x00\x00WEBPVP8 ', b'\x00\x00\x00\x18ftypmp42',
+    b'\x1aE\xdf\xa3', b'OggS\x00\x02', b'ID3\x04\x00', b'\x1f\x8b\x08\x00',
+])
+def test_sniff_leaves_containers_to_file(data):
+    # "file" names these by their content, e.g. an epub or odt for a zip file
+    assert MimetypeService.sniff(data) is None
+
+
+def test_detect_many(tmpdir, monkeypatch):
+    paths = make_files(tmpdir)
+    calls = []
+
+    def run_file(paths):
+        calls.append(paths)
+        return [FILE_RESULTS[os.path.basename(path)] for path in paths]
+    monkeypatch.setattr(MimetypeService, '_run_file', staticmethod(run_file))
+    monkeypatch.setattr(MimetypeService, '_run_mimetype', staticmethod(lambda path: None))
+
+    service = MimetypeService()
+    results = service.detect_many(paths + [str(tmpdir), str(tmpdir.join('missing'))])
+    assert results == {
+        paths[0]: 'image/png',
+        paths[1]: 'text/x-log',
+        paths[2]: 'inode/x-empty',
+        paths[3]: 'application/octet-stream',
+        paths[4]: 'application/octet-stream',
+        str(tmpdir): 'inode/directory',
+        str(tmpdir.join('missing')): None,
+    }
+    # Only the unknown files went to "file", all at once, text included
+    assert calls == [paths[1:2] + paths[3:]]
+
+    # Unchanged files are not examined again
+    assert service.detect(paths[4]) == 'application/octet-stream'
+    assert service.cached(paths[4]) == 'application/octet-stream'
+    assert len(calls) == 1
+
+    # Changed files are
+    tmpdir.join('model2').write_binary(b'\x89PNG\r\n\x1a\n')
+    assert service.cached(paths[4]) is None
+    assert service.detect(paths[4]) == 'image/png'
+
+
+def test_detect_without_file(tmpdir, monkeypatch):
+    paths = make_files(tmpdir)
+    monkeypatch.setattr(MimetypeService, '_run_file',
+                        staticmethod(lambda paths: [None] * len(paths)))
+
+    # Text is recognized by itself only when "file" fails
+    results = MimetypeService().detect_many(paths)
+    assert [results[path] for path in paths] == [
+        'image/png', 'text/plain', 'inode/x-empty', None, None]
+
+
+def test_cache_persists(tmpdir):
+    paths = make_files(tmpdir)
+    cache_path = str(tmpdir.join('cache', 'mimetypes.json'))
+    service = MimetypeService(cache_path=cache_path)
+    service.detect_many(paths[:3])
+    service.save()
+
+    service = MimetypeService(cache_path=cache_path)
+    assert [service.cached(path) for path in paths[:3]] == [
+        'image/png', 'text/plain', 'inode/x-empty']
+
+
+@pytest.mark.skipif(which('file') is None, reason='file is not installed')
+def test_run_file(tmpdir):
+    tmpdir.join('odd\nname').write_binary(b'\x00\x01' * 100)
+    tmpdir.join('script.sh').write('#!/bin/sh\necho hi\n')
+    paths = [str(tmpdir.join('odd\nname')), str(tmpdir.join('script.sh')),
+             str(tmpdir.join('missing'))]
+    # pylint: disable=protected-access
+    mimetypes = MimetypeService._run_file(paths)
+    assert mimetypes[0] is not None
+    assert mimetypes[1].startswith('text/')
+    assert mimetypes[2] is None
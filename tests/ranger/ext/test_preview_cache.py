@@ -0,0 +1,74 @@
+from __future__ import (absolute_import, division, print_function)
+
+import os
+import stat
+
+from ranger.ext.preview_cache import ENTRY_OVERHEAD, PreviewCache
+
+# A preview with a character beyond ASCII
+PREVIEW = b'preview \xe2\x9c\x93'.decode('utf-8')
+
+
+def test_preview_cache_lru():
+    cache = PreviewCache(max_bytes=2 * (ENTRY_OVERHEAD + 100))
+    for path in ('a', 'b'):
+        cache[path] = {'loading': False, (-1, -1): 'x' * 100}
+    assert cache.size == 2 * (ENTRY_OVERHEAD + 100)
+
+    # Using "a" makes "b" the least recently used path
+    assert cache['a'][(-1, -1)] == 'x' * 100
+    cache['c'] = {'loading': False}
+    cache['c'][(80, 24)] = 'y' * 100
+    cache.update_entry('c')
+    assert 'a' in cache and 'c' in cache and 'b' not in cache
+
+    # Paths that are loading stay
+    cache['a']['loading'] = True
+    cache['d'] = {'loading': False, (-1, -1): 'z' * 100}
+    assert 'a' in cache and 'd' in cache and 'c' not in cache
+    del cache['a']
+    assert cache.size == ENTRY_OVERHEAD + 100
+
+
+def test_preview_cache_disk(tmpdir):
+    tmpdir.join('file').write('content')
+    tmpdir.join('scope.sh').write('#!/bin/sh\n')
+    path = str(tmpdir.join('file'))
+    cache = PreviewCache(directory=str(tmpdir.join('previews')))
+    script_hash = cache.script_hash(str(tmpdir.join('scope.sh')),
+                                    os.stat(str(tmpdir.join('scope.sh'))))
+    key = cache.make_key(path, os.stat(path), script_hash, True)
+
+    assert cache.load(key, 80, 24) is None
+    cache.save(key, (-1, 24), PREVIEW)
+    cache.save(key, (80, 24), 'sized')
+
+    # Another session finds the previews of the same size class
+    cache = PreviewCache(directory=str(tmpdir.join('previews')))
+    assert cache.load(key, 120, 24) == ((-1, 24), PREVIEW)
+    assert cache.load(key, 80, 24) == ((-1, 24), PREVIEW)
+    assert cache.load(key, 80, 30) is None
+
+    # A changed file has another key
+    tmpdir.join('file').write('changed content')
+    assert cache.load(cache.make_key(path, os.stat(path), script_hash, True),
+                      120, 24) is None
+
+    cache.clear_disk()
+    assert cache.load(key, 80, 24) is None
+
+
+def test_preview_cache_private(tmpdir):
+    old_umask = os.umask(0o022)
+    try:
+        tmpdir.join('file').write('secret')
+        path = str(tmpdir.join('file'))
+        cache = PreviewCache(directory=str(tmpdir.join('previews')))
+        cache.save(cache.make_key(path, os.stat(path), None, True), (-1, 24), PREVIEW)
+    finally:
+        os.umask(old_umask)
+
+    assert stat.S_IMODE(tmpdir.join('previews').stat().mode) == 0o700
+    files = tmpdir.join('previews').listdir()
+    assert files
+    assert all(stat.S_IMODE(fobj.stat().mode) == 0o600 for fobj in files)
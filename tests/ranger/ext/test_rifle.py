@@ -0,0 +1,59 @@
+from __future__ import (absolute_import, division, print_function)
+
+from ranger.ext.rifle import Rifle
+
+
+CONFIG = """
+ext x?html?, has sh = sh -c browser
+ext txt|md, label editor = sh -c editor
+!ext txt, name ^read = sh -c readme
+name \\.tar\\.gz$, number 5 = sh -c untar
+directory = sh -c browse-dir
+file, flag f = ask
+else = sh -c fallback
+"""
+
+
+def list_commands(tmpdir, path):
+    config = tmpdir.join('rifle.conf')
+    config.write(CONFIG)
+    rifle = Rifle(str(config))
+    rifle.reload_config()
+    return list(rifle.list_commands([str(path)], 'text/plain'))
+
+
+def test_rifle_extensions(tmpdir):
+    tmpdir.join('page.HTML').write('')
+    assert list_commands(tmpdir, tmpdir.join('page.HTML')) == [
+        (0, 'sh -c browser', None, ''),
+        (1, 'ask', None, 'f'),
+        (2, 'sh -c fallback', None, ''),
+    ]
+    tmpdir.join('notes.md').write('')
+    assert list_commands(tmpdir, tmpdir.join('notes.md'))[0] == (0, 'sh -c editor', 'editor', '')
+
+
+def test_rifle_negations_and_numbers(tmpdir):
+    tmpdir.join('readme.tar.gz').write('')
+    assert list_commands(tmpdir, tmpdir.join('readme.tar.gz')) == [
+        (0, 'sh -c readme', None, ''),
+        (5, 'sh -c untar', None, ''),
+        (6, 'ask', None, 'f'),
+        (7, 'sh -c fallback', None, ''),
+    ]
+    # Not a file, so no extension
+    tmpdir.mkdir('dir.txt')
+    assert list_commands(tmpdir, tmpdir.join('dir.txt')) == [
+        (0, 'sh -c browse-dir', None, ''),
+        (1, 'sh -c fallback', None, ''),
+    ]
+
+
+def test_rifle_skip_ask(tmpdir):
+    config = tmpdir.join('rifle.conf')
+    config.write(CONFIG)
+    rifle = Rifle(str(config))
+    rifle.reload_config()
+    # "ask" keeps its number even if it does not apply
+    commands = list(rifle.list_commands([str(tmpdir)], skip_ask=True))
+    assert [count for count, _, _, _ in commands] == [0, 2]
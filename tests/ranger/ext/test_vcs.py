@@ -0,0 +1,302 @@
+from __future__ import (absolute_import, division, print_function)
+
+import os
+import subprocess
+import threading
+import time
+
+import pytest
+
+import ranger
+from ranger.ext.openstruct import OpenStruct
+from ranger.ext.vcs.vcs import GitRoot, VcsRoot, VcsThread
+from ranger.ext.which import which
+
+
+def make_root(status_subpaths):
+    root = VcsRoot.__new__(VcsRoot)
+    root.path = '/repo'
+    root.status_subpaths = status_subpaths
+    index = root._index_status_subpaths  # pylint: disable=protected-access
+    root.status_directories = index(status_subpaths)
+    return root
+
+
+def scan_status(root, relpath):
+    """The status of a directory as found by scanning all subpaths"""
+    statuses = set(status for subpath, status in root.status_subpaths.items()
+                   if subpath.startswith(relpath + '/'))
+    for status in root.DIRSTATUSES:
+        if status in statuses:
+            return status
+    return 'sync'
+
+
+STATUS_SUBPATHS = {
+    'a/b/c/changed': 'changed',
+    'a/b/untracked': 'untracked',
+    'a/b/c/d/e/conflict': 'conflict',
+    'a/staged': 'staged',
+    'build': 'ignored',
+    'x/y/ignored': 'ignored',
+    'x/empty': 'none',
+    'z/deleted': 'deleted',
+    'z/staged': 'staged',
+}
+
+
+@pytest.mark.parametrize('relpath', [
+    'a', 'a/b', 'a/b/c', 'a/b/c/d', 'a/b/c/d/e', 'build', 'x', 'x/y', 'z', 'q', 'a/bb',
+])
+def test_status_subpath_directory(relpath):
+    root = make_root(STATUS_SUBPATHS)
+    path = os.path.join(root.path, relpath)
+    expected = STATUS_SUBPATHS.get(relpath, scan_status(root, relpath))
+    assert root.status_subpath(path, is_directory=True) == expected
+
+
+def test_status_subpath_file():
+    root = make_root(STATUS_SUBPATHS)
+    assert root.status_subpath('/repo/a/b/c/changed') == 'changed'
+    assert root.status_subpath('/repo/build/output.o') == 'ignored'
+    assert root.status_subpath('/repo/a/b/c') == 'sync'
+
+
+def git(path, *args):
+    subprocess.check_call(['git', '-c', 'user.name=ranger', '-c', 'user.email=ranger@localhost']
+                          + list(args), cwd=str(path), stdout=subprocess.PIPE)
+
+
+@pytest.fixture(name='repo')
+def fixture_repo(tmpdir):
+    if which('git') is None:
+        pytest.skip('git is not installed')
+    git(tmpdir, 'init', '-q')
+    tmpdir.join('.gitignore').write('build/\n*.o\n')
+    tmpdir.join('changed').write('a')
+    tmpdir.join('deleted').write('b')
+    tmpdir.join('renamed').write('c')
+    tmpdir.mkdir('sub').join('staged').write('d')
+    git(tmpdir, 'add', '-A')
+    git(tmpdir, 'commit', '-q', '-m', 'initial')
+    tmpdir.join('changed').write('aa')
+    tmpdir.join('deleted').remove()
+    git(tmpdir, 'mv', 'renamed', 'moved')
+    tmpdir.join('sub', 'staged').write('dd')
+    git(tmpdir, 'add', 'sub/staged')
+    tmpdir.join('sub', 'untracked with spaces').write('e')
+    tmpdir.join('sub', 'object.o').write('f')
+    tmpdir.mkdir('build').join('output').write('g')
+    return tmpdir
+
+
+def make_git_root(path, **settings):
+    settings.setdefault('vcs_status_cache', False)
+    settings = OpenStruct(settings)
+    for repotype in ('bzr', 'hg', 'svn'):
+        settings['vcs_backend_' + repotype] = 'disabled'
+    settings.vcs_backend_git = 'enabled'
+    dirobj = OpenStruct(path=str(path), realpath=str(path), is_link=False, settings=settings)
+    return GitRoot(dirobj)
+
+
+@pytest.mark.parametrize('ignored', [True, False])
+def test_git_single_status(repo, ignored):
+    single = make_git_root(repo, vcs_git_single_status=True, vcs_git_ignored=ignored)
+    separate = make_git_root(repo, vcs_git_single_status=False, vcs_git_ignored=ignored)
+    statuses, branch, remote, revid = single.data_status()
+
+    assert statuses == separate.data_status_subpaths()
+    assert statuses['changed'] == 'changed'
+    assert statuses['deleted'] == 'deleted'
+    assert statuses['moved'] == 'staged'
+    assert statuses['sub/staged'] == 'staged'
+    assert statuses['sub/untracked with spaces'] == 'untracked'
+    assert ('build' in statuses) == ignored
+    assert ('sub/object.o' in statuses) == ignored
+    assert branch == separate.data_branch()
+    assert remote == 'none'
+    assert revid == separate.data_info()['revid']
+
+
+def test_git_status_cache(repo, tmpdir_factory):
+    ranger.args = OpenStruct(cachedir=str(tmpdir_factory.mktemp('cache')))
+    root = make_git_root(repo, vcs_git_single_status=True, vcs_git_ignored=True,
+                         vcs_status_cache=True)
+    root.obj.fm = OpenStruct(directories={})
+    assert root.update_root()
+
+    cached = make_git_root(repo, vcs_git_single_status=True, vcs_git_ignored=True,
+                           vcs_status_cache=True)
+
+    def run(*args, **kwargs):
+        raise AssertionError('git ran: {0}'.format(args))
+    cached._run = run  # pylint: disable=protected-access
+    # The cache is loaded by the VCS thread, never by a lookup
+    assert cached.status_subpath(str(repo.join('changed'))) == 'none'
+    assert cached.load_status_cache()
+    assert cached.status_subpath(str(repo.join('changed'))) == 'changed'
+    assert cached.status_subpath(str(repo.join('sub')), is_directory=True) == 'untracked'
+    assert cached.head == root.head
+    assert cached.branch == root.branch
+    assert cached.rootinit
+    # The cache is revalidated by the next update
+    assert cached.check_outdated()
+
+    # An unchanged state is not written again
+    cache_path = cached._status_cache_path()  # pylint: disable=protected-access
+    os.remove(cache_path)
+    cached.dump_status_cache()
+    root.dump_status_cache()
+    assert not os.path.exists(cache_path)
+
+    git(repo, 'add', 'changed')
+    stale = make_git_root(repo, vcs_git_single_status=True, vcs_git_ignored=True,
+                          vcs_status_cache=True)
+    assert not stale.load_status_cache()
+    assert stale.status_subpath(str(repo.join('changed'))) == 'none'
+
+
+def touch_later(path):
+    later = time.time() + 10
+    os.utime(str(path), (later, later))
+
+
+def test_git_check_outdated(repo):
+    root = make_git_root(repo, vcs_git_single_status=True, vcs_git_ignored=True)
+    root.obj.fm = OpenStruct(directories={})
+    assert root.check_outdated()
+    assert root.update_root()
+    assert not root.check_outdated()
+    assert not root.check_outdated(walk=True)
+
+    # Changes in directories that are not loaded are only found by walking
+    touch_later(repo.join('sub', 'staged'))
+    assert not root.check_outdated()
+    assert root.check_outdated(walk=True)
+    assert root.update_root()
+
+    # Loaded directories are checked without walking
+    sub = repo.join('sub')
+    root.obj.fm.directories[str(sub)] = OpenStruct(
+        path=str(sub), vcs=OpenStruct(rootvcs=root), files_all=[])
+    touch_later(sub)
+    assert root.check_outdated()
+    assert root.update_root()
+    del root.obj.fm.directories[str(sub)]
+
+    touch_later(repo.join('.git', 'index'))
+    assert root.check_outdated()
+    assert root.update_root()
+
+    git(repo, 'commit', '-q', '-m', 'second')
+    touch_later(repo.join('.git', 'refs', 'heads', root.branch))
+    assert root.check_outdated()
+
+
+class MockRoot(object):  # pylint: disable=too-few-public-methods
+    status_cache_tried = True
+
+    def __init__(self, path, running=None):
+        self.path = path
+        self.outdated = True
+        self.updates = 0
+        # Shared by roots that are updated together, to see how many run at once
+        self.running = running
+
+    def check_outdated(self, walk=False):  # pylint: disable=unused-argument
+        return self.outdated
+
+    def update_root(self):
+        if self.running is not None:
+            self.running.enter()
+        self.updates += 1
+        self.outdated = False
+        return True
+
+    def update_tree(self, purge=False):
+        pass
+
+
+class Running(object):  # pylint: disable=too-few-public-methods
+    """Counts the updates running at once, each waits until all have started"""
+
+    def __init__(self, count):
+        self.count = count
+        self.current = 0
+        self.maximum = 0
+        self._lock = threading.Lock()
+        self._all_started = threading.Event()
+
+    def enter(self):
+        with self._lock:
+            self.current += 1
+            self.maximum = max(self.maximum, self.current)
+            if self.current == self.count:
+                self._all_started.set()
+        self._all_started.wait(5)
+        with self._lock:
+            self.current -= 1
+
+
+def make_dirobj(path, rootvcs):
+    vcs = OpenStruct(reinit=lambda: None, track=True, rootvcs=rootvcs)
+    return OpenStruct(path=path, vcs=vcs, files_all=[], has_vcschild=False)
+
+
+def make_vcs_thread(workers=1):
+    fm = OpenStruct(settings=OpenStruct(vcs_workers=workers))
+    return VcsThread(OpenStruct(browser=OpenStruct(main_column=None), fm=fm))
+
+
+def test_vcs_thread_scheduler():
+    thread = make_vcs_thread()
+    ui = thread._ui  # pylint: disable=protected-access
+    clock = [1000.0]
+    thread.clock = lambda: clock[0]
+    thread.debounce_time = 0.25
+    thread.refresh_interval = 1.5
+    root = MockRoot('/repo')
+    subdir = make_dirobj('/repo/sub', root)
+
+    # Bursts of requests are coalesced and wait for the debounce time
+    for _ in range(3):
+        thread.process(subdir)
+    thread._queue_process()  # pylint: disable=protected-access
+    assert root.updates == 0
+    assert thread.requests_coalesced == 2
+    clock[0] += thread._timeout()  # pylint: disable=protected-access
+    thread._queue_process()  # pylint: disable=protected-access
+    assert root.updates == thread.refreshes_run == 1
+
+    # The current directory is processed right away, up to date roots are skipped
+    ui.fm.thisdir = subdir
+    thread.process(subdir)
+    thread._queue_process()  # pylint: disable=protected-access
+    assert thread.refreshes_skipped == 1
+
+    # An outdated root is not refreshed again before refresh_interval
+    root.outdated = True
+    thread.process(subdir)
+    thread._queue_process()  # pylint: disable=protected-access
+    assert root.updates == 1
+    assert 0 < thread._timeout() <= thread.refresh_interval  # pylint: disable=protected-access
+    clock[0] += thread._timeout()  # pylint: disable=protected-access
+    thread._queue_process()  # pylint: disable=protected-access
+    assert root.updates == thread.refreshes_run == 2
+    assert thread._timeout() is None  # pylint: disable=protected-access
+
+
+def test_vcs_thread_workers():
+    thread = make_vcs_thread(workers=4)
+    thread.debounce_time = 0
+    running = Running(4)
+    roots = [MockRoot('/repo%d' % i, running) for i in range(4)]
+    for root in roots:
+        thread.process(make_dirobj(root.path, root))
+
+    thread._queue_process()  # pylint: disable=protected-access
+    assert running.maximum == 4
+    assert [root.updates for root in roots] == [1, 1, 1, 1]
+    assert thread.refreshes_run == 4
+    thread._pool.shutdown()  # pylint: disable=protected-access